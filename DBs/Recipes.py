@@ -1,19 +1,383 @@
-import sqlite3 as sql
-
-# establish connection to the database
-conn = sql.connect('recipes.db')
-cursor = conn.cursor()
-
-# make necessary tables
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS recipes (
-    id INTEGER PRIMARY KEY,
-    name TEXT,
-    ingredient TEXT,
-    amount TEXT
-)
-''')
-
-# Commit work and close the connection
-conn.commit()
-conn.close()
+import csv
+import json
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+# Words shorter than this are not used as search terms
+MIN_TERM_LENGTH = 2
+
+
+class ReadOnlyConnectionPool:
+    """Small pool of read-only connections shared between handlers"""
+
+    def __init__(self, db_path: str, size: int = 4):
+        """Initialize the pool
+
+        Args:
+            db_path: Path to the database file
+            size: Maximum number of open connections
+        """
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False
+        )
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute("PRAGMA cache_size = -16000")
+        conn.execute("PRAGMA mmap_size = 268435456")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection, opening one if the pool is not full yet
+
+        Yields:
+            A read-only SQLite connection
+        """
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._created < self.size
+                if can_open:
+                    self._created += 1
+            conn = self._open() if can_open else self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            self._created -= 1
+
+
+class RecipeCatalog:
+    """Shared, read-mostly recipe catalog with full-text search"""
+
+    def __init__(self, db_path: str = "recipes.db", pool_size: int = 4):
+        """Initialize the catalog, creating its tables if needed
+
+        Args:
+            db_path: Path to the catalog database
+            pool_size: Number of read-only connections used for searches
+        """
+        self.db_path = db_path
+        self.create_tables()
+        self.pool = ReadOnlyConnectionPool(db_path, pool_size)
+
+    def create_tables(self):
+        """Create the catalog tables and migrate the old flat recipes table"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode = WAL")
+
+        # The first catalog stored one (name, ingredient, amount) row per ingredient
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(recipes)")]
+        legacy = "ingredient" in columns
+        if legacy:
+            cursor.execute("ALTER TABLE recipes RENAME TO recipes_legacy")
+
+        cursor.execute(
+            """
+        CREATE TABLE IF NOT EXISTS recipes (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL
+        )
+        """
+        )
+
+        cursor.execute(
+            """
+        CREATE TABLE IF NOT EXISTS recipe_ingredients (
+            recipe_id INTEGER NOT NULL REFERENCES recipes(id),
+            ingredient TEXT NOT NULL,
+            amount TEXT
+        )
+        """
+        )
+
+        cursor.execute(
+            """
+        CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_recipe
+        ON recipe_ingredients (recipe_id)
+        """
+        )
+
+        # Full-text index over names and ingredient lists (rowid = recipes.id)
+        cursor.execute(
+            """
+        CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(
+            name,
+            ingredients,
+            tokenize = 'porter unicode61'
+        )
+        """
+        )
+
+        conn.commit()
+
+        if legacy:
+            rows = conn.execute(
+                "SELECT name, ingredient, amount FROM recipes_legacy ORDER BY name, id"
+            )
+            self._load(conn, self.group_rows(rows))
+            conn.execute("DROP TABLE recipes_legacy")
+            conn.commit()
+
+        conn.close()
+
+    @staticmethod
+    def group_rows(rows: Iterable[Sequence]) -> Iterator[Tuple[str, List[Tuple[str, str]]]]:
+        """Group consecutive flat (name, ingredient, amount) rows into recipes
+
+        Args:
+            rows: Rows ordered so that each recipe's rows are adjacent
+
+        Yields:
+            Tuples of recipe name and list of (ingredient, amount)
+        """
+        current_name = None
+        ingredients = []
+        for name, ingredient, amount in rows:
+            if name != current_name:
+                if current_name is not None:
+                    yield current_name, ingredients
+                current_name = name
+                ingredients = []
+            if ingredient:
+                ingredients.append((ingredient, amount))
+        if current_name is not None:
+            yield current_name, ingredients
+
+    def _load(
+        self,
+        conn: sqlite3.Connection,
+        recipes: Iterable[Tuple[str, List[Tuple[str, str]]]],
+        batch_size: int = 5000,
+    ) -> int:
+        next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM recipes").fetchone()[0]
+        loaded = 0
+        recipe_rows = []
+        ingredient_rows = []
+        fts_rows = []
+
+        def flush():
+            with conn:
+                conn.executemany("INSERT INTO recipes (id, name) VALUES (?, ?)", recipe_rows)
+                conn.executemany(
+                    "INSERT INTO recipe_ingredients (recipe_id, ingredient, amount) VALUES (?, ?, ?)",
+                    ingredient_rows,
+                )
+                conn.executemany(
+                    "INSERT INTO recipes_fts (rowid, name, ingredients) VALUES (?, ?, ?)",
+                    fts_rows,
+                )
+            recipe_rows.clear()
+            ingredient_rows.clear()
+            fts_rows.clear()
+
+        for name, ingredients in recipes:
+            recipe_id = next_id
+            next_id += 1
+            recipe_rows.append((recipe_id, name))
+            ingredient_rows.extend(
+                (recipe_id, ingredient, amount) for ingredient, amount in ingredients
+            )
+            fts_rows.append(
+                (recipe_id, name, " ".join(ingredient for ingredient, _ in ingredients))
+            )
+            loaded += 1
+            if len(recipe_rows) >= batch_size:
+                flush()
+
+        if recipe_rows:
+            flush()
+        return loaded
+
+    def bulk_load(
+        self,
+        recipes: Iterable[Tuple[str, List[Tuple[str, str]]]],
+        batch_size: int = 5000,
+    ) -> int:
+        """Load a large number of recipes in batched transactions
+
+        Durability is relaxed for the duration of the load and the
+        full-text index is merged into a single segment afterwards.
+
+        Args:
+            recipes: Iterable of (name, [(ingredient, amount), ...])
+            batch_size: Number of recipes per transaction
+
+        Returns:
+            Number of recipes loaded
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("PRAGMA cache_size = -64000")
+            loaded = self._load(conn, recipes, batch_size)
+            conn.execute("INSERT INTO recipes_fts (recipes_fts) VALUES ('optimize')")
+            conn.commit()
+            conn.execute("PRAGMA synchronous = FULL")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        return loaded
+
+    def load_file(self, file_path: str, batch_size: int = 5000) -> int:
+        """Load a recipe dump from disk
+
+        Two formats are accepted: JSON lines with ``name`` and
+        ``ingredients`` (list of ``{"ingredient", "amount"}`` objects) or
+        a CSV with ``name,ingredient,amount`` columns where the rows of a
+        recipe are adjacent.
+
+        Args:
+            file_path: Path to a .jsonl/.ndjson or .csv dump
+            batch_size: Number of recipes per transaction
+
+        Returns:
+            Number of recipes loaded
+        """
+        with open(file_path, "r", encoding="utf-8", newline="") as dump:
+            if file_path.endswith((".jsonl", ".ndjson")):
+                recipes = (
+                    (
+                        record["name"],
+                        [
+                            (ingredient["ingredient"], ingredient.get("amount"))
+                            for ingredient in record.get("ingredients", [])
+                        ],
+                    )
+                    for record in map(json.loads, filter(str.strip, dump))
+                )
+            else:
+                rows = (
+                    (row["name"], row.get("ingredient"), row.get("amount"))
+                    for row in csv.DictReader(dump)
+                )
+                recipes = self.group_rows(rows)
+            return self.bulk_load(recipes, batch_size)
+
+    @staticmethod
+    def build_match_query(terms: Iterable[str], column: Optional[str] = None) -> Optional[str]:
+        """Build an FTS5 MATCH expression that matches any of the given terms
+
+        Args:
+            terms: Free-form words or item names
+            column: Restrict matching to this FTS column
+
+        Returns:
+            MATCH expression, or None if no usable term remains
+        """
+        words = []
+        seen = set()
+        for term in terms:
+            for word in re.findall(r"\w+", term.lower()):
+                if len(word) >= MIN_TERM_LENGTH and word not in seen:
+                    seen.add(word)
+                    words.append(f'"{word}"')
+        if not words:
+            return None
+        expression = " OR ".join(words)
+        if column:
+            return f"{column} : ({expression})"
+        return expression
+
+    def search(self, text: str, limit: int = 10) -> List[Tuple[int, str]]:
+        """Search recipe names and ingredients
+
+        Args:
+            text: Search text
+            limit: Maximum number of results
+
+        Returns:
+            List of (recipe_id, name) ordered by relevance
+        """
+        match = self.build_match_query([text])
+        if match is None:
+            return []
+        with self.pool.connection() as conn:
+            return conn.execute(
+                """
+            SELECT rowid, name
+            FROM recipes_fts
+            WHERE recipes_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+            """,
+                (match, limit),
+            ).fetchall()
+
+    def suggest_for_ingredients(self, item_names: Iterable[str], limit: int = 5) -> List[Dict]:
+        """Suggest recipes that use the given ingredients (e.g. fridge contents)
+
+        Args:
+            item_names: Names of available ingredients
+            limit: Maximum number of suggestions
+
+        Returns:
+            List of dictionaries with recipe id, name and ingredients,
+            ordered by relevance
+        """
+        match = self.build_match_query(item_names, column="ingredients")
+        if match is None:
+            return []
+        with self.pool.connection() as conn:
+            matches = conn.execute(
+                """
+            SELECT rowid, name
+            FROM recipes_fts
+            WHERE recipes_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+            """,
+                (match, limit),
+            ).fetchall()
+            if not matches:
+                return []
+
+            ids = [recipe_id for recipe_id, _ in matches]
+            placeholders = ",".join("?" * len(ids))
+            ingredients = {recipe_id: [] for recipe_id in ids}
+            for recipe_id, ingredient, amount in conn.execute(
+                f"""
+            SELECT recipe_id, ingredient, amount
+            FROM recipe_ingredients
+            WHERE recipe_id IN ({placeholders})
+            """,
+                ids,
+            ):
+                ingredients[recipe_id].append((ingredient, amount))
+
+        return [
+            {"id": recipe_id, "name": name, "ingredients": ingredients[recipe_id]}
+            for recipe_id, name in matches
+        ]
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: python Recipes.py [dump.jsonl|dump.csv ...]
+    catalog = RecipeCatalog()
+    for dump_path in sys.argv[1:]:
+        count = catalog.load_file(dump_path)
+        print(f"Loaded {count} recipes from {dump_path}")
@@ -0,0 +1,464 @@
+import json
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from cold_storage import ColdStorage
+from eco_score import normalize_ingredient_name
+
+
+# Items expiring within this many days count as "expiring"
+EXPIRING_WITHIN_DAYS = 3
+# Number of ingredients kept in the "most common" list of a summary
+TOP_INGREDIENTS = 20
+
+
+def folder_signature(folder_path: str) -> str:
+    """Build a change signature from the database files of a user folder
+
+    Args:
+        folder_path: Path to a ``user_<id>`` folder
+
+    Returns:
+        Signature string that changes whenever a database file changes
+    """
+    count = 0
+    total_size = 0
+    latest_mtime = 0.0
+    for entry in os.scandir(folder_path):
+        if entry.name.endswith((".db", ".db-wal")):
+            stat = entry.stat()
+            count += 1
+            total_size += stat.st_size
+            latest_mtime = max(latest_mtime, stat.st_mtime)
+    return f"{count}:{total_size}:{latest_mtime:.6f}"
+
+
+def archive_signature(archive_path: str) -> str:
+    """Build a change signature from a cold storage archive
+
+    Args:
+        archive_path: Path to a ``user_<id>.tar.gz`` archive
+
+    Returns:
+        Signature string that changes whenever the user is archived again
+        (and never matches a folder signature)
+    """
+    stat = os.stat(archive_path)
+    return f"archived:{stat.st_size}:{stat.st_mtime:.6f}"
+
+
+def _connect_read_only(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=1.0)
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def scan_user(folder_path: str) -> Dict:
+    """Collect the statistics of one user (runs in a worker process)
+
+    Every database is opened read-only and read with a single query, so
+    the shared lock is held only for the duration of that query.
+
+    Args:
+        folder_path: Path to a ``user_<id>`` folder
+
+    Returns:
+        Dictionary with the folder name, signature, counts, expiry
+        histogram and ingredient counts
+    """
+    stats = {
+        "user_folder": os.path.basename(folder_path),
+        "signature": folder_signature(folder_path),
+        "fridge_items": 0,
+        "cuisines": 0,
+        "expiry_dates": Counter(),
+        "ingredients": Counter(),
+        "errors": 0,
+    }
+
+    fridge_path = os.path.join(folder_path, "refrigerator.db")
+    if os.path.exists(fridge_path):
+        try:
+            conn = _connect_read_only(fridge_path)
+            try:
+                rows = conn.execute(
+                    "SELECT item_name, expiry_date FROM refrigerator_items"
+                ).fetchall()
+            finally:
+                conn.close()
+            stats["fridge_items"] = len(rows)
+            for item_name, expiry_date in rows:
+                stats["ingredients"][normalize_ingredient_name(item_name)] += 1
+                if expiry_date:
+                    stats["expiry_dates"][str(expiry_date)[:10]] += 1
+        except sqlite3.Error:
+            stats["errors"] += 1
+
+    index_path = os.path.join(folder_path, "cuisines_index.db")
+    if os.path.exists(index_path):
+        try:
+            conn = _connect_read_only(index_path)
+            try:
+                filenames = [
+                    row[0] for row in conn.execute("SELECT cuisine_filename FROM cuisines_index")
+                ]
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            filenames = []
+            stats["errors"] += 1
+        stats["cuisines"] = len(filenames)
+
+        for filename in filenames:
+            cuisine_path = os.path.join(folder_path, filename)
+            if not os.path.exists(cuisine_path):
+                continue
+            try:
+                conn = _connect_read_only(cuisine_path)
+                try:
+                    names = conn.execute("SELECT ingredient_name FROM ingredients").fetchall()
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                stats["errors"] += 1
+                continue
+            for (ingredient_name,) in names:
+                stats["ingredients"][normalize_ingredient_name(ingredient_name)] += 1
+
+    return stats
+
+
+def scan_archive(archive_path: str) -> Dict:
+    """Collect the statistics of a user packed away by cold storage (runs in a worker process)
+
+    The archive is extracted into a temporary folder and scanned like a
+    user folder.
+
+    Args:
+        archive_path: Path to a ``user_<id>.tar.gz`` archive
+
+    Returns:
+        Same dictionary as ``scan_user``, with the signature of the archive
+    """
+    user_folder = os.path.basename(archive_path)[: -len(".tar.gz")]
+    # Taken first, so an archive replaced during the scan is picked up next run
+    signature = archive_signature(archive_path)
+    with tempfile.TemporaryDirectory() as temp_folder:
+        folder_path = os.path.join(temp_folder, user_folder)
+        os.mkdir(folder_path)
+        with tarfile.open(archive_path, "r:gz") as archive:
+            for member in archive:
+                # Archives only ever hold the flat files of one folder
+                if not member.isfile() or os.path.basename(member.name) != member.name:
+                    continue
+                with archive.extractfile(member) as source, open(
+                    os.path.join(folder_path, member.name), "wb"
+                ) as target:
+                    shutil.copyfileobj(source, target)
+        stats = scan_user(folder_path)
+    # A restored folder never matches, so the user is scanned again once they are back
+    stats["signature"] = signature
+    return stats
+
+
+def scan_path(path: str) -> Dict:
+    """Scan a user folder or a cold storage archive (runs in a worker process)
+
+    Args:
+        path: Path to a ``user_<id>`` folder or ``user_<id>.tar.gz`` archive
+
+    Returns:
+        Result of ``scan_user`` or ``scan_archive``
+    """
+    if path.endswith(".tar.gz"):
+        return scan_archive(path)
+    return scan_user(path)
+
+
+class AnalyticsJob:
+    """Incremental cross-user statistics computed with a process pool"""
+
+    def __init__(
+        self,
+        base_folder: str = "user_databases",
+        summary_db_path: str = "analytics.db",
+        workers: Optional[int] = None,
+    ):
+        """Initialize the analytics job
+
+        Args:
+            base_folder: Base folder holding the user databases
+            summary_db_path: Database where per-user and summary results are written
+            workers: Number of worker processes (defaults to the CPU count)
+        """
+        self.base_folder = base_folder
+        self.summary_db_path = summary_db_path
+        self.workers = workers or os.cpu_count() or 1
+        self.create_tables()
+
+    def create_tables(self):
+        """Create the summary database tables"""
+        conn = sqlite3.connect(self.summary_db_path)
+        cursor = conn.cursor()
+
+        # Checkpoint and per-user results (replaced when a user changes)
+        cursor.execute(
+            """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_folder TEXT PRIMARY KEY,
+            signature TEXT NOT NULL,
+            fridge_items INTEGER NOT NULL,
+            cuisines INTEGER NOT NULL,
+            scanned_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+        )
+
+        cursor.execute(
+            """
+        CREATE TABLE IF NOT EXISTS user_ingredients (
+            user_folder TEXT NOT NULL,
+            ingredient TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_folder, ingredient)
+        ) WITHOUT ROWID
+        """
+        )
+
+        cursor.execute(
+            """
+        CREATE TABLE IF NOT EXISTS user_expiry (
+            user_folder TEXT NOT NULL,
+            expiry_date TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_folder, expiry_date)
+        ) WITHOUT ROWID
+        """
+        )
+
+        cursor.execute(
+            """
+        CREATE TABLE IF NOT EXISTS summaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            users INTEGER NOT NULL,
+            avg_fridge_items REAL NOT NULL,
+            avg_cuisines REAL NOT NULL,
+            expiring_items INTEGER NOT NULL,
+            top_ingredients TEXT NOT NULL,
+            scanned_users INTEGER NOT NULL,
+            skipped_users INTEGER NOT NULL,
+            elapsed_seconds REAL NOT NULL,
+            created_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+        )
+
+        conn.commit()
+        conn.close()
+
+    def list_user_folders(self) -> List[str]:
+        """List the user folders under the base folder
+
+        Returns:
+            Sorted list of folder names (``user_<id>``)
+        """
+        if not os.path.exists(self.base_folder):
+            return []
+        return sorted(
+            entry.name
+            for entry in os.scandir(self.base_folder)
+            if entry.is_dir() and entry.name.startswith("user_")
+        )
+
+    def list_archived_users(self) -> List[str]:
+        """List the users that only exist as cold storage archives
+
+        Returns:
+            Sorted list of folder names (``user_<id>``) of the archives
+        """
+        archive_folder = os.path.join(self.base_folder, ColdStorage.ARCHIVE_FOLDER_NAME)
+        if not os.path.isdir(archive_folder):
+            return []
+        return sorted(
+            entry.name[: -len(".tar.gz")]
+            for entry in os.scandir(archive_folder)
+            if entry.name.startswith("user_") and entry.name.endswith(".tar.gz")
+        )
+
+    def get_scan_path(self, user_folder: str) -> str:
+        """Get the path to scan for a user: their folder, or their archive while archived
+
+        Args:
+            user_folder: Folder name (``user_<id>``)
+
+        Returns:
+            Path for ``scan_path``
+        """
+        folder_path = os.path.join(self.base_folder, user_folder)
+        if os.path.isdir(folder_path):
+            return folder_path
+        return os.path.join(self.base_folder, ColdStorage.ARCHIVE_FOLDER_NAME, f"{user_folder}.tar.gz")
+
+    def find_changed_users(self, conn: sqlite3.Connection) -> Tuple[List[str], List[str], int]:
+        """Compare the user folders with the persisted checkpoint
+
+        Archived users are compared by the size and modification time of
+        their archive, so they keep their checkpointed results until they
+        are restored or archived again.
+
+        Args:
+            conn: Connection to the summary database
+
+        Returns:
+            Tuple of (changed folders, removed folders, unchanged count)
+        """
+        checkpoint = dict(conn.execute("SELECT user_folder, signature FROM user_stats"))
+        changed = []
+        unchanged = 0
+        folders = self.list_user_folders()
+        for user_folder in folders:
+            signature = folder_signature(os.path.join(self.base_folder, user_folder))
+            if checkpoint.get(user_folder) == signature:
+                unchanged += 1
+            else:
+                changed.append(user_folder)
+        archived = [user_folder for user_folder in self.list_archived_users() if user_folder not in folders]
+        for user_folder in archived:
+            signature = archive_signature(self.get_scan_path(user_folder))
+            if checkpoint.get(user_folder) == signature:
+                unchanged += 1
+            else:
+                changed.append(user_folder)
+        removed = sorted(set(checkpoint) - set(folders) - set(archived))
+        return changed, removed, unchanged
+
+    @staticmethod
+    def _replace_user(conn: sqlite3.Connection, stats: Dict):
+        user_folder = stats["user_folder"]
+        conn.execute("DELETE FROM user_ingredients WHERE user_folder = ?", (user_folder,))
+        conn.execute("DELETE FROM user_expiry WHERE user_folder = ?", (user_folder,))
+        conn.execute(
+            """
+        INSERT OR REPLACE INTO user_stats (user_folder, signature, fridge_items, cuisines)
+        VALUES (?, ?, ?, ?)
+        """,
+            (user_folder, stats["signature"], stats["fridge_items"], stats["cuisines"]),
+        )
+        conn.executemany(
+            "INSERT INTO user_ingredients (user_folder, ingredient, count) VALUES (?, ?, ?)",
+            [(user_folder, name, count) for name, count in stats["ingredients"].items() if name],
+        )
+        conn.executemany(
+            "INSERT INTO user_expiry (user_folder, expiry_date, count) VALUES (?, ?, ?)",
+            [(user_folder, expiry, count) for expiry, count in stats["expiry_dates"].items()],
+        )
+
+    def summarize(self, conn: sqlite3.Connection, today: Optional[date] = None) -> Dict:
+        """Aggregate the per-user results
+
+        Args:
+            conn: Connection to the summary database
+            today: Reference day for expiring items (defaults to today)
+
+        Returns:
+            Dictionary with users, averages, expiring items and top ingredients
+        """
+        today = today or date.today()
+        users, avg_fridge_items, avg_cuisines = conn.execute(
+            "SELECT COUNT(*), COALESCE(AVG(fridge_items), 0), COALESCE(AVG(cuisines), 0) FROM user_stats"
+        ).fetchone()
+        expiring_items = conn.execute(
+            "SELECT COALESCE(SUM(count), 0) FROM user_expiry WHERE expiry_date BETWEEN ? AND ?",
+            (today.isoformat(), (today + timedelta(days=EXPIRING_WITHIN_DAYS)).isoformat()),
+        ).fetchone()[0]
+        top_ingredients = conn.execute(
+            """
+        SELECT ingredient, SUM(count) AS total
+        FROM user_ingredients
+        GROUP BY ingredient
+        ORDER BY total DESC
+        LIMIT ?
+        """,
+            (TOP_INGREDIENTS,),
+        ).fetchall()
+        return {
+            "users": users,
+            "avg_fridge_items": avg_fridge_items,
+            "avg_cuisines": avg_cuisines,
+            "expiring_items": expiring_items,
+            "top_ingredients": top_ingredients,
+        }
+
+    def run(self) -> Dict:
+        """Scan changed users in parallel and write a new summary
+
+        Returns:
+            The summary (see ``summarize``) plus scanned/skipped counts
+        """
+        started = datetime.now()
+        conn = sqlite3.connect(self.summary_db_path)
+        try:
+            changed, removed, unchanged = self.find_changed_users(conn)
+            paths = [self.get_scan_path(user_folder) for user_folder in changed]
+
+            if paths:
+                chunksize = max(len(paths) // (self.workers * 4), 1)
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    for stats in executor.map(scan_path, paths, chunksize=chunksize):
+                        self._replace_user(conn, stats)
+            for user_folder in removed:
+                for table in ("user_stats", "user_ingredients", "user_expiry"):
+                    conn.execute(f"DELETE FROM {table} WHERE user_folder = ?", (user_folder,))
+
+            summary = self.summarize(conn)
+            summary["scanned_users"] = len(changed)
+            summary["skipped_users"] = unchanged
+            summary["elapsed_seconds"] = (datetime.now() - started).total_seconds()
+            conn.execute(
+                """
+            INSERT INTO summaries (users, avg_fridge_items, avg_cuisines, expiring_items,
+                                   top_ingredients, scanned_users, skipped_users, elapsed_seconds)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                (
+                    summary["users"],
+                    summary["avg_fridge_items"],
+                    summary["avg_cuisines"],
+                    summary["expiring_items"],
+                    json.dumps(summary["top_ingredients"]),
+                    summary["scanned_users"],
+                    summary["skipped_users"],
+                    summary["elapsed_seconds"],
+                ),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return summary
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: python analytics.py [base_folder] [summary_db] [workers]
+    job = AnalyticsJob(
+        sys.argv[1] if len(sys.argv) > 1 else "user_databases",
+        sys.argv[2] if len(sys.argv) > 2 else "analytics.db",
+        int(sys.argv[3]) if len(sys.argv) > 3 else None,
+    )
+    result = job.run()
+    print(
+        f"Users: {result['users']} ({result['scanned_users']} scanned, "
+        f"{result['skipped_users']} unchanged) in {result['elapsed_seconds']:.2f}s"
+    )
+    print(f"Average fridge size: {result['avg_fridge_items']:.1f}")
+    print(f"Average cuisines per user: {result['avg_cuisines']:.1f}")
+    print(f"Items expiring within {EXPIRING_WITHIN_DAYS} days: {result['expiring_items']}")
+    print("Most common ingredients: " + ", ".join(name for name, _ in result["top_ingredients"]))
@@ -0,0 +1,315 @@
+import json
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+class BackupService:
+    """Online incremental backups of all user databases
+
+    Every database is copied with the SQLite online backup API a few pages
+    at a time, so handlers keep reading and writing while a snapshot is
+    taken. Files that did not change since the last run are skipped and
+    the snapshots of each user are packed into one compressed archive.
+    """
+
+    MANIFEST_NAME = "manifest.json"
+
+    def __init__(
+        self,
+        base_folder: str = "user_databases",
+        backup_folder: str = "backups",
+        pages_per_step: int = 64,
+        step_sleep: float = 0.005,
+    ):
+        """Initialize the backup service
+
+        Args:
+            base_folder: Base folder holding the user databases
+            backup_folder: Folder where archives and the manifest are written
+            pages_per_step: Pages copied per backup step (smaller = shorter lock)
+            step_sleep: Seconds to yield to other connections between steps
+        """
+        self.base_folder = base_folder
+        self.backup_folder = backup_folder
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        if not os.path.exists(self.backup_folder):
+            os.makedirs(self.backup_folder)
+
+    def get_manifest_path(self) -> str:
+        """Get the path of the manifest recording the last backed up state
+
+        Returns:
+            Path to the manifest file
+        """
+        return os.path.join(self.backup_folder, self.MANIFEST_NAME)
+
+    def load_manifest(self) -> Dict[str, Dict]:
+        """Load the state recorded by the previous run
+
+        Returns:
+            Mapping of database path (relative to base folder) to its state
+        """
+        manifest_path = self.get_manifest_path()
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+
+    def save_manifest(self, manifest: Dict[str, Dict]):
+        """Atomically persist the manifest
+
+        Args:
+            manifest: Mapping of database path to its state
+        """
+        manifest_path = self.get_manifest_path()
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(tmp_path, manifest_path)
+
+    @staticmethod
+    def read_change_counter(db_path: str) -> Optional[int]:
+        """Read the file change counter from a SQLite database header
+
+        ``PRAGMA data_version`` only changes within the lifetime of one
+        connection, so the persistent change counter stored at offset 24
+        of the header is used to detect commits between runs.
+
+        Args:
+            db_path: Path to the database file
+
+        Returns:
+            The change counter, or None if the header cannot be read
+        """
+        try:
+            with open(db_path, "rb") as db_file:
+                header = db_file.read(28)
+        except OSError:
+            return None
+        if len(header) < 28 or not header.startswith(b"SQLite format 3\x00"):
+            return None
+        return int.from_bytes(header[24:28], "big")
+
+    def get_file_state(self, db_path: str) -> Dict:
+        """Get the change-detection state of a database file
+
+        Args:
+            db_path: Path to the database file
+
+        Returns:
+            Dictionary with mtime, size and change counter
+        """
+        stat = os.stat(db_path)
+        # A WAL file holds commits that have not reached the main file yet
+        wal_path = db_path + "-wal"
+        wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        return {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "wal_size": wal_size,
+            "change_counter": self.read_change_counter(db_path),
+        }
+
+    def iter_user_folders(self) -> List[str]:
+        """List the user folders under the base folder
+
+        Returns:
+            Sorted list of folder names (``user_<id>``)
+        """
+        if not os.path.exists(self.base_folder):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.base_folder)
+            if name.startswith("user_")
+            and os.path.isdir(os.path.join(self.base_folder, name))
+        )
+
+    def snapshot_database(self, db_path: str, target_path: str, stats: Dict):
+        """Copy one database with the online backup API in small steps
+
+        Args:
+            db_path: Path to the live database
+            target_path: Path of the snapshot to write
+            stats: Run statistics updated with pages copied and step timings
+        """
+        source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        target = sqlite3.connect(target_path)
+        last_step = [time.perf_counter()]
+
+        def progress(status, remaining, total):
+            now = time.perf_counter()
+            # Time spent holding the source lock, without the sleep between steps
+            step_time = max(now - last_step[0] - self.step_sleep, 0.0)
+            stats["max_step_seconds"] = max(stats["max_step_seconds"], step_time)
+            stats["total_step_seconds"] += step_time
+            stats["steps"] += 1
+            last_step[0] = now
+
+        try:
+            source.backup(
+                target,
+                pages=self.pages_per_step,
+                progress=progress,
+                sleep=self.step_sleep,
+            )
+            stats["pages"] += target.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            target.close()
+            source.close()
+
+    def backup_user(self, user_folder: str, manifest: Dict[str, Dict], stats: Dict) -> Optional[str]:
+        """Back up the changed databases of one user into a compressed archive
+
+        Args:
+            user_folder: Name of the user folder (``user_<id>``)
+            manifest: Manifest of the previous run, updated in place
+            stats: Run statistics updated in place
+
+        Returns:
+            Path of the written archive, or None if nothing changed
+        """
+        folder_path = os.path.join(self.base_folder, user_folder)
+        changed = []
+        for filename in sorted(os.listdir(folder_path)):
+            if not filename.endswith(".db"):
+                continue
+            db_path = os.path.join(folder_path, filename)
+            key = f"{user_folder}/{filename}"
+            state = self.get_file_state(db_path)
+            if manifest.get(key) == state:
+                stats["skipped_files"] += 1
+                continue
+            changed.append((filename, db_path, key, state))
+
+        if not changed:
+            return None
+
+        archive_folder = os.path.join(self.backup_folder, user_folder)
+        if not os.path.exists(archive_folder):
+            os.makedirs(archive_folder)
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        archive_path = os.path.join(archive_folder, f"{timestamp}.tar.gz")
+
+        tmp_path = archive_path + ".tmp"
+        snapshot_dir = tempfile.mkdtemp(prefix="backup_")
+        # Only recorded in the manifest once the archive holding them is in place
+        archived_states = {}
+        try:
+            with tarfile.open(tmp_path, "w:gz") as archive:
+                for filename, db_path, key, state in changed:
+                    snapshot_path = os.path.join(snapshot_dir, filename)
+                    self.snapshot_database(db_path, snapshot_path, stats)
+                    stats["bytes"] += os.path.getsize(snapshot_path)
+                    archive.add(snapshot_path, arcname=filename)
+                    os.remove(snapshot_path)
+                    archived_states[key] = state
+            os.replace(tmp_path, archive_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+        manifest.update(archived_states)
+        stats["backed_up_files"] += len(archived_states)
+        return archive_path
+
+    def run_once(self) -> Dict:
+        """Back up every user whose databases changed since the last run
+
+        Returns:
+            Statistics: files backed up and skipped, bytes and pages copied,
+            throughput and the longest/average pause imposed on writers
+        """
+        stats = {
+            "users": 0,
+            "archives": 0,
+            "backed_up_files": 0,
+            "skipped_files": 0,
+            "failed_files": 0,
+            "bytes": 0,
+            "pages": 0,
+            "steps": 0,
+            "max_step_seconds": 0.0,
+            "total_step_seconds": 0.0,
+        }
+        manifest = self.load_manifest()
+        started = time.perf_counter()
+
+        for user_folder in self.iter_user_folders():
+            if self._stop_event.is_set():
+                break
+            stats["users"] += 1
+            try:
+                if self.backup_user(user_folder, manifest, stats):
+                    stats["archives"] += 1
+            except (sqlite3.Error, OSError):
+                # No archive was written, so none of the user's entries changed; the next run retries
+                stats["failed_files"] += 1
+            self.save_manifest(manifest)
+
+        elapsed = time.perf_counter() - started
+        stats["elapsed_seconds"] = elapsed
+        stats["bytes_per_second"] = stats["bytes"] / elapsed if elapsed > 0 else 0.0
+        stats["avg_step_seconds"] = (
+            stats["total_step_seconds"] / stats["steps"] if stats["steps"] else 0.0
+        )
+        return stats
+
+    @staticmethod
+    def format_report(stats: Dict) -> str:
+        """Format run statistics as a one-line report
+
+        Args:
+            stats: Statistics returned by ``run_once``
+
+        Returns:
+            Human readable summary
+        """
+        return (
+            f"Backup: {stats['backed_up_files']} files in {stats['archives']} archives "
+            f"({stats['skipped_files']} unchanged, {stats['failed_files']} failed), "
+            f"{stats['bytes'] / 1024:.1f} KiB in {stats['elapsed_seconds']:.2f}s "
+            f"({stats['bytes_per_second'] / 1024:.1f} KiB/s), "
+            f"max pause {stats['max_step_seconds'] * 1000:.2f} ms, "
+            f"avg pause {stats['avg_step_seconds'] * 1000:.2f} ms"
+        )
+
+    def start(self, interval_seconds: float):
+        """Run backups periodically in a background thread
+
+        Args:
+            interval_seconds: Seconds to wait between the end of one run and the next
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+
+        def loop():
+            while not self._stop_event.is_set():
+                stats = self.run_once()
+                print(self.format_report(stats))
+                self._stop_event.wait(interval_seconds)
+
+        self._thread = threading.Thread(target=loop, name="backup-service", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread after the current user finishes"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
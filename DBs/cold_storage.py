@@ -0,0 +1,466 @@
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from user_registry import UserRegistry
+
+
+class ColdStorage:
+    """Archival of inactive users with transparent restore on access
+
+    Every access through RefrigeratorDB/CuisineDB records the user's
+    activity in a small index database. Users idle for longer than a
+    threshold have their whole folder packed into one compressed archive
+    (one file instead of one per cuisine) and the folder removed. The
+    next access to such a user extracts the archive back into place
+    before the database path is returned, so callers never notice.
+
+    Archiving and restoring both hold the index's write lock, which keeps
+    several bot processes from packing and restoring the same user at
+    the same time. Activity writes that let a user through are made under
+    the same lock, and between them the last write is never older than
+    ``touch_interval``, so the archiver (which re-checks activity under the
+    lock and only archives users idle for longer) can't pack a folder a
+    handler is about to open.
+    """
+
+    INDEX_NAME = "activity_index.db"
+    ARCHIVE_FOLDER_NAME = "archive"
+
+    def __init__(
+        self,
+        base_folder: str = "user_databases",
+        archive_folder: Optional[str] = None,
+        touch_interval: float = 300.0,
+        registry: Optional[UserRegistry] = None,
+    ):
+        """Initialize cold storage
+
+        Args:
+            base_folder: Base folder holding the user folders
+            archive_folder: Folder for the user archives (defaults to ``<base_folder>/archive``)
+            touch_interval: Minimum seconds between activity writes for the same user
+            registry: User registry that records activity instead of the activity index (optional)
+        """
+        self.base_folder = base_folder
+        self.registry = registry
+        self.archive_folder = archive_folder or os.path.join(base_folder, self.ARCHIVE_FOLDER_NAME)
+        self.index_path = os.path.join(base_folder, self.INDEX_NAME)
+        self.touch_interval = touch_interval
+        self._last_touch: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.restore_stats = {"restores": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+        if not os.path.exists(self.archive_folder):
+            os.makedirs(self.archive_folder)
+        self.create_index()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.index_path, timeout=30.0, isolation_level=None)
+
+    def create_index(self):
+        """Create the activity index if it doesn't exist"""
+        conn = self._connect()
+        conn.execute(
+            """
+        CREATE TABLE IF NOT EXISTS user_activity (
+            user_id INTEGER PRIMARY KEY,
+            last_active REAL NOT NULL,
+            archived INTEGER NOT NULL DEFAULT 0,
+            archived_date REAL,
+            archive_size INTEGER
+        )
+        """
+        )
+        conn.close()
+
+    def get_user_folder(self, user_id: int) -> str:
+        """Get the user's personal folder path
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Path to the user's personal folder
+        """
+        return os.path.join(self.base_folder, f"user_{user_id}")
+
+    def get_archive_path(self, user_id: int) -> str:
+        """Get the path of a user's archive
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Path to the ``.tar.gz`` archive of the user
+        """
+        return os.path.join(self.archive_folder, f"user_{user_id}.tar.gz")
+
+    def is_archived(self, user_id: int) -> bool:
+        """Check if a user is currently archived
+
+        Answered by the registry when there is one; the folder and archive
+        are only checked for users it doesn't know.
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            True if the user's folder only exists as an archive
+        """
+        if self.registry is not None:
+            archived = self.registry.is_archived(user_id)
+            if archived is not None:
+                return archived
+        return not os.path.isdir(self.get_user_folder(user_id)) and os.path.exists(
+            self.get_archive_path(user_id)
+        )
+
+    def ensure_available(self, user_id: int):
+        """Restore an archived user and record the access
+
+        Called by the database handlers before they build a path. While
+        this process recorded the user less than ``touch_interval`` ago
+        there is nothing to check: the archiver skips users that recent.
+        Otherwise the restore check and the activity write happen under
+        the archive lock, so an archiver that already picked the user
+        either sees the new activity or finishes first and the user is
+        restored right away.
+
+        Args:
+            user_id: Telegram user ID
+        """
+        if time.time() - self._last_touch.get(user_id, 0.0) < self.touch_interval:
+            return
+
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                restore_seconds = self._extract(conn, user_id) if self.is_archived(user_id) else None
+                self._record_activity(conn, user_id, time.time())
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+        if restore_seconds is not None:
+            self._count_restore(restore_seconds)
+
+    def touch(self, user_id: int, force: bool = False):
+        """Record that a user was active
+
+        Args:
+            user_id: Telegram user ID
+            force: Write even if the user was recorded less than ``touch_interval`` ago
+        """
+        now = time.time()
+        if not force and now - self._last_touch.get(user_id, 0.0) < self.touch_interval:
+            return
+        conn = self._connect()
+        try:
+            self._record_activity(conn, user_id, now)
+        finally:
+            conn.close()
+
+    def _record_activity(self, conn: sqlite3.Connection, user_id: int, now: float):
+        self._last_touch[user_id] = now
+        if self.registry is not None:
+            self.registry.touch(user_id, force=True)
+            return
+        conn.execute(
+            """
+        INSERT INTO user_activity (user_id, last_active) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET last_active = excluded.last_active
+        """,
+            (user_id, now),
+        )
+
+    def get_last_active(self, user_id: int) -> Optional[float]:
+        """Get the last recorded activity of a user
+
+        Users without an index entry (e.g. from before the index existed)
+        fall back to the newest modification time in their folder.
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Unix timestamp, or None if the user has no folder
+        """
+        if self.registry is not None:
+            last_active = self.registry.get_last_active(user_id)
+        else:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT last_active FROM user_activity WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            conn.close()
+            last_active = row[0] if row else None
+        if last_active is not None:
+            return last_active
+
+        user_folder = self.get_user_folder(user_id)
+        if not os.path.isdir(user_folder):
+            return None
+        return max(
+            [entry.stat().st_mtime for entry in os.scandir(user_folder)]
+            or [os.stat(user_folder).st_mtime]
+        )
+
+    def archive_user(self, user_id: int, idle_before: Optional[float] = None) -> Optional[int]:
+        """Pack a user's folder into one archive and remove the folder
+
+        Without ``idle_before`` the caller has to make sure the bot isn't
+        serving the user at the same time.
+
+        Args:
+            user_id: Telegram user ID
+            idle_before: Only archive if the user was last active before this timestamp
+
+        Returns:
+            Size of the archive in bytes, or None if nothing was archived
+        """
+        user_folder = self.get_user_folder(user_id)
+        archive_path = self.get_archive_path(user_id)
+
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                if not os.path.isdir(user_folder):
+                    conn.execute("ROLLBACK")
+                    return None
+                # Re-check under the lock; another process may have touched the user meanwhile
+                if idle_before is not None:
+                    last_active = self.get_last_active(user_id)
+                    if last_active is not None and last_active >= idle_before:
+                        conn.execute("ROLLBACK")
+                        return None
+
+                tmp_path = archive_path + ".tmp"
+                with tarfile.open(tmp_path, "w:gz") as archive:
+                    for filename in sorted(os.listdir(user_folder)):
+                        # Shared-memory files are rebuilt by SQLite on open
+                        if filename.endswith("-shm"):
+                            continue
+                        archive.add(os.path.join(user_folder, filename), arcname=filename)
+                os.replace(tmp_path, archive_path)
+
+                # Move the folder away atomically first, so a crash never leaves a half-deleted folder
+                removed_folder = tempfile.mkdtemp(prefix=f".archived_user_{user_id}_", dir=self.base_folder)
+                os.rmdir(removed_folder)
+                os.rename(user_folder, removed_folder)
+                shutil.rmtree(removed_folder)
+
+                archive_size = os.path.getsize(archive_path)
+                conn.execute(
+                    """
+                INSERT INTO user_activity (user_id, last_active, archived, archived_date, archive_size)
+                VALUES (?, ?, 1, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    archived = 1,
+                    archived_date = excluded.archived_date,
+                    archive_size = excluded.archive_size
+                """,
+                    (user_id, idle_before or time.time(), time.time(), archive_size),
+                )
+                if self.registry is not None:
+                    self.registry.set_archived(user_id, True)
+                conn.execute("COMMIT")
+                # The next access from this process has to restore, however recent the last one was
+                self._last_touch.pop(user_id, None)
+                return archive_size
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+    def restore_user(self, user_id: int) -> bool:
+        """Extract an archived user back into their folder
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            True if the user was restored, False if there was nothing to restore
+        """
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                # Another process may have restored the user while we waited for the lock
+                if not self.is_archived(user_id):
+                    conn.execute("ROLLBACK")
+                    return False
+                restore_seconds = self._extract(conn, user_id)
+                self._record_activity(conn, user_id, time.time())
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+        self._count_restore(restore_seconds)
+        return True
+
+    def _extract(self, conn: sqlite3.Connection, user_id: int) -> float:
+        # Caller holds the archive lock and a write transaction on the index
+        user_folder = self.get_user_folder(user_id)
+        archive_path = self.get_archive_path(user_id)
+        started = time.perf_counter()
+        restore_folder = tempfile.mkdtemp(prefix=f".restore_user_{user_id}_", dir=self.base_folder)
+        try:
+            with tarfile.open(archive_path, "r:gz") as archive:
+                for member in archive:
+                    # Archives only ever hold the flat files of one folder
+                    if not member.isfile() or os.path.basename(member.name) != member.name:
+                        continue
+                    with archive.extractfile(member) as source, open(
+                        os.path.join(restore_folder, member.name), "wb"
+                    ) as target:
+                        shutil.copyfileobj(source, target)
+            os.rename(restore_folder, user_folder)
+        except BaseException:
+            # The archive is untouched, so a later restore starts over from a clean state
+            shutil.rmtree(restore_folder, ignore_errors=True)
+            raise
+        os.remove(archive_path)
+
+        conn.execute(
+            """
+        UPDATE user_activity
+        SET archived = 0, archived_date = NULL, archive_size = NULL
+        WHERE user_id = ?
+        """,
+            (user_id,),
+        )
+        if self.registry is not None:
+            self.registry.set_archived(user_id, False)
+        return time.perf_counter() - started
+
+    def _count_restore(self, elapsed: float):
+        self.restore_stats["restores"] += 1
+        self.restore_stats["total_seconds"] += elapsed
+        self.restore_stats["max_seconds"] = max(self.restore_stats["max_seconds"], elapsed)
+
+    def find_inactive_users(self, idle_before: float) -> List[int]:
+        """Find users with a folder whose last activity is older than a cutoff
+
+        Args:
+            idle_before: Unix timestamp; users last active before it are inactive
+
+        Returns:
+            List of user IDs
+        """
+        inactive = []
+        for entry in os.scandir(self.base_folder):
+            if not entry.is_dir() or not entry.name.startswith("user_"):
+                continue
+            try:
+                user_id = int(entry.name[len("user_"):])
+            except ValueError:
+                continue
+            last_active = self.get_last_active(user_id)
+            if last_active is not None and last_active < idle_before:
+                inactive.append(user_id)
+        return inactive
+
+    def archive_inactive(self, idle_seconds: float) -> Dict:
+        """Archive every user idle for longer than ``idle_seconds``
+
+        Args:
+            idle_seconds: Inactivity after which a user is archived
+
+        Returns:
+            Dictionary with the number of archived users, their total
+            archive size and the elapsed time
+        """
+        if idle_seconds <= self.touch_interval:
+            # Users are only recorded once per touch_interval; a shorter threshold could archive an active user
+            raise ValueError(
+                f"idle_seconds ({idle_seconds}) must be longer than touch_interval ({self.touch_interval})"
+            )
+        started = time.monotonic()
+        idle_before = time.time() - idle_seconds
+        archived_users = 0
+        archive_bytes = 0
+        for user_id in self.find_inactive_users(idle_before):
+            archive_size = self.archive_user(user_id, idle_before)
+            if archive_size is not None:
+                archived_users += 1
+                archive_bytes += archive_size
+        return {
+            "archived_users": archived_users,
+            "archive_bytes": archive_bytes,
+            "elapsed_seconds": time.monotonic() - started,
+        }
+
+    def format_report(self, stats: Dict) -> str:
+        """Format archival and restore statistics for the console
+
+        Args:
+            stats: Result of ``archive_inactive``
+
+        Returns:
+            One-line report
+        """
+        restores = self.restore_stats["restores"]
+        average_restore = self.restore_stats["total_seconds"] / restores if restores else 0.0
+        return (
+            f"Cold storage: archived {stats['archived_users']} users "
+            f"({stats['archive_bytes'] / 1024:.1f} KiB) in {stats['elapsed_seconds']:.2f}s, "
+            f"{restores} restores (avg {average_restore * 1000:.1f} ms, "
+            f"max {self.restore_stats['max_seconds'] * 1000:.1f} ms)"
+        )
+
+    def start(self, interval_seconds: float, idle_seconds: float):
+        """Archive inactive users periodically in a background thread
+
+        Args:
+            interval_seconds: Seconds to wait between runs
+            idle_seconds: Inactivity after which a user is archived
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+
+        def loop():
+            while not self._stop_event.is_set():
+                stats = self.archive_inactive(idle_seconds)
+                print(self.format_report(stats))
+                self._stop_event.wait(interval_seconds)
+
+        self._thread = threading.Thread(target=loop, name="cold-storage", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread after the current user finishes"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: python cold_storage.py [idle_days] [base_folder]
+    base_folder = sys.argv[2] if len(sys.argv) > 2 else "user_databases"
+    # The bot records activity in the registry, so the archiver has to read it from there
+    cold_storage = ColdStorage(base_folder, registry=UserRegistry(base_folder))
+    result = cold_storage.archive_inactive(float(sys.argv[1] if len(sys.argv) > 1 else 90) * 86400)
+    print(cold_storage.format_report(result))
@@ -1,22 +1,58 @@
 import sqlite3
 import os
-from typing import List, Tuple, Optional
+from typing import Callable, List, Tuple, Optional
+
+from cold_storage import ColdStorage
+from db_rows import ColumnBatch, CuisineEntry, CuisineIngredient
+from ingredient_dictionary import IngredientDictionary, ensure_ingredient_id_column
+from user_registry import UserRegistry
 
 
 class CuisineDB:
     """Database handler for user cuisines"""
     
-    def __init__(self, base_folder: str = "user_databases"):
+    def __init__(self, base_folder: str = "user_databases", cold_storage: Optional[ColdStorage] = None,
+                 ingredient_dictionary: Optional[IngredientDictionary] = None,
+                 registry: Optional[UserRegistry] = None):
         """Initialize the cuisine database handler
         
         Args:
             base_folder: Base folder to store user databases
+            cold_storage: Restores archived users on access and records activity (optional)
+            ingredient_dictionary: Assigns ingredient IDs to stored ingredients (optional)
+            registry: Answers existence checks from memory instead of the filesystem (optional)
         """
         self.base_folder = base_folder
+        self.cold_storage = cold_storage
+        self.ingredient_dictionary = ingredient_dictionary
+        self.registry = registry
+        # Callbacks run after a cuisine is created or its ingredients change
+        self.change_listeners: List[Callable[[int, str, Optional[List[str]]], None]] = []
         # Create the base database folder if it doesn't exist
         if not os.path.exists(self.base_folder):
             os.makedirs(self.base_folder)
     
+    def add_change_listener(self, listener: Callable[[int, str, Optional[List[str]]], None]):
+        """Register a callback run after a cuisine is created or its ingredients change
+        
+        Args:
+            listener: Callable taking (user_id, cuisine_name, added_ingredients); the
+                ingredient names are given when the change only added them, else None
+        """
+        self.change_listeners.append(listener)
+    
+    def notify_cuisine_changed(self, user_id: int, cuisine_name: str,
+                               added_ingredients: Optional[List[str]] = None):
+        """Run the registered change listeners for a cuisine
+        
+        Args:
+            user_id: Telegram user ID
+            cuisine_name: Name of the cuisine
+            added_ingredients: Names of the ingredients added, if that is all that changed
+        """
+        for listener in self.change_listeners:
+            listener(user_id, cuisine_name, added_ingredients)
+    
     def get_user_folder(self, user_id: int) -> str:
         """Get the user's personal folder path
         
@@ -26,6 +62,10 @@ class CuisineDB:
         Returns:
             Path to the user's personal folder
         """
+        if self.cold_storage is not None:
+            self.cold_storage.ensure_available(user_id)
+        elif self.registry is not None:
+            self.registry.touch(user_id)
         return os.path.join(self.base_folder, f"user_{user_id}")
     
     def create_user_folder(self, user_id: int) -> bool:
@@ -37,11 +77,32 @@ class CuisineDB:
         Returns:
             True if created or already exists
         """
+        if self.registry is not None and self.registry.has_folder(user_id):
+            return False
+        
         user_folder = self.get_user_folder(user_id)
+        created = False
         if not os.path.exists(user_folder):
             os.makedirs(user_folder)
-            return True
-        return False
+            created = True
+        if self.registry is not None:
+            self.registry.register_folder(user_id, os.path.basename(user_folder))
+        return created
+    
+    @staticmethod
+    def get_cuisine_filename(cuisine_name: str) -> str:
+        """Get the database file name of a cuisine
+        
+        Args:
+            cuisine_name: Name of the cuisine
+            
+        Returns:
+            Sanitized file name (e.g. "lasagne.db")
+        """
+        # Sanitize cuisine name for filename (remove special characters)
+        safe_name = "".join(c for c in cuisine_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        safe_name = safe_name.replace(' ', '_').lower()
+        return f"{safe_name}.db"
     
     def get_cuisine_db_path(self, user_id: int, cuisine_name: str) -> str:
         """Get the path to a specific cuisine's database
@@ -54,10 +115,13 @@ class CuisineDB:
             Path to the specific cuisine database file
         """
         user_folder = self.get_user_folder(user_id)
-        # Sanitize cuisine name for filename (remove special characters)
-        safe_name = "".join(c for c in cuisine_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        safe_name = safe_name.replace(' ', '_').lower()
-        return os.path.join(user_folder, f"{safe_name}.db")
+        cuisine_filename = self.get_cuisine_filename(cuisine_name)
+        cuisine_db_path = os.path.join(user_folder, cuisine_filename)
+        exists = self.registry.has_cuisine(user_id, cuisine_filename) if self.registry is not None else None
+        # Databases created before ingredient IDs get the column on first use
+        ensure_ingredient_id_column(cuisine_db_path, "ingredients", "ingredient_name",
+                                    self.ingredient_dictionary, exists)
+        return cuisine_db_path
     
     def get_cuisines_db_path(self, user_id: int) -> str:
         """Get the path to user's cuisines index database
@@ -80,6 +144,10 @@ class CuisineDB:
         Returns:
             True if created successfully
         """
+        # Nothing to do once the registry knows the index exists
+        if self.registry is not None and self.registry.has_cuisine_system(user_id):
+            return True
+        
         # Ensure user folder exists
         self.create_user_folder(user_id)
         
@@ -102,6 +170,8 @@ class CuisineDB:
         conn_cuisines.commit()
         conn_cuisines.close()
         
+        if self.registry is not None:
+            self.registry.register_cuisine_system(user_id)
         return True
     
     def create_specific_cuisine_database(self, user_id: int, cuisine_name: str, description: str = None) -> Optional[int]:
@@ -122,13 +192,11 @@ class CuisineDB:
         cuisine_db_path = self.get_cuisine_db_path(user_id, cuisine_name)
         
         # Check if cuisine already exists
-        if os.path.exists(cuisine_db_path):
+        if self.cuisine_exists(user_id, cuisine_name):
             return None
         
         # Get safe filename for database
-        safe_name = "".join(c for c in cuisine_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        safe_name = safe_name.replace(' ', '_').lower()
-        cuisine_filename = f"{safe_name}.db"
+        cuisine_filename = self.get_cuisine_filename(cuisine_name)
         
         # Add to index database
         conn_index = sqlite3.connect(cuisines_db_path)
@@ -161,10 +229,15 @@ class CuisineDB:
             unit TEXT DEFAULT 'pieces',
             notes TEXT,
             category TEXT DEFAULT 'other',
-            added_date DATETIME DEFAULT CURRENT_TIMESTAMP
+            added_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+            ingredient_id INTEGER
         )
         ''')
         
+        cursor_cuisine.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ingredients_ingredient_id ON ingredients (ingredient_id)
+        ''')
+        
         cursor_cuisine.execute('''
         CREATE TABLE IF NOT EXISTS cuisine_info (
             id INTEGER PRIMARY KEY,
@@ -184,6 +257,9 @@ class CuisineDB:
         conn_cuisine.commit()
         conn_cuisine.close()
         
+        if self.registry is not None:
+            self.registry.register_cuisine(user_id, cuisine_name, cuisine_filename)
+        self.notify_cuisine_changed(user_id, cuisine_name)
         return cuisine_id
     
     def user_has_cuisine_system(self, user_id: int) -> bool:
@@ -195,6 +271,8 @@ class CuisineDB:
         Returns:
             True if user has cuisine system set up
         """
+        if self.registry is not None:
+            return self.registry.has_cuisine_system(user_id)
         cuisines_db_path = self.get_cuisines_db_path(user_id)
         return os.path.exists(cuisines_db_path)
     
@@ -208,24 +286,28 @@ class CuisineDB:
         Returns:
             True if cuisine exists
         """
+        if self.registry is not None:
+            return self.registry.has_cuisine(user_id, self.get_cuisine_filename(cuisine_name))
         cuisine_db_path = self.get_cuisine_db_path(user_id, cuisine_name)
         return os.path.exists(cuisine_db_path)
     
-    def get_cuisines(self, user_id: int) -> List[Tuple]:
+    def get_cuisines(self, user_id: int) -> List[CuisineEntry]:
         """Get all cuisines for a user
         
         Args:
             user_id: Telegram user ID
             
         Returns:
-            List of tuples containing cuisine information
+            List of CuisineEntry rows (unpack like the former
+            (cuisine_id, cuisine_name, cuisine_filename, description, created_date) tuples)
         """
         cuisines_db_path = self.get_cuisines_db_path(user_id)
         
-        if not os.path.exists(cuisines_db_path):
+        if not self.user_has_cuisine_system(user_id):
             return []
         
         conn = sqlite3.connect(cuisines_db_path)
+        conn.row_factory = CuisineEntry.row_factory
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -239,6 +321,31 @@ class CuisineDB:
         
         return cuisines
     
+    def build_add_ingredient_statement(self, ingredient_name: str, amount: str,
+                                       unit: str = 'pieces', notes: str = None,
+                                       category: str = 'other') -> Tuple[str, Tuple]:
+        """Build the statement that adds an ingredient to a cuisine
+        
+        Args:
+            ingredient_name: Name of the ingredient
+            amount: Amount/quantity
+            unit: Unit of measurement
+            notes: Optional notes
+            category: Ingredient category
+        
+        Returns:
+            Tuple of (SQL, parameters)
+        """
+        ingredient_id = None
+        if self.ingredient_dictionary is not None:
+            ingredient_id = self.ingredient_dictionary.get_id(ingredient_name)
+        
+        return ('''
+        INSERT INTO ingredients
+        (ingredient_name, amount, unit, notes, category, ingredient_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', (ingredient_name, amount, unit, notes, category, ingredient_id))
+    
     def add_ingredient_to_cuisine(self, user_id: int, cuisine_name: str, 
                                  ingredient_name: str, amount: str, 
                                  unit: str = 'pieces', notes: str = None, 
@@ -259,23 +366,22 @@ class CuisineDB:
         """
         cuisine_db_path = self.get_cuisine_db_path(user_id, cuisine_name)
         
-        if not os.path.exists(cuisine_db_path):
+        if not self.cuisine_exists(user_id, cuisine_name):
             return False
         
         conn = sqlite3.connect(cuisine_db_path)
         cursor = conn.cursor()
         
-        cursor.execute('''
-        INSERT INTO ingredients 
-        (ingredient_name, amount, unit, notes, category)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (ingredient_name, amount, unit, notes, category))
+        cursor.execute(*self.build_add_ingredient_statement(
+            ingredient_name, amount, unit, notes, category))
         
         conn.commit()
         conn.close()
+        
+        self.notify_cuisine_changed(user_id, cuisine_name, [ingredient_name])
         return True
     
-    def get_cuisine_ingredients(self, user_id: int, cuisine_name: str) -> List[Tuple]:
+    def get_cuisine_ingredients(self, user_id: int, cuisine_name: str) -> List[CuisineIngredient]:
         """Get all ingredients for a specific cuisine
         
         Args:
@@ -283,14 +389,16 @@ class CuisineDB:
             cuisine_name: Name of the cuisine
             
         Returns:
-            List of tuples containing ingredient information
+            List of CuisineIngredient rows (unpack like the former
+            (id, ingredient_name, amount, unit, notes, category, added_date) tuples)
         """
         cuisine_db_path = self.get_cuisine_db_path(user_id, cuisine_name)
         
-        if not os.path.exists(cuisine_db_path):
+        if not self.cuisine_exists(user_id, cuisine_name):
             return []
         
         conn = sqlite3.connect(cuisine_db_path)
+        conn.row_factory = CuisineIngredient.row_factory
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -304,6 +412,35 @@ class CuisineDB:
         
         return ingredients
     
+    def get_cuisine_ingredient_columns(self, user_id: int, cuisine_name: str) -> ColumnBatch:
+        """Get all ingredients for a specific cuisine as columns
+        
+        Args:
+            user_id: Telegram user ID
+            cuisine_name: Name of the cuisine
+            
+        Returns:
+            ColumnBatch with the columns of get_cuisine_ingredients ("id" as a numeric array)
+        """
+        batch = ColumnBatch([('id', 'q'), ('ingredient_name', None), ('amount', None), ('unit', None),
+                             ('notes', None), ('category', None), ('added_date', None)])
+        cuisine_db_path = self.get_cuisine_db_path(user_id, cuisine_name)
+        
+        if not self.cuisine_exists(user_id, cuisine_name):
+            return batch
+        
+        conn = sqlite3.connect(cuisine_db_path)
+        conn.row_factory = batch.row_factory
+        cursor = conn.execute('''
+        SELECT id, ingredient_name, amount, unit, notes, category, added_date
+        FROM ingredients
+        ORDER BY added_date
+        ''')
+        batch.fetch(cursor)
+        conn.close()
+        
+        return batch
+    
     def get_cuisine_info(self, user_id: int, cuisine_name: str) -> Optional[Tuple]:
         """Get information about a specific cuisine
         
@@ -316,7 +453,7 @@ class CuisineDB:
         """
         cuisine_db_path = self.get_cuisine_db_path(user_id, cuisine_name)
         
-        if not os.path.exists(cuisine_db_path):
+        if not self.cuisine_exists(user_id, cuisine_name):
             return None
         
         conn = sqlite3.connect(cuisine_db_path)
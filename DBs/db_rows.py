@@ -0,0 +1,165 @@
+import array
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+class Row:
+    """Base class of the typed rows returned by the database handlers
+
+    Rows keep their columns in ``__slots__`` (no per-row ``__dict__``)
+    and still behave like the tuples the handlers returned before:
+    they can be unpacked, indexed and compared with tuples, so
+    ``_, item_name, quantity, unit, expiry_date, _ = item`` keeps working.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def row_factory(cls, cursor: sqlite3.Cursor, row: Tuple):
+        """sqlite3 row factory building the row object straight from the fetched tuple"""
+        return cls(*row)
+
+    def __iter__(self) -> Iterator:
+        for name in self.__slots__:
+            yield getattr(self, name)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        return getattr(self, self.__slots__[index])
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (Row, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(tuple(self))
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def as_dict(self) -> Dict:
+        """Get the row as a column name to value dictionary"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class FridgeItem(Row):
+    """Row of ``RefrigeratorDB.get_refrigerator_items``"""
+
+    __slots__ = ("id", "item_name", "quantity", "unit", "expiry_date", "added_date")
+
+    def __init__(
+        self,
+        id: int,
+        item_name: str,
+        quantity: float,
+        unit: Optional[str],
+        expiry_date: Optional[str],
+        added_date: Optional[str],
+    ):
+        self.id = id
+        self.item_name = item_name
+        self.quantity = quantity
+        self.unit = unit
+        self.expiry_date = expiry_date
+        self.added_date = added_date
+
+
+class CuisineEntry(Row):
+    """Row of ``CuisineDB.get_cuisines``"""
+
+    __slots__ = ("cuisine_id", "cuisine_name", "cuisine_filename", "description", "created_date")
+
+    def __init__(
+        self,
+        cuisine_id: int,
+        cuisine_name: str,
+        cuisine_filename: str,
+        description: Optional[str],
+        created_date: Optional[str],
+    ):
+        self.cuisine_id = cuisine_id
+        self.cuisine_name = cuisine_name
+        self.cuisine_filename = cuisine_filename
+        self.description = description
+        self.created_date = created_date
+
+
+class CuisineIngredient(Row):
+    """Row of ``CuisineDB.get_cuisine_ingredients``"""
+
+    __slots__ = ("id", "ingredient_name", "amount", "unit", "notes", "category", "added_date")
+
+    def __init__(
+        self,
+        id: int,
+        ingredient_name: str,
+        amount: str,
+        unit: Optional[str],
+        notes: Optional[str],
+        category: Optional[str],
+        added_date: Optional[str],
+    ):
+        self.id = id
+        self.ingredient_name = ingredient_name
+        self.amount = amount
+        self.unit = unit
+        self.notes = notes
+        self.category = category
+        self.added_date = added_date
+
+
+class ColumnBatch:
+    """Query result stored column by column
+
+    Used as the row factory of a cursor: every fetched row is appended to
+    one array per column and no per-row object is kept. Numeric columns
+    use ``array.array`` (8 bytes per value), the others plain lists.
+    """
+
+    def __init__(self, columns: Sequence[Tuple[str, Optional[str]]]):
+        """Initialize an empty batch
+
+        Args:
+            columns: (name, array typecode) per selected column, in SELECT order;
+                a typecode of None stores the column in a list
+        """
+        self.columns: Dict[str, object] = {
+            name: array.array(typecode) if typecode else [] for name, typecode in columns
+        }
+        self._appends = [column.append for column in self.columns.values()]
+        self.size = 0
+
+    def row_factory(self, cursor: sqlite3.Cursor, row: Tuple) -> None:
+        """sqlite3 row factory appending the row to the columns"""
+        for append, value in zip(self._appends, row):
+            append(value)
+        self.size += 1
+
+    def fetch(self, cursor: sqlite3.Cursor) -> "ColumnBatch":
+        """Drain an executed cursor into the batch
+
+        Args:
+            cursor: Cursor whose ``row_factory`` is this batch's ``row_factory``
+
+        Returns:
+            The batch itself
+        """
+        for _ in cursor:
+            pass
+        return self
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, name: str):
+        return self.columns[name]
+
+    def names(self) -> List[str]:
+        """Get the column names in SELECT order"""
+        return list(self.columns)
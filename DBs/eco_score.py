@@ -0,0 +1,403 @@
+import array
+import csv
+import mmap
+import os
+import struct
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cuisine_db import CuisineDB
+from ingredient_dictionary import IngredientDictionary, normalize_ingredient_name
+
+
+DATA_FOLDER = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FACTORS_CSV = os.path.join(DATA_FOLDER, "eco_factors.csv")
+DEFAULT_FACTORS_BIN = os.path.join(DATA_FOLDER, "eco_factors.bin")
+
+# magic, version, reserved, number of ingredients
+HEADER = struct.Struct("=4sHHI")
+MAGIC = b"ECOF"
+VERSION = 1
+# co2 (kg CO2e per kg), water (liters per kg), weight of one piece (kg, 0 if unknown)
+FIELDS_PER_INGREDIENT = 3
+
+# Conversion of recipe units to kilograms (liquids are assumed to weigh 1 kg per liter)
+UNIT_TO_KG = {
+    "g": 0.001,
+    "gr": 0.001,
+    "gram": 0.001,
+    "grams": 0.001,
+    "kg": 1.0,
+    "kilo": 1.0,
+    "kilos": 1.0,
+    "kilogram": 1.0,
+    "kilograms": 1.0,
+    "mg": 0.000001,
+    "ml": 0.001,
+    "milliliter": 0.001,
+    "milliliters": 0.001,
+    "l": 1.0,
+    "liter": 1.0,
+    "liters": 1.0,
+    "litre": 1.0,
+    "litres": 1.0,
+    "tsp": 0.005,
+    "teaspoon": 0.005,
+    "teaspoons": 0.005,
+    "tbsp": 0.015,
+    "tablespoon": 0.015,
+    "tablespoons": 0.015,
+    "cup": 0.24,
+    "cups": 0.24,
+    "oz": 0.0283,
+    "lb": 0.4536,
+    "lbs": 0.4536,
+}
+# Units counted in pieces, weighed with the ingredient's typical piece weight
+PIECE_UNITS = {
+    "",
+    "piece",
+    "pieces",
+    "pc",
+    "pcs",
+    "unit",
+    "units",
+    "whole",
+    "clove",
+    "cloves",
+    "slice",
+    "slices",
+    "loaf",
+    "loaves",
+}
+# Used for pieces when the dataset has no piece weight for an ingredient
+DEFAULT_PIECE_KG = 0.1
+
+
+def parse_amount(amount) -> Optional[float]:
+    """Parse a free-form amount such as "2", "0.5", "1/2" or "1,5"
+
+    Args:
+        amount: Amount as stored in the ingredients table
+
+    Returns:
+        The amount as a float, or None if it cannot be parsed
+    """
+    if amount is None:
+        return None
+    text = str(amount).strip().replace(",", ".")
+    try:
+        if "/" in text:
+            numerator, denominator = text.split("/", 1)
+            return float(numerator) / float(denominator)
+        return float(text)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+class EcoFactorTable:
+    """Memory-mapped, array-backed table of per-ingredient eco factors
+
+    The binary file holds a header, a float32 array with the factors of
+    every ingredient, a uint32 offset array and the sorted, concatenated
+    ingredient names. The position of a name in the sorted list is its
+    interned ingredient ID. Opening the table only maps the file, so it
+    loads instantly and worker processes share the same pages.
+    """
+
+    def __init__(self, bin_path: str = DEFAULT_FACTORS_BIN, max_cached_names: int = 4096):
+        """Map a compiled factor table
+
+        Args:
+            bin_path: Path to the compiled binary table
+            max_cached_names: Number of looked up names kept (least recently used are dropped)
+        """
+        self.bin_path = bin_path
+        self.max_cached_names = max_cached_names
+        with open(bin_path, "rb") as table_file:
+            self._mmap = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not an eco factor table: {bin_path}")
+
+        self.count = count
+        view = memoryview(self._mmap)
+        factors_start = HEADER.size
+        offsets_start = factors_start + 4 * FIELDS_PER_INGREDIENT * count
+        names_start = offsets_start + 4 * (count + 1)
+        self._factors = view[factors_start:offsets_start].cast("f")
+        self._offsets = view[offsets_start:names_start].cast("I")
+        self._names = view[names_start:]
+        # Interning cache: normalized name -> ingredient ID (None if unknown)
+        self._ids: "OrderedDict[str, Optional[int]]" = OrderedDict()
+
+    @classmethod
+    def compile(cls, csv_path: str = DEFAULT_FACTORS_CSV, bin_path: str = DEFAULT_FACTORS_BIN):
+        """Compile the CSV dataset into the binary table format
+
+        Args:
+            csv_path: Dataset with ingredient, co2_kg_per_kg, water_l_per_kg, piece_kg
+            bin_path: Path of the binary table to write
+        """
+        rows = {}
+        with open(csv_path, "r", encoding="utf-8", newline="") as dataset:
+            for row in csv.DictReader(dataset):
+                name = normalize_ingredient_name(row["ingredient"])
+                if name:
+                    rows[name] = (
+                        float(row["co2_kg_per_kg"] or 0),
+                        float(row["water_l_per_kg"] or 0),
+                        float(row.get("piece_kg") or 0),
+                    )
+
+        names = sorted(rows)
+        factors = array.array("f")
+        offsets = array.array("I", [0])
+        blob = bytearray()
+        for name in names:
+            factors.extend(rows[name])
+            blob.extend(name.encode("utf-8"))
+            offsets.append(len(blob))
+
+        # Write next to the target and swap atomically so readers never see a partial file
+        tmp_path = f"{bin_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as table_file:
+            table_file.write(HEADER.pack(MAGIC, VERSION, 0, len(names)))
+            factors.tofile(table_file)
+            offsets.tofile(table_file)
+            table_file.write(blob)
+        os.replace(tmp_path, bin_path)
+
+    @classmethod
+    def load(cls, csv_path: str = DEFAULT_FACTORS_CSV, bin_path: str = DEFAULT_FACTORS_BIN) -> "EcoFactorTable":
+        """Map the binary table, recompiling it first if the dataset is newer
+
+        Args:
+            csv_path: Path to the CSV dataset
+            bin_path: Path to the compiled binary table
+
+        Returns:
+            The mapped factor table
+        """
+        if not os.path.exists(bin_path) or (
+            os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(bin_path)
+        ):
+            cls.compile(csv_path, bin_path)
+        return cls(bin_path)
+
+    def name_of(self, ingredient_id: int) -> str:
+        """Get the normalized name of an ingredient ID
+
+        Args:
+            ingredient_id: Interned ingredient ID
+
+        Returns:
+            Normalized ingredient name
+        """
+        start = self._offsets[ingredient_id]
+        end = self._offsets[ingredient_id + 1]
+        return bytes(self._names[start:end]).decode("utf-8")
+
+    def _search(self, name: str) -> Optional[int]:
+        low, high = 0, self.count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            candidate = self.name_of(middle)
+            if candidate == name:
+                return middle
+            if candidate < name:
+                low = middle + 1
+            else:
+                high = middle - 1
+        return None
+
+    def lookup_id(
+        self, ingredient_name: str, dictionary: Optional[IngredientDictionary] = None
+    ) -> Optional[int]:
+        """Find the ingredient ID for a raw ingredient name
+
+        Only exact matches count: the normalized name, then its canonical
+        name from the ingredient dictionary ("courgette" -> "zucchini").
+        Single words of longer names are not tried, since "peanut butter"
+        is not butter. Results are cached per normalized name, so a table
+        should always be used with the same dictionary.
+
+        Args:
+            ingredient_name: Raw ingredient name
+            dictionary: Ingredient dictionary resolving synonyms (optional)
+
+        Returns:
+            Interned ingredient ID, or None if the ingredient is unknown
+        """
+        normalized = normalize_ingredient_name(ingredient_name)
+        if normalized in self._ids:
+            self._ids.move_to_end(normalized)
+            return self._ids[normalized]
+
+        ingredient_id = self._search(normalized)
+        if ingredient_id is None and dictionary is not None:
+            canonical = dictionary.canonical_name(ingredient_name)
+            if canonical != normalized:
+                ingredient_id = self._search(canonical)
+
+        self._ids[normalized] = ingredient_id
+        if len(self._ids) > self.max_cached_names:
+            self._ids.popitem(last=False)
+        return ingredient_id
+
+    def factors(self, ingredient_id: int) -> Tuple[float, float, float]:
+        """Get the factors of an ingredient
+
+        Args:
+            ingredient_id: Interned ingredient ID
+
+        Returns:
+            Tuple of (kg CO2e per kg, liters of water per kg, kg per piece)
+        """
+        base = ingredient_id * FIELDS_PER_INGREDIENT
+        return self._factors[base], self._factors[base + 1], self._factors[base + 2]
+
+
+class EcoScorer:
+    """Computes and caches CO2/water footprints of user cuisines"""
+
+    def __init__(
+        self,
+        cuisine_db: CuisineDB,
+        factor_table: Optional[EcoFactorTable] = None,
+        max_cached_cuisines: int = 4096,
+    ):
+        """Initialize the scorer
+
+        Args:
+            cuisine_db: Cuisine database handler (scores are invalidated on its changes)
+            factor_table: Factor table, loaded from the bundled dataset if omitted
+            max_cached_cuisines: Number of cuisine scores kept (least recently used are dropped)
+        """
+        self.cuisine_db = cuisine_db
+        self.factor_table = factor_table or EcoFactorTable.load()
+        self.max_cached_cuisines = max_cached_cuisines
+        # Cache of per-serving scores keyed by cuisine database path
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        cuisine_db.add_change_listener(self.invalidate)
+
+    def invalidate(self, user_id: int, cuisine_name: str, added_ingredients: Optional[List[str]] = None):
+        """Drop the cached score of a cuisine
+
+        Args:
+            user_id: Telegram user ID
+            cuisine_name: Name of the cuisine
+            added_ingredients: Ignored; the score is recomputed on the next request
+        """
+        self._cache.pop(self.cuisine_db.get_cuisine_db_path(user_id, cuisine_name), None)
+
+    def score_ingredients(self, ingredients: Iterable[Tuple]) -> Dict:
+        """Score a list of ingredient rows
+
+        Args:
+            ingredients: Rows as returned by ``CuisineDB.get_cuisine_ingredients``
+
+        Returns:
+            Dictionary with co2_kg, water_l, the names of ingredients
+            without factors ("unmatched"), of ingredients whose amount
+            can't be parsed ("unparsed") and of ingredients in a unit that
+            can't be converted to a weight ("unscored")
+        """
+        table = self.factor_table
+        dictionary = self.cuisine_db.ingredient_dictionary
+        co2_kg = 0.0
+        water_l = 0.0
+        unmatched = []
+        unparsed = []
+        unscored = []
+        for ingredient in ingredients:
+            ingredient_name, amount, unit = ingredient[1], ingredient[2], ingredient[3]
+            ingredient_id = table.lookup_id(ingredient_name, dictionary)
+            if ingredient_id is None:
+                unmatched.append(ingredient_name)
+                continue
+            quantity = parse_amount(amount)
+            if quantity is None:
+                unparsed.append(ingredient_name)
+                continue
+
+            co2_per_kg, water_per_kg, piece_kg = table.factors(ingredient_id)
+            unit_name = (unit or "").strip().lower()
+            if unit_name in UNIT_TO_KG:
+                weight_kg = quantity * UNIT_TO_KG[unit_name]
+            elif unit_name in PIECE_UNITS:
+                # Pieces, loaves, cloves, ... use the ingredient's typical weight
+                weight_kg = quantity * (piece_kg or DEFAULT_PIECE_KG)
+            else:
+                # A "pinch" or a "bunch" has no sensible weight; report it instead of guessing
+                unscored.append(ingredient_name)
+                continue
+
+            co2_kg += weight_kg * co2_per_kg
+            water_l += weight_kg * water_per_kg
+
+        return {
+            "co2_kg": co2_kg,
+            "water_l": water_l,
+            "unmatched": unmatched,
+            "unparsed": unparsed,
+            "unscored": unscored,
+        }
+
+    def score_cuisine(self, user_id: int, cuisine_name: str, servings: int = 1) -> Dict:
+        """Get the footprint of a cuisine
+
+        Cuisines store ingredients for one person, so the stored recipe is
+        one serving and the total scales with ``servings``.
+
+        Args:
+            user_id: Telegram user ID
+            cuisine_name: Name of the cuisine
+            servings: Number of servings
+
+        Returns:
+            Dictionary with per_serving and total scores plus unmatched,
+            unparsed and unscored ingredients
+        """
+        key = self.cuisine_db.get_cuisine_db_path(user_id, cuisine_name)
+        per_serving = self._cache.get(key)
+        if per_serving is None:
+            per_serving = self.score_ingredients(
+                self.cuisine_db.get_cuisine_ingredients(user_id, cuisine_name)
+            )
+            self._cache[key] = per_serving
+            if len(self._cache) > self.max_cached_cuisines:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+
+        return {
+            "cuisine_name": cuisine_name,
+            "servings": servings,
+            "per_serving": {"co2_kg": per_serving["co2_kg"], "water_l": per_serving["water_l"]},
+            "total": {
+                "co2_kg": per_serving["co2_kg"] * servings,
+                "water_l": per_serving["water_l"] * servings,
+            },
+            "unmatched": per_serving["unmatched"],
+            "unparsed": per_serving["unparsed"],
+            "unscored": per_serving["unscored"],
+        }
+
+    def score_cuisines(self, user_id: int, servings: int = 1) -> List[Dict]:
+        """Score every cuisine of a user in one pass
+
+        Args:
+            user_id: Telegram user ID
+            servings: Number of servings
+
+        Returns:
+            List of scores (see ``score_cuisine``) ordered from lowest to highest CO2
+        """
+        scores = [
+            self.score_cuisine(user_id, cuisine[1], servings)
+            for cuisine in self.cuisine_db.get_cuisines(user_id)
+        ]
+        scores.sort(key=lambda score: score["per_serving"]["co2_kg"])
+        return scores
@@ -0,0 +1,248 @@
+import csv
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional, Set
+
+
+DATA_FOLDER = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SYNONYMS_CSV = os.path.join(DATA_FOLDER, "ingredient_synonyms.csv")
+
+# Database files whose ingredient_id column was checked by this process
+_upgraded_paths: Set[str] = set()
+
+
+def normalize_ingredient_name(name: str) -> str:
+    """Normalize an ingredient name for matching
+
+    Lowercases, collapses whitespace and strips simple English plurals
+    ("tomatoes" -> "tomato", "eggs" -> "egg").
+
+    Args:
+        name: Raw ingredient name
+
+    Returns:
+        Normalized name
+    """
+    words = re.findall(r"[^\W\d_]+", name.lower())
+    singular = []
+    for word in words:
+        if len(word) > 4 and word.endswith("oes"):
+            word = word[:-2]
+        elif len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        singular.append(word)
+    return " ".join(singular)
+
+
+def ensure_ingredient_id_column(
+    db_path: str,
+    table: str,
+    name_column: str,
+    dictionary: Optional["IngredientDictionary"] = None,
+    exists: Optional[bool] = None,
+):
+    """Add the indexed ``ingredient_id`` column to a database created before it existed
+
+    Runs once per database file and process. Rows without an ID are
+    filled in when a dictionary is given.
+
+    Args:
+        db_path: Path to the database file
+        table: Table holding the names (``refrigerator_items`` or ``ingredients``)
+        name_column: Column holding the raw names
+        dictionary: Dictionary used to fill in missing IDs (optional)
+        exists: Whether the file exists, if already known (e.g. from the registry);
+            checked on disk when None
+    """
+    if db_path in _upgraded_paths:
+        return
+    if not (os.path.exists(db_path) if exists is None else exists):
+        return
+
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    try:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if not columns:
+            # Table not created yet; its CREATE TABLE already has the column
+            return
+        with conn:
+            if "ingredient_id" not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN ingredient_id INTEGER")
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_ingredient_id ON {table} (ingredient_id)"
+            )
+            if dictionary is not None:
+                names = [
+                    row[0]
+                    for row in conn.execute(
+                        f"SELECT DISTINCT {name_column} FROM {table} WHERE ingredient_id IS NULL"
+                    )
+                ]
+                conn.executemany(
+                    f"UPDATE {table} SET ingredient_id = ? WHERE {name_column} = ? AND ingredient_id IS NULL",
+                    [(dictionary.get_id(name), name) for name in names],
+                )
+    finally:
+        conn.close()
+    _upgraded_paths.add(db_path)
+
+
+class IngredientDictionary:
+    """Shared dictionary assigning integer IDs to canonical ingredient names
+
+    Names are normalized (case, punctuation, plurals) and mapped through
+    a synonym table ("aubergine" -> "eggplant") before they are interned,
+    so every spelling of an ingredient gets the same ID in every user's
+    database. The whole dictionary is loaded into memory once per
+    process; only unseen names touch the database.
+    """
+
+    DB_NAME = "ingredient_dictionary.db"
+
+    def __init__(self, base_folder: str = "user_databases", synonyms_csv: str = DEFAULT_SYNONYMS_CSV):
+        """Initialize the dictionary
+
+        Args:
+            base_folder: Base folder holding the user databases (the dictionary lives next to them)
+            synonyms_csv: CSV with ``alias,canonical`` rows seeding the synonym table
+        """
+        self.db_path = os.path.join(base_folder, self.DB_NAME)
+        self.synonyms_csv = synonyms_csv
+        self._ids: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self._synonyms: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if not os.path.exists(base_folder):
+            os.makedirs(base_folder)
+        self.create_database()
+        self.load()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30.0)
+
+    def create_database(self):
+        """Create the dictionary tables and seed the synonyms"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+            CREATE TABLE IF NOT EXISTS ingredients (
+                id INTEGER PRIMARY KEY,
+                canonical_name TEXT NOT NULL UNIQUE
+            )
+            """
+            )
+            conn.execute(
+                """
+            CREATE TABLE IF NOT EXISTS ingredient_synonyms (
+                alias TEXT PRIMARY KEY,
+                canonical_name TEXT NOT NULL
+            )
+            """
+            )
+            if self.synonyms_csv and os.path.exists(self.synonyms_csv):
+                with open(self.synonyms_csv, newline="", encoding="utf-8") as synonyms_file:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO ingredient_synonyms (alias, canonical_name) VALUES (?, ?)",
+                        [
+                            (normalize_ingredient_name(row["alias"]), normalize_ingredient_name(row["canonical"]))
+                            for row in csv.DictReader(synonyms_file)
+                        ],
+                    )
+        conn.close()
+
+    def load(self):
+        """Load every ID and synonym into memory"""
+        conn = self._connect()
+        ids = {name: ingredient_id for ingredient_id, name in conn.execute("SELECT id, canonical_name FROM ingredients")}
+        synonyms = dict(conn.execute("SELECT alias, canonical_name FROM ingredient_synonyms"))
+        conn.close()
+        with self._lock:
+            self._ids = ids
+            self._names = {ingredient_id: name for name, ingredient_id in ids.items()}
+            self._synonyms = synonyms
+
+    def canonical_name(self, name: str) -> str:
+        """Get the canonical name of an ingredient
+
+        Args:
+            name: Raw ingredient name
+
+        Returns:
+            Normalized name with synonyms resolved
+        """
+        key = normalize_ingredient_name(name)
+        return self._synonyms.get(key, key)
+
+    def lookup_id(self, name: str) -> Optional[int]:
+        """Get the ID of an ingredient without adding it
+
+        Args:
+            name: Raw ingredient name
+
+        Returns:
+            Ingredient ID, or None if the ingredient was never stored
+        """
+        return self._ids.get(self.canonical_name(name))
+
+    def get_id(self, name: str) -> Optional[int]:
+        """Get the ID of an ingredient, adding it to the dictionary if needed
+
+        Args:
+            name: Raw ingredient name
+
+        Returns:
+            Ingredient ID, or None if the name has no letters
+        """
+        key = self.canonical_name(name)
+        if not key:
+            return None
+        ingredient_id = self._ids.get(key)
+        if ingredient_id is not None:
+            return ingredient_id
+
+        with self._lock:
+            ingredient_id = self._ids.get(key)
+            if ingredient_id is None:
+                # INSERT OR IGNORE keeps IDs consistent when several processes intern the same name
+                conn = self._connect()
+                with conn:
+                    conn.execute("INSERT OR IGNORE INTO ingredients (canonical_name) VALUES (?)", (key,))
+                    ingredient_id = conn.execute(
+                        "SELECT id FROM ingredients WHERE canonical_name = ?", (key,)
+                    ).fetchone()[0]
+                conn.close()
+                self._ids[key] = ingredient_id
+                self._names[ingredient_id] = key
+        return ingredient_id
+
+    def get_ids(self, names: Iterable[str]) -> Dict[str, Optional[int]]:
+        """Get the IDs of several ingredients
+
+        Args:
+            names: Raw ingredient names
+
+        Returns:
+            Mapping of raw name to ingredient ID
+        """
+        return {name: self.get_id(name) for name in names}
+
+    def name_of(self, ingredient_id: int) -> Optional[str]:
+        """Get the canonical name of an ingredient ID
+
+        Args:
+            ingredient_id: Ingredient ID
+
+        Returns:
+            Canonical name, or None if the ID is unknown to this process
+        """
+        name = self._names.get(ingredient_id)
+        if name is None:
+            # Interned by another process since load()
+            self.load()
+            name = self._names.get(ingredient_id)
+        return name
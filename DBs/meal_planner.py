@@ -0,0 +1,284 @@
+import itertools
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple, Union
+
+from refrigerator_db import RefrigeratorDB
+from cuisine_db import CuisineDB
+from eco_score import normalize_ingredient_name, parse_amount
+
+
+# Score for using one ingredient from the fridge that does not expire soon
+BASE_USE_SCORE = 1.0
+# Extra score for using an item that expires on the same day (decays with distance)
+URGENCY_SCORE = 10.0
+# Penalty for every ingredient that has to be bought
+PURCHASE_PENALTY = 2.0
+# Number of best first-day candidates explored one day further
+LOOKAHEAD_WIDTH = 8
+
+
+def parse_expiry(expiry_date) -> Optional[date]:
+    """Parse an expiry date stored as text (ISO format, time part ignored)
+
+    Args:
+        expiry_date: Stored expiry date or None
+
+    Returns:
+        The date, or None if missing or unparsable
+    """
+    if not expiry_date:
+        return None
+    try:
+        return date.fromisoformat(str(expiry_date).strip()[:10])
+    except ValueError:
+        return None
+
+
+class MealPlanner:
+    """Plans cuisines for the next days so that expiring fridge items get used"""
+
+    def __init__(self, fridge_db: RefrigeratorDB, cuisine_db: CuisineDB):
+        """Initialize the planner
+
+        Args:
+            fridge_db: Refrigerator database handler
+            cuisine_db: Cuisine database handler
+        """
+        self.fridge_db = fridge_db
+        self.cuisine_db = cuisine_db
+
+    def match_key(self, name: str) -> Union[int, str]:
+        """Get the key fridge items and recipe ingredients are matched on
+
+        Args:
+            name: Raw item or ingredient name
+
+        Returns:
+            The ingredient ID when an ingredient dictionary is set and knows
+            the name (so synonyms match), otherwise the normalized name
+        """
+        dictionary = self.fridge_db.ingredient_dictionary
+        if dictionary is not None:
+            ingredient_id = dictionary.lookup_id(name)
+            if ingredient_id is not None:
+                return ingredient_id
+        return normalize_ingredient_name(name)
+
+    def load_stock(self, user_id: int, today: date) -> Dict[str, List]:
+        """Load the fridge as lots grouped by matching key
+
+        Args:
+            user_id: Telegram user ID
+            today: First day of the plan (already expired items are dropped)
+
+        Returns:
+            Mapping of matching key (see ``match_key``) to lots ``[quantity, unit, expiry, display name]``
+            sorted by expiry (items without expiry last)
+        """
+        stock: Dict[str, List] = {}
+        for item in self.fridge_db.get_refrigerator_items(user_id):
+            _, item_name, quantity, unit, expiry_date, _ = item
+            expiry = parse_expiry(expiry_date)
+            if expiry is not None and expiry < today:
+                continue
+            lots = stock.setdefault(self.match_key(item_name), [])
+            lots.append([float(quantity or 0), (unit or "").lower(), expiry, item_name])
+
+        for lots in stock.values():
+            lots.sort(key=lambda lot: (lot[2] is None, lot[2] or today))
+        return stock
+
+    def load_recipes(self, user_id: int) -> Dict[str, List[Tuple[str, Optional[float], str, str]]]:
+        """Load the ingredients of every cuisine once
+
+        Cuisines without ingredients are skipped, since their score of 0
+        would beat every cuisine that needs something bought.
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Mapping of cuisine name to ``(matching key, amount, unit, display name)``
+        """
+        recipes = {}
+        for cuisine in self.cuisine_db.get_cuisines(user_id):
+            cuisine_name = cuisine[1]
+            ingredients = self.cuisine_db.get_cuisine_ingredients(user_id, cuisine_name)
+            if not ingredients:
+                continue
+            recipes[cuisine_name] = [
+                (
+                    self.match_key(ingredient[1]),
+                    parse_amount(ingredient[2]),
+                    (ingredient[3] or "").lower(),
+                    ingredient[1],
+                )
+                for ingredient in ingredients
+            ]
+        return recipes
+
+    @staticmethod
+    def available_lots(lots: List, day: date) -> List:
+        """Filter lots that still have stock and are not expired on a day
+
+        Args:
+            lots: Lots of one item (see ``load_stock``)
+            day: Day the item would be used
+
+        Returns:
+            Usable lots, soonest expiring first
+        """
+        return [lot for lot in lots if lot[0] > 0 and (lot[2] is None or lot[2] >= day)]
+
+    @classmethod
+    def ingredient_value(cls, lots: List, day: date) -> float:
+        """Score using an ingredient on a day given its lots
+
+        Args:
+            lots: Lots of the ingredient (see ``load_stock``)
+            day: Day the ingredient would be used
+
+        Returns:
+            Positive score if the fridge has it (higher when it expires
+            sooner), or the purchase penalty if it has to be bought
+        """
+        usable = cls.available_lots(lots, day)
+        if not usable:
+            return -PURCHASE_PENALTY
+        expiry = usable[0][2]
+        if expiry is None:
+            return BASE_USE_SCORE
+        return BASE_USE_SCORE + URGENCY_SCORE / ((expiry - day).days + 1)
+
+    @classmethod
+    def consume(cls, recipe, stock: Dict[str, List], day: date) -> Tuple[List[str], List[str]]:
+        """Take a recipe's ingredients out of the stock
+
+        Args:
+            recipe: Ingredients as returned by ``load_recipes``
+            stock: Lots by matching key, modified in place
+            day: Day the recipe is cooked
+
+        Returns:
+            Tuple of (fridge items used, ingredients to buy)
+        """
+        used = []
+        missing = []
+        for name, amount, unit, display_name in recipe:
+            lots = cls.available_lots(stock.get(name, ()), day)
+            if not lots:
+                missing.append(display_name)
+                continue
+
+            lot = lots[0]
+            used.append(lot[3])
+            # Amounts can only be subtracted when units agree; otherwise the lot is used up
+            if amount is None or unit != lot[1]:
+                lot[0] = 0
+                continue
+            needed = amount
+            for candidate in lots:
+                if candidate[1] != unit:
+                    continue
+                taken = min(candidate[0], needed)
+                candidate[0] -= taken
+                needed -= taken
+                if needed <= 0:
+                    break
+        return used, missing
+
+    def plan(self, user_id: int, days: int = 7, today: Optional[date] = None) -> List[Dict]:
+        """Pick one cuisine per day for the next days
+
+        A greedy search with one day of lookahead: every cuisine is scored
+        for the current day, the best ``LOOKAHEAD_WIDTH`` candidates are
+        re-scored with the best follow-up cuisine of the next day, and the
+        winner is committed. A cuisine's score is the sum of its
+        ingredients' scores, which are memoized per (ingredient, day,
+        stock version) so only ingredients touched by a choice are rescored.
+
+        Args:
+            user_id: Telegram user ID
+            days: Number of days to plan
+            today: First day of the plan (defaults to today)
+
+        Returns:
+            One dictionary per day with the date, cuisine name, used fridge
+            items and ingredients to buy
+        """
+        today = today or date.today()
+        recipes = self.load_recipes(user_id)
+        if not recipes:
+            return []
+        stock = self.load_stock(user_id, today)
+        recipe_names = {
+            cuisine_name: [name for name, _, _, _ in recipe]
+            for cuisine_name, recipe in recipes.items()
+        }
+
+        # Every change of an item's lots gets a fresh version number
+        versions: Dict[str, int] = {}
+        version_counter = itertools.count(1)
+        memo: Dict[Tuple, float] = {}
+
+        def score(cuisine_name: str, day: date) -> float:
+            total = 0.0
+            for name in recipe_names[cuisine_name]:
+                key = (name, day, versions.get(name, 0))
+                value = memo.get(key)
+                if value is None:
+                    value = memo[key] = self.ingredient_value(stock.get(name, ()), day)
+                total += value
+            return total
+
+        def cook(cuisine_name: str, day: date):
+            saved = {}
+            for name in recipe_names[cuisine_name]:
+                if name in stock and name not in saved:
+                    saved[name] = ([list(lot) for lot in stock[name]], versions.get(name, 0))
+                    versions[name] = next(version_counter)
+            result = self.consume(recipes[cuisine_name], stock, day)
+            return result, saved
+
+        def undo(saved):
+            for name, (lots, version) in saved.items():
+                stock[name] = lots
+                versions[name] = version
+
+        plan = []
+        planned = set()
+        for offset in range(days):
+            day = today + timedelta(days=offset)
+            # Avoid repeating a cuisine until all of them were planned once
+            if len(planned) >= len(recipes):
+                planned.clear()
+            candidates = [name for name in recipes if name not in planned]
+
+            ranked = sorted(candidates, key=lambda name: score(name, day), reverse=True)
+            best_name = ranked[0]
+            if offset + 1 < days and len(recipes) > 1:
+                next_day = day + timedelta(days=1)
+                best_total = None
+                for name in ranked[:LOOKAHEAD_WIDTH]:
+                    first = score(name, day)
+                    _, saved = cook(name, day)
+                    # The next day only picks from cuisines that were not planned yet
+                    others = [other for other in candidates if other != name]
+                    if not others:
+                        others = [other for other in recipes if other != name]
+                    follow_up = max(score(other, next_day) for other in others)
+                    undo(saved)
+                    if best_total is None or first + follow_up > best_total:
+                        best_name, best_total = name, first + follow_up
+
+            (used, missing), _ = cook(best_name, day)
+            planned.add(best_name)
+            plan.append(
+                {
+                    "date": day,
+                    "cuisine_name": best_name,
+                    "uses": used,
+                    "buy": missing,
+                }
+            )
+        return plan
@@ -1,22 +1,218 @@
 import sqlite3
 import os
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, List, Set, Tuple, Optional
+
+from cold_storage import ColdStorage
+from db_rows import ColumnBatch, FridgeItem
+from ingredient_dictionary import (
+    IngredientDictionary,
+    ensure_ingredient_id_column,
+    normalize_ingredient_name,
+)
+from user_registry import UserRegistry
+
+
+# Items with equal values of these expressions are merged into one row
+MERGE_KEY = "item_key, lower(COALESCE(unit, '')), COALESCE(expiry_date, '')"
+
+# Database files whose merge key was checked by this process
+_merged_paths: Set[str] = set()
+
+# Stored quantities are rounded to this many decimals (1.5 liters, 0.25 kg)
+QUANTITY_DECIMALS = 3
+
+
+def normalize_quantity(quantity) -> float:
+    """Round a quantity to the stored precision
+
+    Whole numbers come back as ``int``, so they are stored, listed and
+    exported as "2" rather than "2.0". The quantity column has numeric
+    affinity (declared ``NUMERIC``, or ``INTEGER`` in older databases,
+    which SQLite treats the same way), so fractional values are kept as
+    REAL and whole ones as INTEGER.
+
+    Args:
+        quantity: Quantity as a number
+
+    Returns:
+        Rounded quantity
+    """
+    rounded = round(float(quantity), QUANTITY_DECIMALS)
+    if rounded.is_integer():
+        return int(rounded)
+    return rounded
+
+
+def format_quantity(quantity) -> str:
+    """Format a stored quantity for messages
+
+    Args:
+        quantity: Quantity as stored (int or float)
+
+    Returns:
+        "2", "1.5", "0.125"
+    """
+    return str(normalize_quantity(quantity or 0))
+
+
+def get_item_key(item_name: str) -> str:
+    """Get the key under which an item is merged with earlier additions
+
+    Args:
+        item_name: Name of the item
+
+    Returns:
+        Normalized item name ("Tomatoes " and "tomato" share a key)
+    """
+    return normalize_ingredient_name(item_name) or item_name.strip().lower()
+
+
+def compact_items(conn: sqlite3.Connection) -> int:
+    """Merge duplicate refrigerator rows into one row per merge key
+
+    The oldest row of each group is kept with the summed quantity and the
+    latest added date. Must run inside a transaction.
+
+    Args:
+        conn: Connection to a refrigerator database
+
+    Returns:
+        Number of rows removed
+    """
+    groups: Dict[Tuple, List[Tuple]] = {}
+    for row in conn.execute(
+        f"""
+    SELECT id, quantity, added_date, {MERGE_KEY}
+    FROM refrigerator_items
+    WHERE item_key IS NOT NULL
+    ORDER BY id
+    """
+    ):
+        groups.setdefault(row[3:], []).append(row[:3])
+
+    merged = []
+    removed = []
+    for rows in groups.values():
+        if len(rows) > 1:
+            total = normalize_quantity(sum(quantity or 0 for _, quantity, _ in rows))
+            last_added = max((added_date for _, _, added_date in rows if added_date), default=None)
+            merged.append((total, last_added, rows[0][0]))
+            removed.extend((item_id,) for item_id, _, _ in rows[1:])
+
+    conn.executemany(
+        "UPDATE refrigerator_items SET quantity = ?, added_date = COALESCE(?, added_date) WHERE id = ?",
+        merged,
+    )
+    conn.executemany("DELETE FROM refrigerator_items WHERE id = ?", removed)
+    return len(removed)
+
+
+def ensure_merge_key(db_path: str, exists: Optional[bool] = None) -> int:
+    """Upgrade a refrigerator database to merged inventory
+
+    Adds and fills the ``item_key`` column, compacts the duplicates and
+    creates the unique merge index. Runs once per database file and
+    process; databases that already have the index are left alone.
+
+    Args:
+        db_path: Path to the refrigerator database
+        exists: Whether the file exists, if already known (e.g. from the registry);
+            checked on disk when None
+
+    Returns:
+        Number of duplicate rows removed
+    """
+    if db_path in _merged_paths:
+        return 0
+    if not (os.path.exists(db_path) if exists is None else exists):
+        return 0
+
+    conn = sqlite3.connect(db_path, timeout=30.0, isolation_level=None)
+    removed = 0
+    try:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(refrigerator_items)")]
+        if not columns:
+            # Table not created yet; its CREATE TABLE already has the column
+            return 0
+        has_index = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_refrigerator_items_merge_key'"
+        ).fetchone()
+        if not has_index:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if "item_key" not in columns:
+                    conn.execute("ALTER TABLE refrigerator_items ADD COLUMN item_key TEXT")
+                names = [
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT DISTINCT item_name FROM refrigerator_items WHERE item_key IS NULL"
+                    )
+                ]
+                conn.executemany(
+                    "UPDATE refrigerator_items SET item_key = ? WHERE item_name = ? AND item_key IS NULL",
+                    [(get_item_key(name), name) for name in names],
+                )
+                removed = compact_items(conn)
+                conn.execute(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS idx_refrigerator_items_merge_key "
+                    f"ON refrigerator_items ({MERGE_KEY})"
+                )
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.close()
+    _merged_paths.add(db_path)
+    return removed
 
 
 class RefrigeratorDB:
     """Database handler for user refrigerators"""
 
-    def __init__(self, base_folder: str = "user_databases"):
+    def __init__(
+        self,
+        base_folder: str = "user_databases",
+        cold_storage: Optional[ColdStorage] = None,
+        ingredient_dictionary: Optional[IngredientDictionary] = None,
+        registry: Optional[UserRegistry] = None,
+    ):
         """Initialize the database handler
 
         Args:
             base_folder: Base folder to store user databases
+            cold_storage: Restores archived users on access and records activity (optional)
+            ingredient_dictionary: Assigns ingredient IDs to stored items (optional)
+            registry: Answers existence checks from memory instead of the filesystem (optional)
         """
         self.base_folder = base_folder
+        self.cold_storage = cold_storage
+        self.ingredient_dictionary = ingredient_dictionary
+        self.registry = registry
+        # Callbacks run after a user's items change
+        self.change_listeners: List[Callable[[int], None]] = []
         # Create the base database folder if it doesn't exist
         if not os.path.exists(self.base_folder):
             os.makedirs(self.base_folder)
 
+    def add_change_listener(self, listener: Callable[[int], None]):
+        """Register a callback run after a user's refrigerator items change
+
+        Args:
+            listener: Callable taking the user ID
+        """
+        self.change_listeners.append(listener)
+
+    def notify_items_changed(self, user_id: int):
+        """Run the registered change listeners for a user's refrigerator
+
+        Args:
+            user_id: Telegram user ID
+        """
+        for listener in self.change_listeners:
+            listener(user_id)
+
     def get_user_folder(self, user_id: int) -> str:
         """Get the user's personal folder path
 
@@ -26,6 +222,10 @@ class RefrigeratorDB:
         Returns:
             Path to the user's personal folder
         """
+        if self.cold_storage is not None:
+            self.cold_storage.ensure_available(user_id)
+        elif self.registry is not None:
+            self.registry.touch(user_id)
         return os.path.join(self.base_folder, f"user_{user_id}")
 
     def create_user_folder(self, user_id: int) -> bool:
@@ -37,11 +237,17 @@ class RefrigeratorDB:
         Returns:
             True if created, False if already exists
         """
+        if self.registry is not None and self.registry.has_folder(user_id):
+            return False
+
         user_folder = self.get_user_folder(user_id)
+        created = False
         if not os.path.exists(user_folder):
             os.makedirs(user_folder)
-            return True
-        return False
+            created = True
+        if self.registry is not None:
+            self.registry.register_folder(user_id, os.path.basename(user_folder))
+        return created
 
     def get_db_path(self, user_id: int) -> str:
         """Get the database path for a specific user
@@ -53,7 +259,15 @@ class RefrigeratorDB:
             Path to the user's refrigerator database file
         """
         user_folder = self.get_user_folder(user_id)
-        return os.path.join(user_folder, "refrigerator.db")
+        db_path = os.path.join(user_folder, "refrigerator.db")
+        exists = self.registry.has_refrigerator(user_id) if self.registry is not None else None
+        # Databases created before ingredient IDs get the column on first use
+        ensure_ingredient_id_column(
+            db_path, "refrigerator_items", "item_name", self.ingredient_dictionary, exists
+        )
+        # Databases created before merged inventory are compacted on first use
+        ensure_merge_key(db_path, exists)
+        return db_path
 
     def create_user_refrigerator(self, user_id: int) -> bool:
         """Create a new refrigerator database for a user
@@ -70,7 +284,7 @@ class RefrigeratorDB:
         db_path = self.get_db_path(user_id)
 
         # Check if database already exists
-        if os.path.exists(db_path):
+        if self.user_has_refrigerator(user_id):
             return False
 
         # Create new database
@@ -83,13 +297,23 @@ class RefrigeratorDB:
         CREATE TABLE IF NOT EXISTS refrigerator_items (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             item_name TEXT NOT NULL,
-            quantity INTEGER DEFAULT 1,
+            quantity NUMERIC DEFAULT 1,
             unit TEXT DEFAULT 'pieces',
             expiry_date TEXT,
-            added_date DATETIME DEFAULT CURRENT_TIMESTAMP
+            added_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+            ingredient_id INTEGER,
+            item_key TEXT
         )
         """
         )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_refrigerator_items_ingredient_id "
+            "ON refrigerator_items (ingredient_id)"
+        )
+        cursor.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS idx_refrigerator_items_merge_key "
+            f"ON refrigerator_items ({MERGE_KEY})"
+        )
 
         # Create user info table
         cursor.execute(
@@ -106,6 +330,9 @@ class RefrigeratorDB:
 
         conn.commit()
         conn.close()
+
+        if self.registry is not None:
+            self.registry.register_refrigerator(user_id)
         return True
 
     def user_has_refrigerator(self, user_id: int) -> bool:
@@ -117,24 +344,28 @@ class RefrigeratorDB:
         Returns:
             True if user has a refrigerator, False otherwise
         """
+        if self.registry is not None:
+            return self.registry.has_refrigerator(user_id)
         db_path = self.get_db_path(user_id)
         return os.path.exists(db_path)
 
-    def get_refrigerator_items(self, user_id: int) -> List[Tuple]:
+    def get_refrigerator_items(self, user_id: int) -> List[FridgeItem]:
         """Get all items from user's refrigerator
 
         Args:
             user_id: Telegram user ID
 
         Returns:
-            List of tuples containing item information
+            List of FridgeItem rows (unpack like the former
+            ``(id, item_name, quantity, unit, expiry_date, added_date)`` tuples)
         """
         db_path = self.get_db_path(user_id)
 
-        if not os.path.exists(db_path):
+        if not self.user_has_refrigerator(user_id):
             return []
 
         conn = sqlite3.connect(db_path)
+        conn.row_factory = FridgeItem.row_factory
         cursor = conn.cursor()
 
         cursor.execute(
@@ -150,6 +381,91 @@ class RefrigeratorDB:
 
         return items
 
+    def get_refrigerator_columns(self, user_id: int) -> ColumnBatch:
+        """Get all items from user's refrigerator as columns
+
+        For bulk consumers that scan whole columns instead of handling
+        one item at a time.
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            ColumnBatch with the columns of ``get_refrigerator_items``
+            ("id" and "quantity" as numeric arrays)
+        """
+        batch = ColumnBatch(
+            [
+                ("id", "q"),
+                ("item_name", None),
+                ("quantity", "d"),
+                ("unit", None),
+                ("expiry_date", None),
+                ("added_date", None),
+            ]
+        )
+        db_path = self.get_db_path(user_id)
+
+        if not self.user_has_refrigerator(user_id):
+            return batch
+
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = batch.row_factory
+        cursor = conn.execute(
+            """
+        SELECT id, item_name, COALESCE(quantity, 0), unit, expiry_date, added_date
+        FROM refrigerator_items
+        ORDER BY added_date DESC
+        """
+        )
+        batch.fetch(cursor)
+        conn.close()
+
+        return batch
+
+    def build_add_item_statement(
+        self,
+        item_name: str,
+        quantity: int = 1,
+        unit: str = "pieces",
+        expiry_date: Optional[str] = None,
+    ) -> Tuple[str, Tuple]:
+        """Build the statement that adds an item to a refrigerator
+
+        An item with the same name, unit and expiry date as an existing
+        one is added to its quantity instead of creating a second row.
+
+        Args:
+            item_name: Name of the item
+            quantity: Quantity of the item
+            unit: Unit of measurement
+            expiry_date: Expiry date (optional)
+
+        Returns:
+            Tuple of (SQL, parameters)
+        """
+        ingredient_id = None
+        if self.ingredient_dictionary is not None:
+            ingredient_id = self.ingredient_dictionary.get_id(item_name)
+        return (
+            f"""
+        INSERT INTO refrigerator_items (item_name, quantity, unit, expiry_date, ingredient_id, item_key)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT ({MERGE_KEY}) DO UPDATE SET
+            quantity = round(quantity + excluded.quantity, {QUANTITY_DECIMALS}),
+            added_date = CURRENT_TIMESTAMP,
+            ingredient_id = COALESCE(ingredient_id, excluded.ingredient_id)
+        """,
+            (
+                item_name,
+                normalize_quantity(quantity),
+                unit,
+                expiry_date,
+                ingredient_id,
+                get_item_key(item_name),
+            ),
+        )
+
     def add_item_to_refrigerator(
         self,
         user_id: int,
@@ -172,24 +488,114 @@ class RefrigeratorDB:
         """
         db_path = self.get_db_path(user_id)
 
-        if not os.path.exists(db_path):
+        if not self.user_has_refrigerator(user_id):
             return False
 
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
 
         cursor.execute(
-            """
-        INSERT INTO refrigerator_items (item_name, quantity, unit, expiry_date)
-        VALUES (?, ?, ?, ?)
-        """,
-            (item_name, quantity, unit, expiry_date),
+            *self.build_add_item_statement(item_name, quantity, unit, expiry_date)
         )
 
         conn.commit()
         conn.close()
+        self.notify_items_changed(user_id)
         return True
 
+    def consume_items(
+        self,
+        user_id: int,
+        requirements: List[Tuple[str, float, str]],
+        normalize: Callable[[str], str] = lambda name: name.strip().lower(),
+    ) -> Optional[Dict[str, List[Tuple]]]:
+        """Take quantities out of the refrigerator in a single transaction
+
+        Matching items are consumed soonest-expiring first. Rows that reach
+        zero are deleted, the others are decremented. The write lock is
+        taken before reading, so concurrent updates cannot interleave.
+        With an ingredient dictionary items are matched by ingredient ID
+        and ``normalize`` is not used.
+
+        Args:
+            user_id: Telegram user ID
+            requirements: List of (item_name, quantity, unit) to consume
+            normalize: Function mapping item names to a matching key
+
+        Returns:
+            Dictionary with "consumed" (item_name, quantity, unit) and
+            "missing" (item_name, quantity, unit) lists, or None if the
+            user has no refrigerator
+        """
+        db_path = self.get_db_path(user_id)
+
+        if not self.user_has_refrigerator(user_id):
+            return None
+
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        cursor = conn.cursor()
+
+        if self.ingredient_dictionary is not None:
+            normalize = self.ingredient_dictionary.lookup_id
+
+        consumed = []
+        missing = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                """
+            SELECT id, item_name, quantity, unit, ingredient_id
+            FROM refrigerator_items
+            ORDER BY expiry_date IS NULL, expiry_date, id
+            """
+            )
+
+            # Remaining stock by (matching key, unit), soonest expiring first
+            stock: Dict[Tuple, List[List]] = {}
+            for item_id, item_name, quantity, unit, ingredient_id in cursor.fetchall():
+                if self.ingredient_dictionary is None or ingredient_id is None:
+                    ingredient_id = normalize(item_name)
+                if ingredient_id is None:
+                    continue
+                key = (ingredient_id, (unit or "").lower())
+                stock.setdefault(key, []).append([item_id, item_name, quantity or 0])
+
+            remaining = {}
+            for item_name, quantity, unit in requirements:
+                needed = quantity
+                for lot in stock.get((normalize(item_name), (unit or "").lower()), ()):
+                    if needed <= 0:
+                        break
+                    if lot[2] <= 0:
+                        continue
+                    taken = normalize_quantity(min(lot[2], needed))
+                    lot[2] = normalize_quantity(lot[2] - taken)
+                    needed = normalize_quantity(needed - taken)
+                    remaining[lot[0]] = lot[2]
+                    consumed.append((lot[1], taken, unit))
+                if needed > 0:
+                    missing.append((item_name, normalize_quantity(needed), unit))
+
+            cursor.executemany(
+                "DELETE FROM refrigerator_items WHERE id = ?",
+                [(item_id,) for item_id, quantity in remaining.items() if quantity <= 0],
+            )
+            cursor.executemany(
+                "UPDATE refrigerator_items SET quantity = ? WHERE id = ?",
+                [(quantity, item_id) for item_id, quantity in remaining.items() if quantity > 0],
+            )
+            cursor.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        if consumed:
+            self.notify_items_changed(user_id)
+        return {"consumed": consumed, "missing": missing}
+
     def remove_item_from_refrigerator(self, user_id: int, item_id: int) -> bool:
         """Remove an item from user's refrigerator
 
@@ -202,7 +608,7 @@ class RefrigeratorDB:
         """
         db_path = self.get_db_path(user_id)
 
-        if not os.path.exists(db_path):
+        if not self.user_has_refrigerator(user_id):
             return False
 
         conn = sqlite3.connect(db_path)
@@ -214,6 +620,8 @@ class RefrigeratorDB:
         affected_rows = cursor.rowcount
         conn.close()
 
+        if affected_rows > 0:
+            self.notify_items_changed(user_id)
         return affected_rows > 0
 
     def save_user_info(
@@ -233,7 +641,7 @@ class RefrigeratorDB:
         """
         db_path = self.get_db_path(user_id)
 
-        if not os.path.exists(db_path):
+        if not self.user_has_refrigerator(user_id):
             return
 
         conn = sqlite3.connect(db_path)
@@ -249,3 +657,18 @@ class RefrigeratorDB:
 
         conn.commit()
         conn.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: python refrigerator_db.py [base_folder]  (compacts every refrigerator once)
+    folder = sys.argv[1] if len(sys.argv) > 1 else "user_databases"
+    compacted = 0
+    total_removed = 0
+    for entry in os.scandir(folder):
+        db_path = os.path.join(entry.path, "refrigerator.db")
+        if entry.is_dir() and entry.name.startswith("user_") and os.path.exists(db_path):
+            total_removed += ensure_merge_key(db_path)
+            compacted += 1
+    print(f"Compacted {compacted} refrigerators, removed {total_removed} duplicate rows")
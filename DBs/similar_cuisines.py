@@ -0,0 +1,457 @@
+import array
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cuisine_db import CuisineDB
+from ingredient_dictionary import normalize_ingredient_name
+
+
+# Mersenne prime used for the universal hash family of the MinHash permutations
+MERSENNE_PRIME = (1 << 61) - 1
+# Fixed seed so signatures stay comparable across processes and restarts
+PERMUTATION_SEED = b"ecocuisine-minhash"
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class SimilarCuisineIndex:
+    """MinHash/LSH index of cuisine ingredient sets
+
+    Every cuisine is reduced to a MinHash signature of its ingredient
+    set. CuisineDB changes only queue an update; the queue is written in
+    one transaction per ``flush`` (periodically from a background thread,
+    and before a lookup), so ingredient writes never wait for the shared
+    index file. Since the signature is an elementwise minimum, added
+    ingredients are folded into the stored signature; only other changes
+    read the whole cuisine again. The signature is cut into bands and
+    each band hashed into a bucket; cuisines sharing a bucket in any band
+    are candidates, so a lookup only compares against a handful of
+    cuisines instead of all of them. With the default 16 bands of 4 rows,
+    cuisines with a Jaccard similarity above ~0.5 are very likely to be
+    found.
+    """
+
+    def __init__(
+        self,
+        cuisine_db: CuisineDB,
+        db_path: Optional[str] = None,
+        num_perm: int = 64,
+        bands: int = 16,
+    ):
+        """Initialize the index
+
+        Args:
+            cuisine_db: Cuisine database handler (its change listeners keep the index current)
+            db_path: Path to the index database (defaults to the base folder)
+            num_perm: Number of MinHash permutations
+            bands: Number of LSH bands (must divide num_perm)
+        """
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        self.cuisine_db = cuisine_db
+        self.db_path = db_path or os.path.join(cuisine_db.base_folder, "similar_cuisines.db")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self._permutations = self._make_permutations(num_perm)
+        # (user_id, cuisine_name) -> added ingredient names, or None for a full recompute
+        self._pending: Dict[Tuple[int, str], Optional[List[str]]] = {}
+        self._pending_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.stats = {"queued": 0, "flushes": 0, "written": 0}
+        self.create_database()
+        cuisine_db.add_change_listener(self.update_cuisine)
+
+    @staticmethod
+    def _make_permutations(num_perm: int) -> List[Tuple[int, int]]:
+        permutations = []
+        for index in range(num_perm):
+            digest = hashlib.blake2b(PERMUTATION_SEED + index.to_bytes(4, "big"), digest_size=16).digest()
+            a = int.from_bytes(digest[:8], "big") % (MERSENNE_PRIME - 1) + 1
+            b = int.from_bytes(digest[8:], "big") % MERSENNE_PRIME
+            permutations.append((a, b))
+        return permutations
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30.0)
+
+    def create_database(self):
+        """Create the index tables if they don't exist"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+            CREATE TABLE IF NOT EXISTS signatures (
+                user_id INTEGER NOT NULL,
+                cuisine_name TEXT NOT NULL,
+                ingredient_count INTEGER NOT NULL,
+                signature BLOB NOT NULL,
+                PRIMARY KEY (user_id, cuisine_name)
+            )
+            """
+            )
+            conn.execute(
+                """
+            CREATE TABLE IF NOT EXISTS lsh_buckets (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                cuisine_name TEXT NOT NULL
+            )
+            """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_lsh_buckets_band_bucket ON lsh_buckets (band, bucket)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_lsh_buckets_cuisine ON lsh_buckets (user_id, cuisine_name)"
+            )
+            conn.execute(
+                """
+            CREATE TABLE IF NOT EXISTS sharing (
+                user_id INTEGER PRIMARY KEY,
+                shared INTEGER NOT NULL DEFAULT 0
+            )
+            """
+            )
+        conn.close()
+
+    def ingredient_key(self, ingredient_name: str) -> str:
+        """Get the key an ingredient is hashed by (canonical name when a dictionary is set)
+
+        Args:
+            ingredient_name: Raw ingredient name
+
+        Returns:
+            Canonical ingredient key
+        """
+        dictionary = self.cuisine_db.ingredient_dictionary
+        if dictionary is not None:
+            return dictionary.canonical_name(ingredient_name)
+        return normalize_ingredient_name(ingredient_name)
+
+    def compute_signature(
+        self, ingredient_names: Iterable[str], signature: Optional[array.array] = None
+    ) -> Optional[array.array]:
+        """Compute the MinHash signature of an ingredient set
+
+        Args:
+            ingredient_names: Raw ingredient names
+            signature: Signature of ingredients already in the set, to fold the names into
+
+        Returns:
+            Array of ``num_perm`` minimum hash values, or None for an empty set
+        """
+        hashes = {_hash64(key) for key in map(self.ingredient_key, ingredient_names) if key}
+        if not hashes:
+            return signature
+        minimums = array.array("Q")
+        for a, b in self._permutations:
+            minimums.append(min((a * value + b) % MERSENNE_PRIME for value in hashes))
+        if signature is None:
+            return minimums
+        return array.array("Q", map(min, signature, minimums))
+
+    def band_buckets(self, signature: array.array) -> List[Tuple[int, int]]:
+        """Hash every band of a signature into a bucket
+
+        Args:
+            signature: MinHash signature
+
+        Returns:
+            List of (band, bucket)
+        """
+        buckets = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows_per_band:(band + 1) * self.rows_per_band]
+            digest = hashlib.blake2b(rows.tobytes(), digest_size=8).digest()
+            buckets.append((band, int.from_bytes(digest, "big", signed=True)))
+        return buckets
+
+    def update_cuisine(
+        self, user_id: int, cuisine_name: str, added_ingredients: Optional[List[str]] = None
+    ):
+        """Queue a signature update for one cuisine
+
+        Registered as a CuisineDB change listener, so it only records the
+        change; ``flush`` writes the queued updates in one transaction.
+        Added ingredients are folded into the stored signature; without
+        them (or without a stored signature) the signature is recomputed
+        from all ingredients.
+
+        Args:
+            user_id: Telegram user ID
+            cuisine_name: Name of the cuisine
+            added_ingredients: Names of the ingredients added, if that is all that changed
+        """
+        key = (user_id, cuisine_name)
+        with self._pending_lock:
+            if key in self._pending:
+                queued = self._pending[key]
+                # A full recompute covers every other change
+                if queued is None or added_ingredients is None:
+                    self._pending[key] = None
+                else:
+                    queued.extend(added_ingredients)
+            else:
+                self._pending[key] = None if added_ingredients is None else list(added_ingredients)
+            self.stats["queued"] += 1
+
+    def flush(self) -> int:
+        """Write every queued signature update in one transaction
+
+        Returns:
+            Number of cuisines written
+        """
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        conn = self._connect()
+        try:
+            updates = []
+            for (user_id, cuisine_name), added_ingredients in pending.items():
+                if added_ingredients is not None:
+                    row = conn.execute(
+                        "SELECT ingredient_count, signature FROM signatures WHERE user_id = ? AND cuisine_name = ?",
+                        (user_id, cuisine_name),
+                    ).fetchone()
+                    if row is not None:
+                        stored = array.array("Q")
+                        stored.frombytes(row[1])
+                        updates.append(
+                            (
+                                user_id,
+                                cuisine_name,
+                                row[0] + len(added_ingredients),
+                                self.compute_signature(added_ingredients, stored),
+                            )
+                        )
+                        continue
+
+                ingredient_names = self.cuisine_db.get_cuisine_ingredient_columns(user_id, cuisine_name)[
+                    "ingredient_name"
+                ]
+                updates.append(
+                    (user_id, cuisine_name, len(ingredient_names), self.compute_signature(ingredient_names))
+                )
+
+            with conn:
+                for update in updates:
+                    self._store(conn, *update)
+        except Exception:
+            # Keep the updates for the next flush; anything queued meanwhile is a newer change
+            with self._pending_lock:
+                for key in pending:
+                    self._pending[key] = None
+            raise
+        finally:
+            conn.close()
+
+        self.stats["flushes"] += 1
+        self.stats["written"] += len(updates)
+        return len(updates)
+
+    def _store(
+        self,
+        conn: sqlite3.Connection,
+        user_id: int,
+        cuisine_name: str,
+        ingredient_count: int,
+        signature: Optional[array.array],
+    ):
+        conn.execute("DELETE FROM lsh_buckets WHERE user_id = ? AND cuisine_name = ?", (user_id, cuisine_name))
+        if signature is None:
+            conn.execute("DELETE FROM signatures WHERE user_id = ? AND cuisine_name = ?", (user_id, cuisine_name))
+            return
+        conn.execute(
+            """
+        INSERT OR REPLACE INTO signatures (user_id, cuisine_name, ingredient_count, signature)
+        VALUES (?, ?, ?, ?)
+        """,
+            (user_id, cuisine_name, ingredient_count, signature.tobytes()),
+        )
+        conn.executemany(
+            "INSERT INTO lsh_buckets (band, bucket, user_id, cuisine_name) VALUES (?, ?, ?, ?)",
+            [(band, bucket, user_id, cuisine_name) for band, bucket in self.band_buckets(signature)],
+        )
+
+    def start(self, interval_seconds: float):
+        """Flush queued signature updates periodically in a background thread
+
+        Args:
+            interval_seconds: Seconds between flushes
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+
+        def loop():
+            while not self._stop_event.wait(interval_seconds):
+                try:
+                    self.flush()
+                except sqlite3.Error as error:
+                    print(f"Similar cuisines: flush failed, retrying next time: {error}")
+
+        self._thread = threading.Thread(target=loop, name="similar-cuisines", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and write what is still queued"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def index_user(self, user_id: int) -> int:
+        """Index every cuisine of a user
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Number of cuisines indexed
+        """
+        cuisines = self.cuisine_db.get_cuisines(user_id)
+        for cuisine in cuisines:
+            self.update_cuisine(user_id, cuisine[1])
+        self.flush()
+        return len(cuisines)
+
+    def set_sharing(self, user_id: int, shared: bool):
+        """Opt a user's cuisines in or out of other users' suggestions
+
+        Args:
+            user_id: Telegram user ID
+            shared: True to share
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+            INSERT INTO sharing (user_id, shared) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET shared = excluded.shared
+            """,
+                (user_id, int(shared)),
+            )
+        conn.close()
+
+    def is_sharing(self, user_id: int) -> bool:
+        """Check if a user shares their cuisines
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            True if the user opted in
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT shared FROM sharing WHERE user_id = ?", (user_id,)).fetchone()
+        conn.close()
+        return bool(row and row[0])
+
+    def find_similar(
+        self,
+        user_id: int,
+        cuisine_name: str,
+        limit: int = 5,
+        min_similarity: float = 0.2,
+        include_shared: bool = True,
+    ) -> List[Dict]:
+        """Find cuisines with ingredient sets similar to one of the user's cuisines
+
+        Args:
+            user_id: Telegram user ID
+            cuisine_name: Name of the cuisine to compare with
+            limit: Maximum number of results
+            min_similarity: Lowest estimated Jaccard similarity returned
+            include_shared: Also search cuisines of users who opted in to sharing
+
+        Returns:
+            List of dictionaries with "cuisine_name", "similarity" and
+            "own" (False for other users' cuisines), most similar first
+        """
+        # Lookups see every change queued in this process
+        self.flush()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT signature FROM signatures WHERE user_id = ? AND cuisine_name = ?",
+                (user_id, cuisine_name),
+            ).fetchone()
+            if row is None:
+                # Cuisines created before the index existed are indexed on first lookup
+                conn.close()
+                self.update_cuisine(user_id, cuisine_name)
+                self.flush()
+                conn = self._connect()
+                row = conn.execute(
+                    "SELECT signature FROM signatures WHERE user_id = ? AND cuisine_name = ?",
+                    (user_id, cuisine_name),
+                ).fetchone()
+                if row is None:
+                    return []
+            signature = array.array("Q")
+            signature.frombytes(row[0])
+
+            buckets = self.band_buckets(signature)
+            bucket_filter = " OR ".join("(b.band = ? AND b.bucket = ?)" for _ in buckets)
+            owner_filter = "b.user_id = ?"
+            if include_shared:
+                owner_filter += " OR b.user_id IN (SELECT user_id FROM sharing WHERE shared = 1)"
+            params = [value for bucket in buckets for value in bucket] + [user_id]
+            candidates = conn.execute(
+                f"""
+            SELECT DISTINCT s.user_id, s.cuisine_name, s.signature
+            FROM lsh_buckets AS b
+            JOIN signatures AS s ON s.user_id = b.user_id AND s.cuisine_name = b.cuisine_name
+            WHERE ({bucket_filter}) AND ({owner_filter})
+            """,
+                params,
+            ).fetchall()
+        finally:
+            conn.close()
+
+        results = []
+        for candidate_user, candidate_name, candidate_blob in candidates:
+            if candidate_user == user_id and candidate_name == cuisine_name:
+                continue
+            candidate = array.array("Q")
+            candidate.frombytes(candidate_blob)
+            similarity = sum(1 for x, y in zip(signature, candidate) if x == y) / self.num_perm
+            if similarity >= min_similarity:
+                results.append(
+                    {
+                        "cuisine_name": candidate_name,
+                        "similarity": similarity,
+                        "own": candidate_user == user_id,
+                    }
+                )
+        results.sort(key=lambda result: (result["similarity"], result["own"]), reverse=True)
+        return results[:limit]
+
+
+if __name__ == "__main__":
+    import sys
+
+    from ingredient_dictionary import IngredientDictionary
+
+    # Usage: python similar_cuisines.py [base_folder]  (indexes every user with a folder)
+    folder = sys.argv[1] if len(sys.argv) > 1 else "user_databases"
+    index = SimilarCuisineIndex(
+        CuisineDB(folder, ingredient_dictionary=IngredientDictionary(folder))
+    )
+    total = 0
+    for entry in os.scandir(folder):
+        if entry.is_dir() and entry.name.startswith("user_"):
+            total += index.index_user(int(entry.name[len("user_"):]))
+    print(f"Indexed {total} cuisines")
@@ -0,0 +1,111 @@
+import os
+import time
+
+import pytest
+
+from cold_storage import ColdStorage
+from cuisine_db import CuisineDB
+from refrigerator_db import RefrigeratorDB
+from user_registry import UserRegistry
+
+
+@pytest.fixture(params=["index", "registry"])
+def storage(request, tmp_path):
+    registry = UserRegistry(str(tmp_path), touch_interval=0.05) if request.param == "registry" else None
+    cold_storage = ColdStorage(str(tmp_path), touch_interval=0.05, registry=registry)
+    fridge_db = RefrigeratorDB(str(tmp_path), cold_storage=cold_storage, registry=registry)
+    cuisine_db = CuisineDB(str(tmp_path), cold_storage=cold_storage, registry=registry)
+    return cold_storage, fridge_db, cuisine_db
+
+
+def fill_user(fridge_db, cuisine_db, user_id):
+    fridge_db.create_user_refrigerator(user_id)
+    fridge_db.add_item_to_refrigerator(user_id, "egg", 6)
+    cuisine_db.create_cuisine_index_database(user_id)
+    cuisine_db.create_specific_cuisine_database(user_id, "Omelette")
+    cuisine_db.add_ingredient_to_cuisine(user_id, "Omelette", "egg", "3")
+
+
+def test_archive_packs_the_folder_into_one_file(storage):
+    cold_storage, fridge_db, cuisine_db = storage
+    fill_user(fridge_db, cuisine_db, 1)
+
+    assert cold_storage.archive_user(1) > 0
+
+    assert not os.path.exists(cold_storage.get_user_folder(1))
+    assert os.path.isfile(cold_storage.get_archive_path(1))
+    assert cold_storage.is_archived(1)
+
+
+def test_access_restores_transparently(storage):
+    cold_storage, fridge_db, cuisine_db = storage
+    fill_user(fridge_db, cuisine_db, 1)
+    cold_storage.archive_user(1)
+
+    items = fridge_db.get_refrigerator_items(1)
+
+    assert [(item.item_name, item.quantity) for item in items] == [("egg", 6)]
+    assert [ingredient[1] for ingredient in cuisine_db.get_cuisine_ingredients(1, "Omelette")] == ["egg"]
+    assert not cold_storage.is_archived(1)
+    assert not os.path.exists(cold_storage.get_archive_path(1))
+    assert cold_storage.restore_stats["restores"] == 1
+
+
+def test_restore_without_archive(storage):
+    cold_storage, fridge_db, cuisine_db = storage
+    fill_user(fridge_db, cuisine_db, 1)
+
+    assert cold_storage.restore_user(1) is False
+    assert cold_storage.restore_user(2) is False
+
+
+def test_archive_inactive_skips_recent_users(storage):
+    cold_storage, fridge_db, cuisine_db = storage
+    fill_user(fridge_db, cuisine_db, 1)
+    fill_user(fridge_db, cuisine_db, 2)
+    time.sleep(0.25)
+    fridge_db.get_refrigerator_items(2)
+
+    stats = cold_storage.archive_inactive(0.2)
+
+    assert stats["archived_users"] == 1
+    assert cold_storage.is_archived(1)
+    assert not cold_storage.is_archived(2)
+
+
+def test_archive_rechecks_activity(storage):
+    cold_storage, fridge_db, cuisine_db = storage
+    fill_user(fridge_db, cuisine_db, 1)
+    idle_before = time.time() - 60
+
+    assert cold_storage.archive_user(1, idle_before) is None
+    assert not cold_storage.is_archived(1)
+
+
+def test_idle_threshold_must_exceed_touch_interval(storage):
+    cold_storage = storage[0]
+
+    with pytest.raises(ValueError):
+        cold_storage.archive_inactive(cold_storage.touch_interval)
+
+
+def test_failed_restore_keeps_the_archive_and_cleans_up(storage):
+    cold_storage, fridge_db, cuisine_db = storage
+    fill_user(fridge_db, cuisine_db, 1)
+    cold_storage.archive_user(1)
+    archive_path = cold_storage.get_archive_path(1)
+    with open(archive_path, "rb") as archive_file:
+        data = archive_file.read()
+    with open(archive_path, "wb") as archive_file:
+        archive_file.write(data[: len(data) // 2])
+
+    with pytest.raises(Exception):
+        cold_storage.restore_user(1)
+
+    assert not [name for name in os.listdir(cold_storage.base_folder) if name.startswith(".restore_user_")]
+    assert cold_storage.is_archived(1)
+
+    with open(archive_path, "wb") as archive_file:
+        archive_file.write(data)
+    assert cold_storage.restore_user(1) is True
+    assert [item.item_name for item in fridge_db.get_refrigerator_items(1)] == ["egg"]
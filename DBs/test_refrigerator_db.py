@@ -0,0 +1,151 @@
+import sqlite3
+import threading
+
+import pytest
+
+from ingredient_dictionary import IngredientDictionary
+from refrigerator_db import RefrigeratorDB
+
+
+@pytest.fixture
+def fridge_db(tmp_path):
+    fridge_db = RefrigeratorDB(str(tmp_path))
+    fridge_db.create_user_refrigerator(1)
+    return fridge_db
+
+
+def stock(fridge_db, user_id=1):
+    return sorted(
+        (
+            (item.item_name, item.quantity, item.unit, item.expiry_date)
+            for item in fridge_db.get_refrigerator_items(user_id)
+        ),
+        key=lambda row: tuple("" if value is None else str(value) for value in row),
+    )
+
+
+def test_consume_takes_soonest_expiring_first(fridge_db):
+    fridge_db.add_item_to_refrigerator(1, "milk", 1, "l", "2030-01-05")
+    fridge_db.add_item_to_refrigerator(1, "milk", 1, "l", "2030-01-01")
+    fridge_db.add_item_to_refrigerator(1, "milk", 1, "l")
+
+    result = fridge_db.consume_items(1, [("Milk", 1.5, "L")])
+
+    assert result["missing"] == []
+    assert [quantity for _, quantity, _ in result["consumed"]] == [1, 0.5]
+    assert stock(fridge_db) == [("milk", 0.5, "l", "2030-01-05"), ("milk", 1, "l", None)]
+
+
+def test_consume_reports_missing_and_other_units(fridge_db):
+    fridge_db.add_item_to_refrigerator(1, "egg", 2)
+    fridge_db.add_item_to_refrigerator(1, "flour", 1, "kg")
+
+    result = fridge_db.consume_items(1, [("egg", 3, "pieces"), ("flour", 200, "g"), ("salt", 1, "pinch")])
+
+    assert result["consumed"] == [("egg", 2, "pieces")]
+    assert result["missing"] == [("egg", 1, "pieces"), ("flour", 200, "g"), ("salt", 1, "pinch")]
+    assert stock(fridge_db) == [("flour", 1, "kg", None)]
+
+
+def test_consume_without_refrigerator(tmp_path):
+    assert RefrigeratorDB(str(tmp_path)).consume_items(1, [("egg", 1, "pieces")]) is None
+
+
+def test_consume_matches_synonyms_with_dictionary(tmp_path):
+    fridge_db = RefrigeratorDB(str(tmp_path), ingredient_dictionary=IngredientDictionary(str(tmp_path)))
+    fridge_db.create_user_refrigerator(1)
+    fridge_db.add_item_to_refrigerator(1, "aubergine", 2)
+
+    result = fridge_db.consume_items(1, [("eggplant", 1, "pieces")])
+
+    assert result["missing"] == []
+    assert stock(fridge_db) == [("aubergine", 1, "pieces", None)]
+
+
+def test_concurrent_consumers_never_take_the_same_stock(fridge_db):
+    fridge_db.add_item_to_refrigerator(1, "egg", 10)
+    results = []
+
+    def cook():
+        results.append(fridge_db.consume_items(1, [("egg", 3, "pieces")]))
+
+    threads = [threading.Thread(target=cook) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    consumed = sum(quantity for result in results for _, quantity, _ in result["consumed"])
+    missing = sum(quantity for result in results for _, quantity, _ in result["missing"])
+    assert consumed == 10
+    assert missing == 5
+    assert stock(fridge_db) == []
+
+
+def test_consume_rolls_back_on_error(fridge_db):
+    fridge_db.add_item_to_refrigerator(1, "egg", 2)
+    fridge_db.add_item_to_refrigerator(1, "milk", 1, "l")
+    db_path = fridge_db.get_db_path(1)
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        """
+    CREATE TRIGGER refuse_milk BEFORE DELETE ON refrigerator_items
+    WHEN old.item_name = 'milk'
+    BEGIN SELECT RAISE(ABORT, 'refused'); END
+    """
+    )
+    conn.commit()
+    conn.close()
+
+    with pytest.raises(sqlite3.Error):
+        fridge_db.consume_items(1, [("egg", 2, "pieces"), ("milk", 1, "l")])
+
+    assert stock(fridge_db) == [("egg", 2, "pieces", None), ("milk", 1, "l", None)]
+
+
+def test_same_item_is_merged(fridge_db):
+    fridge_db.add_item_to_refrigerator(1, "Tomatoes", 2, "pieces", "2030-01-01")
+    fridge_db.add_item_to_refrigerator(1, "tomato ", 3, "Pieces", "2030-01-01")
+    fridge_db.add_item_to_refrigerator(1, "milk", 0.1, "l")
+    fridge_db.add_item_to_refrigerator(1, "milk", 0.2, "l")
+
+    assert stock(fridge_db) == [("Tomatoes", 5, "pieces", "2030-01-01"), ("milk", 0.3, "l", None)]
+
+
+def test_other_unit_or_expiry_is_a_separate_row(fridge_db):
+    fridge_db.add_item_to_refrigerator(1, "egg", 2, "pieces", "2030-01-01")
+    fridge_db.add_item_to_refrigerator(1, "egg", 2, "pieces", "2030-01-02")
+    fridge_db.add_item_to_refrigerator(1, "egg", 2, "pieces")
+    fridge_db.add_item_to_refrigerator(1, "egg", 100, "g")
+
+    assert len(stock(fridge_db)) == 4
+
+
+def test_legacy_database_is_compacted(tmp_path):
+    fridge_db = RefrigeratorDB(str(tmp_path))
+    fridge_db.create_user_folder(1)
+    db_path = fridge_db.get_db_path(1)
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        """
+    CREATE TABLE refrigerator_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_name TEXT NOT NULL,
+        quantity INTEGER DEFAULT 1,
+        unit TEXT DEFAULT 'pieces',
+        expiry_date TEXT,
+        added_date DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+    )
+    conn.executemany(
+        "INSERT INTO refrigerator_items (item_name, quantity, unit, expiry_date) VALUES (?, ?, ?, ?)",
+        [("Egg", 2, "pieces", None), ("eggs", 4, "pieces", None), ("egg", 1, "pieces", "2030-01-01")],
+    )
+    conn.commit()
+    conn.close()
+
+    assert stock(fridge_db) == [("Egg", 6, "pieces", None), ("egg", 1, "pieces", "2030-01-01")]
+
+    fridge_db.add_item_to_refrigerator(1, "EGGS", 1)
+    assert stock(fridge_db) == [("Egg", 7, "pieces", None), ("egg", 1, "pieces", "2030-01-01")]
@@ -0,0 +1,98 @@
+import sqlite3
+
+import pytest
+
+from cuisine_db import CuisineDB
+from ingredient_dictionary import IngredientDictionary
+from similar_cuisines import SimilarCuisineIndex
+
+
+@pytest.fixture
+def cuisine_db(tmp_path):
+    cuisine_db = CuisineDB(str(tmp_path), ingredient_dictionary=IngredientDictionary(str(tmp_path)))
+    cuisine_db.create_cuisine_index_database(1)
+    return cuisine_db
+
+
+@pytest.fixture
+def index(cuisine_db):
+    return SimilarCuisineIndex(cuisine_db)
+
+
+def add_cuisine(cuisine_db, user_id, cuisine_name, ingredients):
+    cuisine_db.create_specific_cuisine_database(user_id, cuisine_name)
+    for ingredient_name in ingredients:
+        cuisine_db.add_ingredient_to_cuisine(user_id, cuisine_name, ingredient_name, "1")
+
+
+def stored_signature(index, user_id, cuisine_name):
+    conn = sqlite3.connect(index.db_path)
+    row = conn.execute(
+        "SELECT ingredient_count, signature FROM signatures WHERE user_id = ? AND cuisine_name = ?",
+        (user_id, cuisine_name),
+    ).fetchone()
+    conn.close()
+    return row
+
+
+def test_folded_signature_matches_full_recompute(cuisine_db, index):
+    add_cuisine(cuisine_db, 1, "Pancakes", ["egg", "milk", "flour"])
+    index.flush()
+    for ingredient_name in ["sugar", "butter", "egg"]:
+        cuisine_db.add_ingredient_to_cuisine(1, "Pancakes", ingredient_name, "1")
+    index.flush()
+
+    ingredient_count, signature = stored_signature(index, 1, "Pancakes")
+
+    expected = index.compute_signature(["egg", "milk", "flour", "sugar", "butter"])
+    assert signature == expected.tobytes()
+    assert ingredient_count == 6
+
+
+def test_synonyms_share_a_signature(index):
+    assert index.compute_signature(["aubergine", "tomato"]) == index.compute_signature(["eggplant", "tomato"])
+
+
+def test_updates_are_queued_until_flush(cuisine_db, index):
+    add_cuisine(cuisine_db, 1, "Pancakes", ["egg", "milk", "flour"])
+    add_cuisine(cuisine_db, 1, "Crepes", ["egg", "milk", "flour", "butter"])
+
+    assert stored_signature(index, 1, "Pancakes") is None
+    assert index.stats["flushes"] == 0
+
+    assert index.flush() == 2
+    assert index.flush() == 0
+    assert index.stats["flushes"] == 1
+    assert index.stats["written"] == 2
+    assert stored_signature(index, 1, "Crepes") is not None
+
+
+def test_full_recompute_wins_over_queued_additions(cuisine_db, index):
+    add_cuisine(cuisine_db, 1, "Pancakes", ["egg", "milk"])
+    index.flush()
+    cuisine_db.add_ingredient_to_cuisine(1, "Pancakes", "flour", "1")
+    index.update_cuisine(1, "Pancakes")
+
+    assert index._pending == {(1, "Pancakes"): None}
+    index.flush()
+    assert stored_signature(index, 1, "Pancakes")[1] == index.compute_signature(["egg", "milk", "flour"]).tobytes()
+
+
+def test_find_similar_sees_queued_changes(cuisine_db, index):
+    add_cuisine(cuisine_db, 1, "Pancakes", ["egg", "milk", "flour", "sugar", "butter"])
+    add_cuisine(cuisine_db, 1, "Crepes", ["egg", "milk", "flour", "sugar", "salt"])
+    add_cuisine(cuisine_db, 1, "Salad", ["lettuce", "tomato", "cucumber"])
+
+    results = index.find_similar(1, "Pancakes")
+
+    assert [result["cuisine_name"] for result in results] == ["Crepes"]
+    assert results[0]["own"] is True
+
+
+def test_background_flush_and_stop(cuisine_db, index):
+    index.start(0.01)
+    add_cuisine(cuisine_db, 1, "Pancakes", ["egg", "milk"])
+    index.stop()
+
+    assert not index._pending
+    assert stored_signature(index, 1, "Pancakes") is not None
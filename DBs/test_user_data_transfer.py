@@ -0,0 +1,111 @@
+import io
+import json
+
+import pytest
+
+from cuisine_db import CuisineDB
+from refrigerator_db import RefrigeratorDB
+from user_data_transfer import UserDataTransfer
+
+
+@pytest.fixture
+def transfer(tmp_path):
+    return UserDataTransfer(RefrigeratorDB(str(tmp_path)), CuisineDB(str(tmp_path)), batch_size=2)
+
+
+def fill_user(transfer, user_id):
+    fridge_db = transfer.fridge_db
+    cuisine_db = transfer.cuisine_db
+    fridge_db.create_user_refrigerator(user_id)
+    fridge_db.add_item_to_refrigerator(user_id, "Milk", 1.5, "l", "2030-01-01")
+    fridge_db.add_item_to_refrigerator(user_id, "egg", 6)
+    fridge_db.add_item_to_refrigerator(user_id, "flour", 500, "g")
+    cuisine_db.create_cuisine_index_database(user_id)
+    cuisine_db.create_specific_cuisine_database(user_id, "Pancakes", "Sunday breakfast")
+    cuisine_db.add_ingredient_to_cuisine(user_id, "Pancakes", "milk", "0.25", "l")
+    cuisine_db.add_ingredient_to_cuisine(user_id, "Pancakes", "egg", "2")
+    cuisine_db.add_ingredient_to_cuisine(user_id, "Pancakes", "flour", "1/2", "cups")
+
+
+def export_to_file(transfer, user_id, fmt, path):
+    buffer = io.BytesIO()
+    transfer.write_export(user_id, buffer, fmt)
+    path.write_bytes(buffer.getvalue())
+    return path
+
+
+def user_snapshot(transfer, user_id):
+    items = sorted(
+        (item.item_name, item.quantity, item.unit, item.expiry_date)
+        for item in transfer.fridge_db.get_refrigerator_items(user_id)
+    )
+    cuisines = {}
+    for cuisine in transfer.cuisine_db.get_cuisines(user_id):
+        cuisines[cuisine[1]] = sorted(
+            (ingredient[1], ingredient[2], ingredient[3])
+            for ingredient in transfer.cuisine_db.get_cuisine_ingredients(user_id, cuisine[1])
+        )
+    return items, cuisines
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "csv"])
+def test_round_trip(transfer, tmp_path, fmt):
+    fill_user(transfer, 1)
+    export_file = export_to_file(transfer, 1, fmt, tmp_path / f"export.{fmt}")
+
+    counts = transfer.import_file(2, str(export_file))
+
+    assert counts["refrigerator_items"] == 3
+    assert counts["cuisines"] == 1
+    assert counts["ingredients"] == 3
+    assert counts["skipped"] == 0
+    assert user_snapshot(transfer, 2) == user_snapshot(transfer, 1)
+
+
+def test_importing_twice_merges_items_and_keeps_recipes(transfer, tmp_path):
+    fill_user(transfer, 1)
+    export_file = export_to_file(transfer, 1, "ndjson", tmp_path / "export.ndjson")
+
+    transfer.import_file(2, str(export_file))
+    transfer.import_file(2, str(export_file))
+
+    items, cuisines = user_snapshot(transfer, 2)
+    assert ("egg", 12, "pieces", None) in items
+    assert len(items) == 3
+    assert len(cuisines["Pancakes"]) == 3
+
+
+def test_export_rejects_unknown_format(transfer):
+    with pytest.raises(ValueError):
+        transfer.write_export(1, io.BytesIO(), "xml")
+
+
+@pytest.mark.parametrize("quantity", ["abc", -1, "nan", "inf"])
+def test_invalid_quantity_leaves_data_untouched(transfer, tmp_path, quantity):
+    fill_user(transfer, 1)
+    before = user_snapshot(transfer, 1)
+    records = [
+        {"type": "refrigerator_item", "item_name": "butter", "quantity": 1, "unit": "pieces"},
+        {"type": "refrigerator_item", "item_name": "jam", "quantity": quantity, "unit": "pieces"},
+    ]
+    import_file = tmp_path / "bad.ndjson"
+    import_file.write_text("\n".join(json.dumps(record) for record in records), encoding="utf-8")
+
+    with pytest.raises(ValueError, match="Record 2"):
+        transfer.import_file(1, str(import_file))
+
+    assert user_snapshot(transfer, 1) == before
+
+
+def test_missing_quantity_defaults_to_one_and_non_objects_are_skipped(transfer, tmp_path):
+    import_file = tmp_path / "records.ndjson"
+    import_file.write_text(
+        '{"type": "refrigerator_item", "item_name": "apple", "quantity": null}\n\n[1, 2]\n',
+        encoding="utf-8",
+    )
+
+    counts = transfer.import_file(1, str(import_file))
+
+    assert counts["refrigerator_items"] == 1
+    assert counts["skipped"] == 1
+    assert user_snapshot(transfer, 1)[0] == [("apple", 1, "pieces", None)]
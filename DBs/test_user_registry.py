@@ -0,0 +1,118 @@
+import os
+import sqlite3
+
+import pytest
+
+from cold_storage import ColdStorage
+from cuisine_db import CuisineDB
+from refrigerator_db import RefrigeratorDB
+from user_registry import UserRegistry
+
+
+@pytest.fixture
+def handlers(tmp_path):
+    registry = UserRegistry(str(tmp_path))
+    fridge_db = RefrigeratorDB(str(tmp_path), registry=registry)
+    cuisine_db = CuisineDB(str(tmp_path), registry=registry)
+    return registry, fridge_db, cuisine_db
+
+
+def fill_users(fridge_db, cuisine_db):
+    fridge_db.create_user_refrigerator(1)
+    cuisine_db.create_cuisine_index_database(1)
+    cuisine_db.create_specific_cuisine_database(1, "Pancakes")
+    cuisine_db.create_cuisine_index_database(2)
+    fridge_db.create_user_refrigerator(3)
+
+
+def registry_state(registry, user_ids=(1, 2, 3, 4)):
+    return {
+        user_id: (
+            registry.has_folder(user_id),
+            registry.has_refrigerator(user_id),
+            registry.has_cuisine_system(user_id),
+            registry.has_cuisine(user_id, CuisineDB.get_cuisine_filename("Pancakes")),
+        )
+        for user_id in user_ids
+    }
+
+
+def test_registry_follows_created_databases(handlers):
+    registry, fridge_db, cuisine_db = handlers
+    fill_users(fridge_db, cuisine_db)
+
+    assert registry_state(registry) == {
+        1: (True, True, True, True),
+        2: (True, False, True, False),
+        3: (True, True, False, False),
+        4: (False, False, False, False),
+    }
+
+
+def test_other_processes_and_rebuild_agree(handlers, tmp_path):
+    registry, fridge_db, cuisine_db = handlers
+    fill_users(fridge_db, cuisine_db)
+    expected = registry_state(registry)
+
+    assert registry_state(UserRegistry(str(tmp_path))) == expected
+
+    os.remove(registry.db_path)
+    assert registry_state(UserRegistry(str(tmp_path))) == expected
+
+
+def test_existence_checks_do_not_touch_the_filesystem(handlers, monkeypatch):
+    registry, fridge_db, cuisine_db = handlers
+    fill_users(fridge_db, cuisine_db)
+    probes = []
+    for name in ("exists", "isdir", "isfile"):
+        original = getattr(os.path, name)
+        monkeypatch.setattr(os.path, name, lambda path, original=original: probes.append(path) or original(path))
+
+    for user_id in (1, 2, 3, 4):
+        fridge_db.user_has_refrigerator(user_id)
+        cuisine_db.user_has_cuisine_system(user_id)
+        cuisine_db.cuisine_exists(user_id, "Pancakes")
+
+    assert probes == []
+
+
+def test_archived_users_are_rebuilt_from_archives(handlers, tmp_path):
+    registry, fridge_db, cuisine_db = handlers
+    fill_users(fridge_db, cuisine_db)
+    ColdStorage(str(tmp_path), registry=registry).archive_user(1)
+    assert registry.is_archived(1) is True
+
+    os.remove(registry.db_path)
+    rebuilt = UserRegistry(str(tmp_path))
+
+    assert rebuilt.is_archived(1) is True
+    assert rebuilt.is_archived(3) is False
+    assert rebuilt.is_archived(4) is None
+    assert registry_state(rebuilt)[1] == (True, True, True, True)
+
+
+def test_registry_without_archived_flag_is_upgraded(handlers, tmp_path):
+    registry, fridge_db, cuisine_db = handlers
+    fill_users(fridge_db, cuisine_db)
+    ColdStorage(str(tmp_path), registry=registry).archive_user(3)
+    conn = sqlite3.connect(registry.db_path)
+    with conn:
+        conn.execute("ALTER TABLE users DROP COLUMN archived")
+    conn.close()
+
+    upgraded = UserRegistry(str(tmp_path))
+
+    assert upgraded.is_archived(3) is True
+    assert upgraded.is_archived(1) is False
+
+
+def test_touch_is_throttled(tmp_path):
+    registry = UserRegistry(str(tmp_path), touch_interval=60)
+
+    registry.touch(1)
+    first = registry.get_last_active(1)
+    registry.touch(1)
+    assert registry.get_last_active(1) == first
+
+    registry.touch(1, force=True)
+    assert registry.get_last_active(1) > first
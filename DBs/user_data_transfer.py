@@ -0,0 +1,469 @@
+import csv
+import io
+import json
+import math
+import os
+import sqlite3
+from typing import Dict, Iterable, Iterator, Optional, TextIO
+
+from refrigerator_db import (
+    MERGE_KEY,
+    QUANTITY_DECIMALS,
+    RefrigeratorDB,
+    get_item_key,
+    normalize_quantity,
+)
+from cuisine_db import CuisineDB
+
+
+# Column order used by the CSV export (one flat row per record, unused columns left empty)
+CSV_FIELDS = [
+    "type",
+    "cuisine_name",
+    "description",
+    "item_name",
+    "quantity",
+    "ingredient_name",
+    "amount",
+    "unit",
+    "expiry_date",
+    "notes",
+    "category",
+    "created_date",
+    "added_date",
+]
+
+EXPORT_FORMATS = ("ndjson", "csv")
+
+
+class UserDataTransfer:
+    """Streaming export/import of a user's refrigerator and cuisines"""
+
+    def __init__(
+        self,
+        fridge_db: RefrigeratorDB,
+        cuisine_db: CuisineDB,
+        batch_size: int = 500,
+    ):
+        """Initialize the transfer handler
+
+        Args:
+            fridge_db: Refrigerator database handler
+            cuisine_db: Cuisine database handler
+            batch_size: Number of rows inserted per transaction on import
+        """
+        self.fridge_db = fridge_db
+        self.cuisine_db = cuisine_db
+        self.batch_size = batch_size
+
+    # ----------------------------------------------------------------- export
+
+    def iter_records(self, user_id: int) -> Iterator[Dict]:
+        """Yield every exportable record of a user one at a time
+
+        Rows are read straight from the cursors, so memory use does not
+        grow with the number of items, cuisines or ingredients.
+
+        Args:
+            user_id: Telegram user ID
+
+        Yields:
+            Dictionaries with a "type" key of "refrigerator_item",
+            "cuisine" or "ingredient"
+        """
+        db_path = self.fridge_db.get_db_path(user_id)
+        if os.path.exists(db_path):
+            conn = sqlite3.connect(db_path)
+            try:
+                cursor = conn.execute(
+                    """
+                SELECT item_name, quantity, unit, expiry_date, added_date
+                FROM refrigerator_items
+                ORDER BY id
+                """
+                )
+                for item_name, quantity, unit, expiry_date, added_date in cursor:
+                    yield {
+                        "type": "refrigerator_item",
+                        "item_name": item_name,
+                        "quantity": quantity,
+                        "unit": unit,
+                        "expiry_date": expiry_date,
+                        "added_date": added_date,
+                    }
+            finally:
+                conn.close()
+
+        cuisines_db_path = self.cuisine_db.get_cuisines_db_path(user_id)
+        if not os.path.exists(cuisines_db_path):
+            return
+
+        user_folder = self.cuisine_db.get_user_folder(user_id)
+        conn_index = sqlite3.connect(cuisines_db_path)
+        try:
+            cursor_index = conn_index.execute(
+                """
+            SELECT cuisine_name, cuisine_filename, description, created_date
+            FROM cuisines_index
+            ORDER BY cuisine_id
+            """
+            )
+            for cuisine_name, cuisine_filename, description, created_date in cursor_index:
+                yield {
+                    "type": "cuisine",
+                    "cuisine_name": cuisine_name,
+                    "description": description,
+                    "created_date": created_date,
+                }
+
+                cuisine_db_path = os.path.join(user_folder, cuisine_filename)
+                if not os.path.exists(cuisine_db_path):
+                    continue
+
+                conn_cuisine = sqlite3.connect(cuisine_db_path)
+                try:
+                    cursor_cuisine = conn_cuisine.execute(
+                        """
+                    SELECT ingredient_name, amount, unit, notes, category, added_date
+                    FROM ingredients
+                    ORDER BY id
+                    """
+                    )
+                    for row in cursor_cuisine:
+                        ingredient_name, amount, unit, notes, category, added_date = row
+                        yield {
+                            "type": "ingredient",
+                            "cuisine_name": cuisine_name,
+                            "ingredient_name": ingredient_name,
+                            "amount": amount,
+                            "unit": unit,
+                            "notes": notes,
+                            "category": category,
+                            "added_date": added_date,
+                        }
+                finally:
+                    conn_cuisine.close()
+        finally:
+            conn_index.close()
+
+    def export_ndjson(self, user_id: int) -> Iterator[str]:
+        """Stream a user's data as newline-delimited JSON
+
+        Args:
+            user_id: Telegram user ID
+
+        Yields:
+            One JSON line (terminated by a newline) per record
+        """
+        for record in self.iter_records(user_id):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    def export_csv(self, user_id: int) -> Iterator[str]:
+        """Stream a user's data as CSV
+
+        Args:
+            user_id: Telegram user ID
+
+        Yields:
+            The header line followed by one CSV line per record
+        """
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, lineterminator="\n")
+
+        writer.writeheader()
+        yield buffer.getvalue()
+
+        for record in self.iter_records(user_id):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(record)
+            yield buffer.getvalue()
+
+    def write_export(self, user_id: int, fileobj, fmt: str = "ndjson") -> int:
+        """Write a user's export into a binary file object
+
+        Args:
+            user_id: Telegram user ID
+            fileobj: Writable binary file object
+            fmt: "ndjson" or "csv"
+
+        Returns:
+            Number of bytes written
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+
+        lines = self.export_csv(user_id) if fmt == "csv" else self.export_ndjson(user_id)
+        written = 0
+        for line in lines:
+            written += fileobj.write(line.encode("utf-8"))
+        return written
+
+    # ----------------------------------------------------------------- import
+
+    @staticmethod
+    def iter_ndjson(fileobj: TextIO) -> Iterator[Dict]:
+        """Parse NDJSON records from a text file object line by line
+
+        Args:
+            fileobj: Readable text file object
+
+        Yields:
+            Parsed JSON values, one per line (blank lines are skipped;
+            values that are not objects are skipped by ``import_records``)
+        """
+        for line in fileobj:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+    @staticmethod
+    def iter_csv(fileobj: TextIO) -> Iterator[Dict]:
+        """Parse CSV records from a text file object row by row
+
+        Args:
+            fileobj: Readable text file object
+
+        Yields:
+            Record dictionaries with empty cells converted to None
+        """
+        for row in csv.DictReader(fileobj):
+            yield {key: (value if value != "" else None) for key, value in row.items()}
+
+    def get_ingredient_id(self, name: str) -> Optional[int]:
+        """Get the ingredient ID stored with an imported name
+
+        Args:
+            name: Item or ingredient name
+
+        Returns:
+            Ingredient ID, or None without an ingredient dictionary
+        """
+        dictionary = self.fridge_db.ingredient_dictionary or self.cuisine_db.ingredient_dictionary
+        if dictionary is None:
+            return None
+        return dictionary.get_id(name)
+
+    @staticmethod
+    def parse_quantity(value) -> float:
+        """Parse the quantity of an imported refrigerator item
+
+        Args:
+            value: Quantity from the file (number, numeric string, empty or None)
+
+        Returns:
+            The quantity rounded like stored quantities (1 when missing, 0 is kept)
+
+        Raises:
+            ValueError: If the quantity is not a non-negative number
+        """
+        if value is None or value == "":
+            return 1
+        try:
+            quantity = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid quantity: {value!r}")
+        if not math.isfinite(quantity) or quantity < 0:
+            raise ValueError(f"Invalid quantity: {value!r}")
+        return normalize_quantity(quantity)
+
+    def validate_records(self, records: Iterable) -> int:
+        """Check records before anything is written
+
+        Args:
+            records: Iterable of parsed records
+
+        Returns:
+            Number of records checked
+
+        Raises:
+            ValueError: On the first record whose values cannot be imported
+        """
+        checked = 0
+        for checked, record in enumerate(records, start=1):
+            if isinstance(record, dict) and record.get("type") == "refrigerator_item":
+                try:
+                    self.parse_quantity(record.get("quantity"))
+                except ValueError as error:
+                    raise ValueError(f"Record {checked}: {error}")
+        return checked
+
+    def import_records(self, user_id: int, records: Iterable[Dict]) -> Dict[str, int]:
+        """Import a stream of records into a user's databases
+
+        Refrigerator items and ingredients are buffered and inserted with
+        ``executemany`` in transactions of ``batch_size`` rows, so records
+        should be checked with ``validate_records`` first (``import_file``
+        does). Records that are not dictionaries are skipped. Ingredients
+        of a cuisine that already exists are skipped so that uploading the
+        same file twice does not duplicate recipes.
+
+        Args:
+            user_id: Telegram user ID
+            records: Iterable of record dictionaries (see ``iter_records``)
+
+        Returns:
+            Counts of imported refrigerator items, cuisines and ingredients,
+            plus skipped records
+        """
+        counts = {"refrigerator_items": 0, "cuisines": 0, "ingredients": 0, "skipped": 0}
+
+        fridge_conn: Optional[sqlite3.Connection] = None
+        fridge_batch = []
+
+        # Ingredient target: the cuisine currently being filled
+        cuisine_conn: Optional[sqlite3.Connection] = None
+        cuisine_target: Optional[str] = None
+        ingredient_batch = []
+        # Cuisines created by this import (only these receive ingredients)
+        created_cuisines = set()
+
+        def flush_fridge():
+            if fridge_batch:
+                with fridge_conn:
+                    fridge_conn.executemany(
+                        f"""
+                    INSERT INTO refrigerator_items
+                        (item_name, quantity, unit, expiry_date, added_date, ingredient_id, item_key)
+                    VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?)
+                    ON CONFLICT ({MERGE_KEY}) DO UPDATE SET
+                        quantity = round(quantity + excluded.quantity, {QUANTITY_DECIMALS})
+                    """,
+                        fridge_batch,
+                    )
+                counts["refrigerator_items"] += len(fridge_batch)
+                fridge_batch.clear()
+
+        def flush_ingredients():
+            if ingredient_batch:
+                with cuisine_conn:
+                    cuisine_conn.executemany(
+                        """
+                    INSERT INTO ingredients (ingredient_name, amount, unit, notes, category, added_date, ingredient_id)
+                    VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)
+                    """,
+                        ingredient_batch,
+                    )
+                counts["ingredients"] += len(ingredient_batch)
+                ingredient_batch.clear()
+
+        try:
+            for record in records:
+                if not isinstance(record, dict):
+                    counts["skipped"] += 1
+                    continue
+                record_type = record.get("type")
+
+                if record_type == "refrigerator_item":
+                    if not record.get("item_name"):
+                        counts["skipped"] += 1
+                        continue
+                    if fridge_conn is None:
+                        self.fridge_db.create_user_refrigerator(user_id)
+                        fridge_conn = sqlite3.connect(self.fridge_db.get_db_path(user_id))
+                    fridge_batch.append(
+                        (
+                            record["item_name"],
+                            self.parse_quantity(record.get("quantity")),
+                            record.get("unit") or "pieces",
+                            record.get("expiry_date"),
+                            record.get("added_date"),
+                            self.get_ingredient_id(record["item_name"]),
+                            get_item_key(record["item_name"]),
+                        )
+                    )
+                    if len(fridge_batch) >= self.batch_size:
+                        flush_fridge()
+
+                elif record_type == "cuisine":
+                    cuisine_name = record.get("cuisine_name")
+                    if not cuisine_name:
+                        counts["skipped"] += 1
+                        continue
+                    cuisine_id = self.cuisine_db.create_specific_cuisine_database(
+                        user_id, cuisine_name, record.get("description")
+                    )
+                    if cuisine_id is None:
+                        counts["skipped"] += 1
+                    else:
+                        created_cuisines.add(cuisine_name)
+                        counts["cuisines"] += 1
+
+                elif record_type == "ingredient":
+                    cuisine_name = record.get("cuisine_name")
+                    if cuisine_name not in created_cuisines or not record.get("ingredient_name"):
+                        counts["skipped"] += 1
+                        continue
+                    if cuisine_name != cuisine_target:
+                        # Switch target database: flush what belongs to the previous one
+                        if cuisine_conn is not None:
+                            flush_ingredients()
+                            cuisine_conn.close()
+                        cuisine_conn = sqlite3.connect(
+                            self.cuisine_db.get_cuisine_db_path(user_id, cuisine_name)
+                        )
+                        cuisine_target = cuisine_name
+                    ingredient_batch.append(
+                        (
+                            record["ingredient_name"],
+                            str(record.get("amount") or ""),
+                            record.get("unit") or "pieces",
+                            record.get("notes"),
+                            record.get("category") or "other",
+                            record.get("added_date"),
+                            self.get_ingredient_id(record["ingredient_name"]),
+                        )
+                    )
+                    if len(ingredient_batch) >= self.batch_size:
+                        flush_ingredients()
+
+                else:
+                    counts["skipped"] += 1
+
+            if fridge_conn is not None:
+                flush_fridge()
+            if cuisine_conn is not None:
+                flush_ingredients()
+        finally:
+            if fridge_conn is not None:
+                fridge_conn.close()
+            if cuisine_conn is not None:
+                cuisine_conn.close()
+
+        # Imported rows bypass the add methods, so tell the listeners here
+        if counts["refrigerator_items"]:
+            self.fridge_db.notify_items_changed(user_id)
+        for cuisine_name in created_cuisines:
+            self.cuisine_db.notify_cuisine_changed(user_id, cuisine_name)
+
+        return counts
+
+    def import_file(self, user_id: int, file_path: str) -> Dict[str, int]:
+        """Import an exported NDJSON or CSV file from disk
+
+        The format is detected from the first non-blank character. The
+        whole file is parsed and checked before the first record is
+        written, so a bad file leaves the user's data untouched.
+
+        Args:
+            user_id: Telegram user ID
+            file_path: Path to the uploaded file
+
+        Returns:
+            Counts as returned by ``import_records``
+
+        Raises:
+            ValueError: If the file cannot be parsed or holds invalid values
+        """
+        with open(file_path, "r", encoding="utf-8", newline="") as fileobj:
+            first_char = ""
+            while True:
+                first_char = fileobj.read(1)
+                if not first_char or not first_char.isspace():
+                    break
+            parse = self.iter_ndjson if first_char == "{" else self.iter_csv
+
+            fileobj.seek(0)
+            self.validate_records(parse(fileobj))
+            fileobj.seek(0)
+            return self.import_records(user_id, parse(fileobj))
@@ -0,0 +1,308 @@
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from refrigerator_db import RefrigeratorDB
+from cuisine_db import CuisineDB
+from eco_score import normalize_ingredient_name, parse_amount
+from ingredient_dictionary import IngredientDictionary
+
+
+# SQLite's compiled-in default when the limit cannot be queried
+DEFAULT_ATTACH_LIMIT = 10
+
+
+class UserQueryLayer:
+    """Runs joins across a user's refrigerator and cuisine databases inside SQLite
+
+    One in-memory connection per query ATTACHes the refrigerator, the
+    cuisines index and the cuisine databases (in batches that respect the
+    attach limit), so coverage and deficit joins never leave SQLite.
+    """
+
+    def __init__(self, fridge_db: RefrigeratorDB, cuisine_db: CuisineDB):
+        """Initialize the query layer
+
+        Args:
+            fridge_db: Refrigerator database handler
+            cuisine_db: Cuisine database handler
+        """
+        self.fridge_db = fridge_db
+        self.cuisine_db = cuisine_db
+
+    def key_expression(self, table_alias: str, name_column: str) -> str:
+        """Get the SQL expression joining fridge items and ingredients
+
+        Args:
+            table_alias: Alias of the table in the query
+            name_column: Column holding the raw names
+
+        Returns:
+            The integer ingredient ID column when an ingredient dictionary
+            is set, otherwise the normalized name
+        """
+        if self.fridge_db.ingredient_dictionary is not None:
+            return f"{table_alias}.ingredient_id"
+        return f"normalize({table_alias}.{name_column})"
+
+    def python_key(self, name: str):
+        """Get the join key of a raw name in Python, matching ``key_expression``
+
+        Args:
+            name: Raw ingredient or item name
+
+        Returns:
+            The ingredient ID when an ingredient dictionary is set (None if
+            unknown), otherwise the normalized name
+        """
+        dictionary = self.fridge_db.ingredient_dictionary
+        if dictionary is not None:
+            return dictionary.lookup_id(name)
+        return normalize_ingredient_name(name)
+
+    @staticmethod
+    def _attach(conn: sqlite3.Connection, db_path: str, alias: str):
+        conn.execute("ATTACH DATABASE ? AS " + alias, (f"file:{db_path}?mode=ro",))
+
+    @contextmanager
+    def connect(self, user_id: int) -> Iterator[sqlite3.Connection]:
+        """Open a query connection with the user's refrigerator and index attached
+
+        The refrigerator is copied into ``temp.fridge_stock`` keyed by the
+        ingredient ID (or normalized item name) and unit, so every later
+        join is an indexed lookup. A ``normalize`` SQL function is
+        registered for the cuisine side of name joins, and an ``amount``
+        function parsing amounts exactly like the handlers do
+        (``parse_amount``: "1/2", "1,5").
+
+        Args:
+            user_id: Telegram user ID
+
+        Yields:
+            The SQLite connection (cuisines index attached as ``cuisines``
+            when it exists)
+        """
+        conn = sqlite3.connect(":memory:", uri=True)
+        conn.create_function("normalize", 1, normalize_ingredient_name, deterministic=True)
+        conn.create_function("amount", 1, parse_amount, deterministic=True)
+        try:
+            conn.execute(
+                """
+            CREATE TEMP TABLE fridge_stock (
+                key NOT NULL,
+                unit TEXT NOT NULL,
+                quantity REAL NOT NULL,
+                PRIMARY KEY (key, unit)
+            )
+            """
+            )
+
+            fridge_path = self.fridge_db.get_db_path(user_id)
+            if self.fridge_db.user_has_refrigerator(user_id):
+                self._attach(conn, fridge_path, "fridge")
+                key = self.key_expression("item", "item_name")
+                conn.execute(
+                    f"""
+                INSERT INTO temp.fridge_stock (key, unit, quantity)
+                SELECT {key}, lower(COALESCE(item.unit, '')), SUM(item.quantity)
+                FROM fridge.refrigerator_items AS item
+                WHERE {key} IS NOT NULL
+                GROUP BY 1, 2
+                """
+                )
+                conn.commit()
+                # Free the attach slot for cuisine batches
+                conn.execute("DETACH DATABASE fridge")
+
+            cuisines_path = self.cuisine_db.get_cuisines_db_path(user_id)
+            if self.cuisine_db.user_has_cuisine_system(user_id):
+                self._attach(conn, cuisines_path, "cuisines")
+
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def attach_limit(conn: sqlite3.Connection) -> int:
+        """Get the maximum number of attached databases of a connection
+
+        Args:
+            conn: SQLite connection
+
+        Returns:
+            The SQLITE_LIMIT_ATTACHED value
+        """
+        if hasattr(conn, "getlimit"):
+            return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        return DEFAULT_ATTACH_LIMIT
+
+    def iter_cuisine_batches(
+        self,
+        conn: sqlite3.Connection,
+        user_id: int,
+        cuisine_names: Optional[List[str]] = None,
+    ) -> Iterator[List[Tuple[str, str]]]:
+        """Attach the user's cuisine databases batch by batch
+
+        Each batch is detached before the next one is attached.
+
+        Args:
+            conn: Connection from ``connect``
+            user_id: Telegram user ID
+            cuisine_names: Restrict to these cuisines (all when None)
+
+        Yields:
+            Lists of (schema alias, cuisine name) currently attached
+        """
+        if cuisine_names is None:
+            cuisine_names = [cuisine[1] for cuisine in self.cuisine_db.get_cuisines(user_id)]
+
+        attached_now = len(conn.execute("PRAGMA database_list").fetchall()) - 2
+        # main and temp do not count against the limit
+        batch_size = max(self.attach_limit(conn) - attached_now, 1)
+
+        paths = [
+            (cuisine_name, self.cuisine_db.get_cuisine_db_path(user_id, cuisine_name))
+            for cuisine_name in cuisine_names
+            if self.cuisine_db.cuisine_exists(user_id, cuisine_name)
+        ]
+
+        for start in range(0, len(paths), batch_size):
+            batch = []
+            try:
+                for position, (cuisine_name, path) in enumerate(paths[start:start + batch_size]):
+                    alias = f"cuisine_{position}"
+                    self._attach(conn, path, alias)
+                    batch.append((alias, cuisine_name))
+                yield batch
+            finally:
+                for alias, _ in batch:
+                    conn.execute("DETACH DATABASE " + alias)
+
+    def coverage(self, user_id: int) -> List[Tuple[str, int, int]]:
+        """Count how many ingredients of every cuisine are in the refrigerator
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            List of (cuisine_name, ingredient count, ingredients in the
+            refrigerator), best covered first
+        """
+        ingredient_key = self.key_expression("ingredient", "ingredient_name")
+        results = []
+        with self.connect(user_id) as conn:
+            for batch in self.iter_cuisine_batches(conn, user_id):
+                query = " UNION ALL ".join(
+                    f"""
+                SELECT ? AS cuisine_name,
+                       COUNT(*) AS total,
+                       COUNT(stock.key) AS covered
+                FROM {alias}.ingredients AS ingredient
+                LEFT JOIN (SELECT DISTINCT key FROM temp.fridge_stock) AS stock
+                       ON stock.key = {ingredient_key}
+                """
+                    for alias, _ in batch
+                )
+                results.extend(conn.execute(query, [name for _, name in batch]).fetchall())
+
+        results.sort(key=lambda row: (row[2] / row[1] if row[1] else 0.0, row[2]), reverse=True)
+        return results
+
+    def deficits(
+        self,
+        user_id: int,
+        cuisine_names: Optional[List[str]] = None,
+        servings: int = 1,
+    ) -> Dict[str, List[Tuple[str, Optional[float], float, str]]]:
+        """Find what is missing in the refrigerator to cook cuisines
+
+        An ingredient is short when the refrigerator holds less of it in
+        the same unit than the recipe needs for the given servings.
+        Ingredients whose amount can't be parsed are always listed, with
+        ``needed`` None (as /selectfood reports them).
+
+        Args:
+            user_id: Telegram user ID
+            cuisine_names: Cuisines to check (all when None)
+            servings: Number of servings
+
+        Returns:
+            Mapping of cuisine name to (ingredient_name, needed, available, unit)
+        """
+        ingredient_key = self.key_expression("ingredient", "ingredient_name")
+        results: Dict[str, List[Tuple[str, Optional[float], float, str]]] = {}
+        with self.connect(user_id) as conn:
+            for batch in self.iter_cuisine_batches(conn, user_id, cuisine_names):
+                query = " UNION ALL ".join(
+                    f"""
+                SELECT ? AS cuisine_name,
+                       ingredient.ingredient_name,
+                       amount(ingredient.amount) * ? AS needed,
+                       COALESCE(stock.quantity, 0) AS available,
+                       ingredient.unit
+                FROM {alias}.ingredients AS ingredient
+                LEFT JOIN temp.fridge_stock AS stock
+                       ON stock.key = {ingredient_key}
+                      AND stock.unit = lower(COALESCE(ingredient.unit, ''))
+                WHERE amount(ingredient.amount) IS NULL
+                   OR COALESCE(stock.quantity, 0) < amount(ingredient.amount) * ?
+                """
+                    for alias, _ in batch
+                )
+                params = []
+                for _, cuisine_name in batch:
+                    results.setdefault(cuisine_name, [])
+                    params.extend((cuisine_name, servings, servings))
+                for cuisine_name, ingredient_name, needed, available, unit in conn.execute(query, params):
+                    results[cuisine_name].append((ingredient_name, needed, available, unit))
+        return results
+
+    def python_coverage(self, user_id: int) -> List[Tuple[str, int, int]]:
+        """Reference implementation of ``coverage`` joining in Python
+
+        Opens the refrigerator and every cuisine database separately
+        through the regular handlers and joins on the same key as
+        ``coverage``; used for benchmarking.
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Same as ``coverage``
+        """
+        fridge_keys = set(map(self.python_key, self.fridge_db.get_refrigerator_columns(user_id)["item_name"]))
+        fridge_keys.discard(None)
+        results = []
+        for cuisine in self.cuisine_db.get_cuisines(user_id):
+            ingredient_names = self.cuisine_db.get_cuisine_ingredient_columns(
+                user_id, cuisine.cuisine_name
+            )["ingredient_name"]
+            covered = sum(
+                1 for key in map(self.python_key, ingredient_names) if key in fridge_keys
+            )
+            results.append((cuisine.cuisine_name, len(ingredient_names), covered))
+        results.sort(key=lambda row: (row[2] / row[1] if row[1] else 0.0, row[2]), reverse=True)
+        return results
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    # Usage: python user_query.py <user_id> [base_folder]
+    benchmark_user = int(sys.argv[1])
+    folder = sys.argv[2] if len(sys.argv) > 2 else "user_databases"
+    dictionary = IngredientDictionary(folder)
+    layer = UserQueryLayer(
+        RefrigeratorDB(folder, ingredient_dictionary=dictionary),
+        CuisineDB(folder, ingredient_dictionary=dictionary),
+    )
+
+    results = {}
+    for label, query in (("ATTACH join", layer.coverage), ("Python join", layer.python_coverage)):
+        started = time.perf_counter()
+        results[label] = sorted(query(benchmark_user))
+        print(f"{label}: {len(results[label])} cuisines in {(time.perf_counter() - started) * 1000:.1f} ms")
+    if results["ATTACH join"] != results["Python join"]:
+        print("Warning: the two joins disagree")
@@ -0,0 +1,416 @@
+import os
+import sqlite3
+import tarfile
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+
+class UserRegistry:
+    """Central index of users, their databases and their last activity
+
+    The database handlers record every folder, refrigerator, cuisine
+    system and cuisine they create. The registry is loaded into memory
+    once per process, so existence checks are set lookups instead of
+    filesystem probes. On first use it is built from the existing
+    ``user_<id>`` folders and archives. Whether a user is archived is
+    kept by ColdStorage and always read from the database, because the
+    archiver may run in another process.
+    """
+
+    DB_NAME = "user_registry.db"
+
+    def __init__(self, base_folder: str = "user_databases", touch_interval: float = 300.0):
+        """Initialize the registry
+
+        Args:
+            base_folder: Base folder holding the user folders
+            touch_interval: Minimum seconds between activity writes for the same user
+        """
+        self.base_folder = base_folder
+        self.db_path = os.path.join(base_folder, self.DB_NAME)
+        self.touch_interval = touch_interval
+        self._folders: Set[int] = set()
+        self._refrigerators: Set[int] = set()
+        self._cuisine_systems: Set[int] = set()
+        self._cuisines: Dict[int, Set[str]] = {}
+        self._last_touch: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        if not os.path.exists(self.base_folder):
+            os.makedirs(self.base_folder)
+        if self.create_database():
+            self.rebuild()
+        self.load()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30.0)
+
+    def create_database(self) -> bool:
+        """Create the registry tables if they don't exist
+
+        Returns:
+            True if the registry was just created or upgraded and has to be rebuilt
+        """
+        created = not os.path.exists(self.db_path)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                folder TEXT,
+                has_refrigerator INTEGER NOT NULL DEFAULT 0,
+                has_cuisine_system INTEGER NOT NULL DEFAULT 0,
+                created_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_active REAL,
+                archived INTEGER NOT NULL DEFAULT 0
+            )
+            """
+            )
+            # Registries from before the archived flag are rebuilt to find the archived users
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+            if "archived" not in columns:
+                conn.execute("ALTER TABLE users ADD COLUMN archived INTEGER NOT NULL DEFAULT 0")
+                created = True
+            conn.execute(
+                """
+            CREATE TABLE IF NOT EXISTS user_cuisines (
+                user_id INTEGER NOT NULL,
+                cuisine_filename TEXT NOT NULL,
+                cuisine_name TEXT,
+                PRIMARY KEY (user_id, cuisine_filename)
+            )
+            """
+            )
+        conn.close()
+        return created
+
+    def load(self):
+        """Mirror the registry into memory"""
+        conn = self._connect()
+        users = conn.execute(
+            "SELECT user_id, folder, has_refrigerator, has_cuisine_system FROM users"
+        ).fetchall()
+        cuisines = conn.execute("SELECT user_id, cuisine_filename FROM user_cuisines").fetchall()
+        conn.close()
+
+        with self._lock:
+            self._folders = {user_id for user_id, folder, _, _ in users if folder}
+            self._refrigerators = {user_id for user_id, _, has_fridge, _ in users if has_fridge}
+            self._cuisine_systems = {user_id for user_id, _, _, has_system in users if has_system}
+            self._cuisines = {}
+            for user_id, cuisine_filename in cuisines:
+                self._cuisines.setdefault(user_id, set()).add(cuisine_filename)
+
+    def _scan_folder(self, folder_path: str) -> Dict:
+        filenames = set(os.listdir(folder_path))
+        cuisines = []
+        if "cuisines_index.db" in filenames:
+            conn = sqlite3.connect(f"file:{os.path.join(folder_path, 'cuisines_index.db')}?mode=ro", uri=True)
+            try:
+                cuisines = conn.execute("SELECT cuisine_filename, cuisine_name FROM cuisines_index").fetchall()
+            except sqlite3.Error:
+                cuisines = []
+            finally:
+                conn.close()
+        # Cuisine files missing from the index are still registered by filename
+        indexed = {cuisine_filename for cuisine_filename, _ in cuisines}
+        cuisines += [
+            (filename, None)
+            for filename in filenames
+            if filename.endswith(".db")
+            and filename not in indexed
+            and filename not in ("refrigerator.db", "cuisines_index.db")
+        ]
+        return {
+            "has_refrigerator": "refrigerator.db" in filenames,
+            "has_cuisine_system": "cuisines_index.db" in filenames,
+            "cuisines": [cuisine for cuisine in cuisines if cuisine[0] in filenames],
+        }
+
+    @staticmethod
+    def _scan_archive(archive_path: str) -> Dict:
+        with tarfile.open(archive_path, "r:gz") as archive:
+            filenames = set(archive.getnames())
+        return {
+            "has_refrigerator": "refrigerator.db" in filenames,
+            "has_cuisine_system": "cuisines_index.db" in filenames,
+            "cuisines": [
+                (filename, None)
+                for filename in filenames
+                if filename.endswith(".db") and filename not in ("refrigerator.db", "cuisines_index.db")
+            ],
+        }
+
+    def rebuild(self) -> int:
+        """Rebuild the registry from the user folders and cold storage archives
+
+        Returns:
+            Number of users registered
+        """
+        scanned = {}
+        for entry in os.scandir(self.base_folder):
+            if entry.is_dir() and entry.name.startswith("user_"):
+                try:
+                    scanned[int(entry.name[len("user_"):])] = (entry.name, self._scan_folder(entry.path), False)
+                except (ValueError, OSError):
+                    continue
+
+        # Users packed away by ColdStorage only exist as archives
+        archive_folder = os.path.join(self.base_folder, "archive")
+        if os.path.isdir(archive_folder):
+            for entry in os.scandir(archive_folder):
+                if not (entry.name.startswith("user_") and entry.name.endswith(".tar.gz")):
+                    continue
+                folder_name = entry.name[: -len(".tar.gz")]
+                try:
+                    user_id = int(folder_name[len("user_"):])
+                    if user_id not in scanned:
+                        scanned[user_id] = (folder_name, self._scan_archive(entry.path), True)
+                except (ValueError, OSError, tarfile.TarError):
+                    continue
+
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM user_cuisines")
+            conn.executemany(
+                """
+            INSERT INTO users (user_id, folder, has_refrigerator, has_cuisine_system, archived)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                folder = excluded.folder,
+                has_refrigerator = excluded.has_refrigerator,
+                has_cuisine_system = excluded.has_cuisine_system,
+                archived = excluded.archived
+            """,
+                [
+                    (
+                        user_id,
+                        folder,
+                        int(state["has_refrigerator"]),
+                        int(state["has_cuisine_system"]),
+                        int(archived),
+                    )
+                    for user_id, (folder, state, archived) in scanned.items()
+                ],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO user_cuisines (user_id, cuisine_filename, cuisine_name) VALUES (?, ?, ?)",
+                [
+                    (user_id, cuisine_filename, cuisine_name)
+                    for user_id, (_, state, _) in scanned.items()
+                    for cuisine_filename, cuisine_name in state["cuisines"]
+                ],
+            )
+        conn.close()
+        self.load()
+        return len(scanned)
+
+    def has_folder(self, user_id: int) -> bool:
+        """Check if a user has a personal folder
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            True if the folder was created
+        """
+        return user_id in self._folders
+
+    def has_refrigerator(self, user_id: int) -> bool:
+        """Check if a user has a refrigerator database
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            True if the refrigerator was created
+        """
+        return user_id in self._refrigerators
+
+    def has_cuisine_system(self, user_id: int) -> bool:
+        """Check if a user has a cuisines index database
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            True if the cuisine system was set up
+        """
+        return user_id in self._cuisine_systems
+
+    def has_cuisine(self, user_id: int, cuisine_filename: str) -> bool:
+        """Check if a user has a cuisine database
+
+        Args:
+            user_id: Telegram user ID
+            cuisine_filename: File name of the cuisine database
+
+        Returns:
+            True if the cuisine was created
+        """
+        return cuisine_filename in self._cuisines.get(user_id, ())
+
+    def is_archived(self, user_id: int) -> Optional[bool]:
+        """Check if a user's folder is packed away by cold storage
+
+        Read from the database, not memory, since the archiver may run in
+        another process.
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            True if archived, False if not, None if the user isn't registered
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT archived FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        conn.close()
+        return bool(row[0]) if row else None
+
+    def set_archived(self, user_id: int, archived: bool):
+        """Record that a user was archived or restored
+
+        Args:
+            user_id: Telegram user ID
+            archived: True after archiving, False after restoring
+        """
+        self._set_flag(user_id, "archived", int(archived))
+
+    def _set_flag(self, user_id: int, column: str, value):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                f"""
+            INSERT INTO users (user_id, {column}) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET {column} = excluded.{column}
+            """,
+                (user_id, value),
+            )
+        conn.close()
+
+    def register_folder(self, user_id: int, folder: str):
+        """Record that a user's folder was created
+
+        Args:
+            user_id: Telegram user ID
+            folder: Folder name relative to the base folder
+        """
+        self._set_flag(user_id, "folder", folder)
+        self._folders.add(user_id)
+
+    def register_refrigerator(self, user_id: int):
+        """Record that a user's refrigerator was created
+
+        Args:
+            user_id: Telegram user ID
+        """
+        self._set_flag(user_id, "has_refrigerator", 1)
+        self._refrigerators.add(user_id)
+
+    def register_cuisine_system(self, user_id: int):
+        """Record that a user's cuisines index was created
+
+        Args:
+            user_id: Telegram user ID
+        """
+        self._set_flag(user_id, "has_cuisine_system", 1)
+        self._cuisine_systems.add(user_id)
+
+    def register_cuisine(self, user_id: int, cuisine_name: str, cuisine_filename: str):
+        """Record that a cuisine database was created
+
+        Args:
+            user_id: Telegram user ID
+            cuisine_name: Name of the cuisine
+            cuisine_filename: File name of the cuisine database
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+            INSERT OR REPLACE INTO user_cuisines (user_id, cuisine_filename, cuisine_name)
+            VALUES (?, ?, ?)
+            """,
+                (user_id, cuisine_filename, cuisine_name),
+            )
+        conn.close()
+        with self._lock:
+            self._cuisines.setdefault(user_id, set()).add(cuisine_filename)
+
+    def touch(self, user_id: int, force: bool = False):
+        """Record that a user was active
+
+        Args:
+            user_id: Telegram user ID
+            force: Write even if the user was recorded less than ``touch_interval`` ago
+        """
+        now = time.time()
+        if not force and now - self._last_touch.get(user_id, 0.0) < self.touch_interval:
+            return
+        self._last_touch[user_id] = now
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+            INSERT INTO users (user_id, last_active) VALUES (?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET last_active = excluded.last_active
+            """,
+                (user_id, now),
+            )
+        conn.close()
+
+    def get_last_active(self, user_id: int) -> Optional[float]:
+        """Get the last recorded activity of a user
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Unix timestamp, or None if never recorded
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT last_active FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    def activity_histogram(self, bucket_days: Tuple[int, ...] = (1, 7, 30, 90, 365)) -> Dict[str, int]:
+        """Count users by how recently they were active (for capacity planning)
+
+        Args:
+            bucket_days: Upper bounds of the buckets in days
+
+        Returns:
+            Mapping of bucket label ("<= 7d", ..., "older", "never") to user count
+        """
+        now = time.time()
+        histogram = {f"<= {days}d": 0 for days in bucket_days}
+        histogram["older"] = 0
+        histogram["never"] = 0
+        conn = self._connect()
+        for (last_active,) in conn.execute("SELECT last_active FROM users WHERE folder IS NOT NULL"):
+            if last_active is None:
+                histogram["never"] += 1
+                continue
+            idle_days = (now - last_active) / 86400
+            for days in bucket_days:
+                if idle_days <= days:
+                    histogram[f"<= {days}d"] += 1
+                    break
+            else:
+                histogram["older"] += 1
+        conn.close()
+        return histogram
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Usage: python user_registry.py [base_folder] [--rebuild]
+    folder = next((arg for arg in sys.argv[1:] if not arg.startswith("--")), "user_databases")
+    registry = UserRegistry(folder)
+    if "--rebuild" in sys.argv:
+        print(f"Registered {registry.rebuild()} users")
+    print("Users by last activity:")
+    for label, count in registry.activity_histogram().items():
+        print(f"  {label:>8}: {count}")
@@ -2,15 +2,54 @@ from telegram import Update
 from telegram.ext import ContextTypes, MessageHandler, filters
 import sys
 import os
+import asyncio
+import tempfile
+import csv
+import sqlite3
 
 # Add the DBs folder to the path so we can import our database classes
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "DBs"))
-from refrigerator_db import RefrigeratorDB
+from refrigerator_db import RefrigeratorDB, format_quantity, normalize_quantity
 from cuisine_db import CuisineDB
-
-# Initialize the database handlers
-fridge_db = RefrigeratorDB()
-cuisine_db = CuisineDB()
+from user_data_transfer import UserDataTransfer, EXPORT_FORMATS
+from Recipes import RecipeCatalog
+from eco_score import EcoScorer, normalize_ingredient_name, parse_amount
+from meal_planner import MealPlanner, parse_expiry
+from cold_storage import ColdStorage
+from user_registry import UserRegistry
+from ingredient_dictionary import IngredientDictionary
+from similar_cuisines import SimilarCuisineIndex
+from reply_rendering import MessageTemplate, ReplyCache, render_listing
+from user_query import UserQueryLayer
+
+# Initialize the database handlers (archived users are restored on their next access)
+registry = UserRegistry()
+cold_storage = ColdStorage(registry=registry)
+ingredient_dictionary = IngredientDictionary()
+fridge_db = RefrigeratorDB(
+    cold_storage=cold_storage, ingredient_dictionary=ingredient_dictionary, registry=registry
+)
+cuisine_db = CuisineDB(cold_storage=cold_storage, ingredient_dictionary=ingredient_dictionary, registry=registry)
+data_transfer = UserDataTransfer(fridge_db, cuisine_db)
+recipe_catalog = RecipeCatalog()
+eco_scorer = EcoScorer(cuisine_db)
+meal_planner = MealPlanner(fridge_db, cuisine_db)
+similar_cuisines = SimilarCuisineIndex(cuisine_db)
+user_query = UserQueryLayer(fridge_db, cuisine_db)
+
+# Rendered listings are reused until the user's data changes
+reply_cache = ReplyCache()
+fridge_db.add_change_listener(reply_cache.invalidate)
+cuisine_db.add_change_listener(reply_cache.invalidate)
+
+# Longest meal plan that can be requested with /mealplan
+MAX_MEAL_PLAN_DAYS = 14
+
+# Cuisines suggested by /selectfood without arguments
+SELECT_FOOD_SUGGESTIONS = 10
+
+# Exports larger than this spill from memory to a temporary file
+EXPORT_SPOOL_SIZE = 1024 * 1024
 
 # Store user states for conversation flow
 user_states = {}
@@ -18,26 +57,48 @@ user_states = {}
 user_context = {}
 
 
+# Listing templates, compiled once at import
+EMPTY_CUISINES_TEMPLATE = MessageTemplate(
+    "🍳 Welcome back to your cuisine collection, {user_name}!\n\n"
+    "You don't have any cuisines yet.\n\n"
+    "💡 Type the name of a cuisine to create it!\n"
+    "Example: Type 'Lasagne' to create a lasagne.db file\n"
+    "📝 Note: After creating, you'll be asked to add ingredients for 1 person."
+)
+CUISINES_HEADER_TEMPLATE = MessageTemplate(
+    "🍳 Welcome back to your cuisine collection, {user_name}!\n\n📋 Your existing cuisines:\n\n"
+)
+CUISINES_FOOTER_TEMPLATE = MessageTemplate(
+    "\n📊 Total cuisines: {count}"
+    "\n\n💡 Type the name of a new cuisine to create it!"
+    "\n📝 Note: After creating, you'll be asked to add ingredients for 1 person."
+)
+EMPTY_REFRIGERATOR_TEMPLATE = MessageTemplate(
+    "🧊 Welcome back to your refrigerator, {user_name}!\n\n"
+    "Your refrigerator is currently empty.\n"
+    "Use /additem to add items to your refrigerator!"
+)
+REFRIGERATOR_HEADER_TEMPLATE = MessageTemplate(
+    "🧊 Welcome back to your refrigerator, {user_name}!\n\n📋 Your current items:\n\n"
+)
+REFRIGERATOR_FOOTER_TEMPLATE = MessageTemplate(
+    "\n📊 Total items: {count}\n\nUse /additem to add more items!"
+)
+
+
 def build_existing_cuisine_message(user_name, cuisines):
     if not cuisines:
-        message = f"🍳 Welcome back to your cuisine collection, {user_name}!\n\n"
-        message += "You don't have any cuisines yet.\n\n"
-        message += "💡 Type the name of a cuisine to create it!\n"
-        message += "Example: Type 'Lasagne' to create a lasagne.db file\n"
-        message += "📝 Note: After creating, you'll be asked to add ingredients for 1 person."
-    else:
-        message = f"🍳 Welcome back to your cuisine collection, {user_name}!\n\n"
-        message += "📋 Your existing cuisines:\n\n"
-        for cuisine in cuisines:
-            _, cuisine_name, _, description, _ = cuisine
-            message += f"• {cuisine_name}"
-            if description:
-                message += f" - {description}"
-            message += "\n"
-        message += f"\n📊 Total cuisines: {len(cuisines)}"
-        message += "\n\n💡 Type the name of a new cuisine to create it!"
-        message += "\n📝 Note: After creating, you'll be asked to add ingredients for 1 person."
-    return message
+        return EMPTY_CUISINES_TEMPLATE.render(user_name=user_name)
+    return render_listing(
+        CUISINES_HEADER_TEMPLATE.render(user_name=user_name),
+        (
+            f"• {cuisine.cuisine_name} - {cuisine.description}"
+            if cuisine.description
+            else f"• {cuisine.cuisine_name}"
+            for cuisine in cuisines
+        ),
+        CUISINES_FOOTER_TEMPLATE.render(count=len(cuisines)),
+    )
 
 def build_new_cuisine_system_message(user_name, folder_created):
     if folder_created:
@@ -62,11 +123,18 @@ async def new_cuisine(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
     # Check if user already has cuisine system
     if cuisine_db.user_has_cuisine_system(user_id):
-        # Load existing cuisines and show them
-        cuisines = cuisine_db.get_cuisines(user_id)
-        message = build_existing_cuisine_message(user_name, cuisines)
+        # Show existing cuisines (served from the cache until they change)
+        chunks = reply_cache.get_or_render(
+            user_id,
+            "cuisines",
+            lambda: build_existing_cuisine_message(user_name, cuisine_db.get_cuisines(user_id)),
+            variant=user_name,
+        )
         # Set user state to expect cuisine name
         user_states[user_id] = "waiting_for_cuisine_name"
+        for chunk in chunks:
+            await update.message.reply_text(chunk)
+        return
     else:
         # Create new cuisine system
         success = cuisine_db.create_cuisine_index_database(user_id)
@@ -83,21 +151,17 @@ async def new_cuisine(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
 def build_existing_refrigerator_message(user_name, items):
     if not items:
-        message = f"🧊 Welcome back to your refrigerator, {user_name}!\n\n"
-        message += "Your refrigerator is currently empty.\n"
-        message += "Use /additem to add items to your refrigerator!"
-    else:
-        message = f"🧊 Welcome back to your refrigerator, {user_name}!\n\n"
-        message += "📋 Your current items:\n\n"
-        for item in items:
-            _, item_name, quantity, unit, expiry_date, _ = item
-            message += f"• {item_name}: {quantity} {unit}"
-            if expiry_date:
-                message += f" (expires: {expiry_date})"
-            message += "\n"
-        message += f"\n📊 Total items: {len(items)}"
-        message += "\n\nUse /additem to add more items!"
-    return message
+        return EMPTY_REFRIGERATOR_TEMPLATE.render(user_name=user_name)
+    return render_listing(
+        REFRIGERATOR_HEADER_TEMPLATE.render(user_name=user_name),
+        (
+            f"• {item.item_name}: {format_quantity(item.quantity)} {item.unit} (expires: {item.expiry_date})"
+            if item.expiry_date
+            else f"• {item.item_name}: {format_quantity(item.quantity)} {item.unit}"
+            for item in items
+        ),
+        REFRIGERATOR_FOOTER_TEMPLATE.render(count=len(items)),
+    )
 
 def build_new_refrigerator_message(user_name, folder_created):
     if folder_created:
@@ -122,9 +186,16 @@ async def new_refrigerator(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
     # Check if user already has a refrigerator
     if fridge_db.user_has_refrigerator(user_id):
-        # Load existing refrigerator and show items
-        items = fridge_db.get_refrigerator_items(user_id)
-        message = build_existing_refrigerator_message(user_name, items)
+        # Show existing items (served from the cache until they change)
+        chunks = reply_cache.get_or_render(
+            user_id,
+            "refrigerator",
+            lambda: build_existing_refrigerator_message(user_name, fridge_db.get_refrigerator_items(user_id)),
+            variant=user_name,
+        )
+        for chunk in chunks:
+            await update.message.reply_text(chunk)
+        return
     else:
         # Create new refrigerator
         success = fridge_db.create_user_refrigerator(user_id)
@@ -211,7 +282,12 @@ async def handle_text_message(
         message += "🍳 /newcuisine - Create or view cuisines\n"
         message += "🧊 /newrefrigerator - Create or view refrigerator\n"
         message += "📝 /addingredient - Add ingredients to cuisine\n"
-        message += "🥗 /additem - Add items to refrigerator"
+        message += "🥗 /additem - Add items to refrigerator\n"
+        message += "📖 /recipes - Recipe ideas for your refrigerator\n"
+        message += "🗓️ /mealplan - Plan meals that use up your refrigerator\n"
+        message += "🔗 /similar - Cuisines like one of yours\n"
+        message += "📤 /export - Download your data\n"
+        message += "📥 /import - Upload previously exported data"
         await update.message.reply_text(message)
 
 
@@ -356,10 +432,8 @@ async def handle_ingredient_input(update, text, user_id, user_name):
     )
 
     if success:
-        # Update context
-        user_context[user_id]["ingredients_added"] += 1
-        ingredients_count = user_context[user_id]["ingredients_added"]
-
+        context_data["ingredients_added"] += 1
+        ingredients_count = context_data["ingredients_added"]
         message = f"✅ Added ingredient #{ingredients_count}:\n"
         message += f"• {ingredient_name}: {amount} {unit}"
         if category != "other":
@@ -392,10 +466,10 @@ async def add_item(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     if not args:
         message = "📝 Please specify an item to add!\n\n"
-        message += "Usage: /additem <item_name> [quantity] [unit]\n\n"
+        message += "Usage: /additem <item_name> [quantity] [unit] [expiry YYYY-MM-DD]\n\n"
         message += "Examples:\n"
         message += "• /additem Apples 5 pieces\n"
-        message += "• /additem Milk 1 liter\n"
+        message += "• /additem Milk 1 liter 2024-05-30\n"
         message += "• /additem Bread 2 loaves\n"
         message += "• /additem Eggs (default: 1 pieces)"
         await update.message.reply_text(message)
@@ -405,23 +479,38 @@ async def add_item(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     item_name = args[0]
     quantity = 1
     unit = "pieces"
+    expiry_date = None
 
     if len(args) >= 2:
-        try:
-            quantity = int(args[1])
-        except ValueError:
+        parsed_quantity = parse_amount(args[1])
+        if parsed_quantity is None or parsed_quantity <= 0:
             unit = args[1]  # If second arg is not a number, treat it as unit
+        else:
+            quantity = normalize_quantity(parsed_quantity)
 
     if len(args) >= 3:
         unit = args[2]
 
+    if len(args) >= 4:
+        expiry = parse_expiry(args[3])
+        if expiry is None:
+            message = "❌ Expiry date must look like YYYY-MM-DD, e.g. 2024-05-30."
+            await update.message.reply_text(message)
+            return
+        expiry_date = expiry.isoformat()
+
     # Add item to refrigerator
-    success = fridge_db.add_item_to_refrigerator(user_id, item_name, quantity, unit)
+    success = fridge_db.add_item_to_refrigerator(
+        user_id, item_name, quantity, unit, expiry_date
+    )
 
     if success:
         message = "✅ Successfully added to your refrigerator!\n\n"
         message += f"📦 Item: {item_name}\n"
-        message += f"📊 Quantity: {quantity} {unit}\n\n"
+        message += f"📊 Quantity: {format_quantity(quantity)} {unit}\n"
+        if expiry_date:
+            message += f"📅 Expires: {expiry_date}\n"
+        message += "\n"
         message += "Use /newrefrigerator to view all your items!"
     else:
         message = f"❌ Sorry {user_name}, there was an error adding the item.\n"
@@ -437,16 +526,335 @@ async def edit_recipe(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
 
 async def eco_cuisine(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text(
-        f"Eco-friendly cuisine suggestions, {update.effective_user.first_name}"
-    )
+    """Handle the /ecocuisine command (usage: /ecocuisine [servings])"""
+    user_id = update.effective_user.id
+    user_name = update.effective_user.first_name
+
+    servings = 1
+    if context.args:
+        try:
+            servings = max(int(context.args[0]), 1)
+        except ValueError:
+            message = "❌ Usage: /ecocuisine [servings]"
+            await update.message.reply_text(message)
+            return
+
+    if not cuisine_db.user_has_cuisine_system(user_id):
+        message = f"❌ {user_name}, you don't have any cuisines yet!\n"
+        message += "Use /newcuisine to create your first cuisine."
+        await update.message.reply_text(message)
+        return
+
+    scores = eco_scorer.score_cuisines(user_id, servings)
+    if not scores:
+        message = f"❌ {user_name}, you don't have any cuisines yet!\n"
+        message += "Use /newcuisine to create your first cuisine."
+        await update.message.reply_text(message)
+        return
+
+    message = f"🌍 Eco footprint of your cuisines, {user_name}"
+    message += f" ({servings} servings):\n\n" if servings > 1 else " (per serving):\n\n"
+    for score in scores:
+        total = score["total"]
+        message += f"• {score['cuisine_name']}: {total['co2_kg']:.2f} kg CO2e, {total['water_l']:.0f} L water"
+        if score["unmatched"]:
+            message += f" (unknown: {', '.join(score['unmatched'])})"
+        if score["unparsed"]:
+            message += f" (no amount: {', '.join(score['unparsed'])})"
+        if score["unscored"]:
+            message += f" (unknown unit: {', '.join(score['unscored'])})"
+        message += "\n"
+    message += "\n🌱 Cuisines are listed from the lowest to the highest CO2 footprint."
+
+    await update.message.reply_text(message)
 
 
 async def select_food(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text(
-        f"Select food options, {update.effective_user.first_name}"
-    )
+    """Handle the /selectfood command (usage: /selectfood <cuisine name> [servings])
+
+    Cooks the cuisine: its ingredients are taken out of the refrigerator
+    in one transaction.
+    """
+    user_id = update.effective_user.id
+    user_name = update.effective_user.first_name
+    args = context.args
+
+    if not args:
+        message = "🍽️ Please specify the cuisine you are cooking!\n\n"
+        message += "Usage: /selectfood <cuisine name> [servings]\n\n"
+        message += "Example: /selectfood Lasagne 2"
+        if fridge_db.user_has_refrigerator(user_id) and cuisine_db.user_has_cuisine_system(user_id):
+            # Joined inside SQLite across the refrigerator and all cuisine databases
+            coverage = [row for row in user_query.coverage(user_id) if row[1]]
+            if coverage:
+                message += "\n\n🧊 Your cuisines by what's already in your refrigerator:\n"
+                for cuisine_name, total, covered in coverage[:SELECT_FOOD_SUGGESTIONS]:
+                    message += f"• {cuisine_name}: {covered}/{total} ingredients\n"
+        await update.message.reply_text(message)
+        return
+
+    servings = 1
+    if len(args) > 1 and args[-1].isdigit():
+        servings = max(int(args[-1]), 1)
+        args = args[:-1]
+    cuisine_name = " ".join(args)
+
+    if not fridge_db.user_has_refrigerator(user_id):
+        message = f"❌ {user_name}, you don't have a refrigerator yet!\n"
+        message += "Use /newrefrigerator to create one first."
+        await update.message.reply_text(message)
+        return
+
+    if not cuisine_db.cuisine_exists(user_id, cuisine_name):
+        message = f"❌ Cuisine '{cuisine_name}' doesn't exist!\n"
+        message += "Use /newcuisine to view your cuisines."
+        await update.message.reply_text(message)
+        return
+
+    # Ingredients are stored for 1 person
+    requirements = []
+    unparsed = []
+    for ingredient in cuisine_db.get_cuisine_ingredients(user_id, cuisine_name):
+        _, ingredient_name, amount, unit, _, _, _ = ingredient
+        quantity = parse_amount(amount)
+        if quantity is None:
+            unparsed.append(ingredient_name)
+        else:
+            requirements.append((ingredient_name, quantity * servings, unit))
+
+    result = fridge_db.consume_items(user_id, requirements, normalize_ingredient_name)
+
+    message = f"🍽️ Enjoy your {cuisine_name} ({servings} servings), {user_name}!\n\n"
+    if result["consumed"]:
+        message += "🧊 Taken from your refrigerator:\n"
+        for item_name, quantity, unit in result["consumed"]:
+            message += f"• {item_name}: {format_quantity(quantity)} {unit}\n"
+    else:
+        message += "🧊 Nothing was taken from your refrigerator.\n"
+    if result["missing"] or unparsed:
+        message += "\n🛒 Not in your refrigerator:\n"
+        for item_name, quantity, unit in result["missing"]:
+            message += f"• {item_name}: {format_quantity(quantity)} {unit}\n"
+        for item_name in unparsed:
+            message += f"• {item_name}\n"
+
+    await update.message.reply_text(message)
+
+
+async def meal_plan(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /mealplan command (usage: /mealplan [days])"""
+    user_id = update.effective_user.id
+    user_name = update.effective_user.first_name
+
+    days = 7
+    if context.args:
+        try:
+            days = min(max(int(context.args[0]), 1), MAX_MEAL_PLAN_DAYS)
+        except ValueError:
+            message = "❌ Usage: /mealplan [days]"
+            await update.message.reply_text(message)
+            return
+
+    plan = meal_planner.plan(user_id, days)
+    if not plan:
+        message = f"❌ {user_name}, you don't have any cuisines yet!\n"
+        message += "Use /newcuisine to create your first cuisine."
+        await update.message.reply_text(message)
+        return
+
+    message = f"🗓️ Your {days}-day meal plan, {user_name}:\n\n"
+    for day in plan:
+        message += f"📅 {day['date'].strftime('%a %d %b')}: {day['cuisine_name']}\n"
+        if day["uses"]:
+            message += f"   🧊 Uses: {', '.join(day['uses'])}\n"
+        if day["buy"]:
+            message += f"   🛒 Buy: {', '.join(day['buy'])}\n"
+    message += "\n♻️ Items that expire soonest are used first."
+
+    await update.message.reply_text(message)
+
+
+async def similar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /similar command (usage: /similar <cuisine_name>)"""
+    user_id = update.effective_user.id
+    user_name = update.effective_user.first_name
+
+    if not context.args:
+        message = "❌ Usage: /similar <cuisine_name>\n\n"
+        message += "🤝 Use /sharecuisines on to let other cooks discover your cuisines too."
+        await update.message.reply_text(message)
+        return
+
+    cuisine_name = " ".join(context.args)
+    if not cuisine_db.cuisine_exists(user_id, cuisine_name):
+        message = f"❌ {user_name}, you don't have a cuisine called '{cuisine_name}'."
+        await update.message.reply_text(message)
+        return
+
+    results = similar_cuisines.find_similar(user_id, cuisine_name)
+    if not results:
+        message = f"🔗 No cuisines similar to '{cuisine_name}' yet."
+        await update.message.reply_text(message)
+        return
+
+    message = f"🔗 Cuisines like '{cuisine_name}':\n\n"
+    for result in results:
+        message += f"• {result['cuisine_name']} ({result['similarity']:.0%} alike)"
+        if not result["own"]:
+            message += " - from another cook"
+        message += "\n"
+
+    await update.message.reply_text(message)
+
+
+async def share_cuisines(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /sharecuisines command (usage: /sharecuisines [on|off])"""
+    user_id = update.effective_user.id
+
+    if not context.args or context.args[0].lower() not in ("on", "off"):
+        status = "on" if similar_cuisines.is_sharing(user_id) else "off"
+        message = f"🤝 Sharing your cuisines in other cooks' /similar suggestions is {status}.\n"
+        message += "Usage: /sharecuisines on|off"
+        await update.message.reply_text(message)
+        return
+
+    shared = context.args[0].lower() == "on"
+    similar_cuisines.set_sharing(user_id, shared)
+    if shared:
+        # Make sure cuisines created before the index existed can be found
+        similar_cuisines.index_user(user_id)
+        message = "✅ Your cuisines can now show up in other cooks' /similar suggestions."
+    else:
+        message = "✅ Your cuisines are private again."
+    await update.message.reply_text(message)
+
+
+async def recipes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /recipes command (usage: /recipes [search words])"""
+    user_id = update.effective_user.id
+    user_name = update.effective_user.first_name
+
+    if context.args:
+        query = " ".join(context.args)
+        results = recipe_catalog.search(query)
+        if not results:
+            message = f"🔍 No recipes found for '{query}'."
+        else:
+            message = f"🔍 Recipes matching '{query}':\n\n"
+            for _, recipe_name in results:
+                message += f"• {recipe_name}\n"
+        await update.message.reply_text(message)
+        return
+
+    items = fridge_db.get_refrigerator_items(user_id)
+    if not items:
+        message = f"🧊 {user_name}, your refrigerator is empty!\n"
+        message += "Use /additem to add items, or search with /recipes <words>."
+        await update.message.reply_text(message)
+        return
+
+    item_names = [item[1] for item in items]
+    suggestions = recipe_catalog.suggest_for_ingredients(item_names)
+    if not suggestions:
+        message = "📖 No recipes in the catalog match your refrigerator yet."
+        await update.message.reply_text(message)
+        return
+
+    message = f"📖 Recipe ideas for your refrigerator, {user_name}:\n\n"
+    for suggestion in suggestions:
+        ingredient_list = ", ".join(ingredient for ingredient, _ in suggestion["ingredients"])
+        message += f"• {suggestion['name']}"
+        if ingredient_list:
+            message += f" ({ingredient_list})"
+        message += "\n"
+
+    await update.message.reply_text(message)
+
+
+async def export_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /export command (usage: /export [ndjson|csv])"""
+    user_id = update.effective_user.id
+    user_name = update.effective_user.first_name
+
+    fmt = context.args[0].lower() if context.args else "ndjson"
+    if fmt not in EXPORT_FORMATS:
+        message = "❌ Unknown export format!\n\n"
+        message += "Usage: /export [ndjson|csv]"
+        await update.message.reply_text(message)
+        return
+
+    if not fridge_db.user_has_refrigerator(user_id) and not cuisine_db.user_has_cuisine_system(user_id):
+        message = f"❌ {user_name}, you don't have any data to export yet!\n"
+        message += "Use /newrefrigerator or /newcuisine to get started."
+        await update.message.reply_text(message)
+        return
+
+    # Stream the export into a spooled file so large users don't sit in memory;
+    # the export runs in a thread so other updates keep being handled meanwhile
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE) as export_file:
+        await asyncio.to_thread(data_transfer.write_export, user_id, export_file, fmt)
+        export_file.seek(0)
+        await update.message.reply_document(
+            document=export_file,
+            filename=f"ecocuisine_{user_id}.{fmt}",
+            caption="📤 Here is your EcoCuisine data. Send it back after /import to restore it.",
+        )
+
+
+async def import_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /import command"""
+    user_id = update.effective_user.id
+
+    message = "📥 Please send the exported .ndjson or .csv file as a document.\n\n"
+    message += "Existing cuisines with the same name are kept and not overwritten."
+
+    user_states[user_id] = "waiting_for_import_file"
+
+    await update.message.reply_text(message)
+
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle uploaded documents (used by /import)"""
+    user_id = update.effective_user.id
+    user_name = update.effective_user.first_name
+
+    if user_states.get(user_id) != "waiting_for_import_file":
+        message = "📎 To restore your data from a file, use /import first."
+        await update.message.reply_text(message)
+        return
+
+    user_states.pop(user_id, None)
+
+    # Download to disk and stream from there instead of holding the upload in memory
+    fd, tmp_path = tempfile.mkstemp(suffix=".import")
+    os.close(fd)
+    try:
+        telegram_file = await update.message.document.get_file()
+        await telegram_file.download_to_drive(custom_path=tmp_path)
+        counts = await asyncio.to_thread(data_transfer.import_file, user_id, tmp_path)
+    except (ValueError, KeyError, UnicodeDecodeError, csv.Error):
+        message = f"❌ Sorry {user_name}, that file doesn't look like an EcoCuisine export."
+        await update.message.reply_text(message)
+        return
+    except sqlite3.Error:
+        message = f"❌ Sorry {user_name}, there was an error saving the imported data.\n"
+        message += "Please try again later."
+        await update.message.reply_text(message)
+        return
+    finally:
+        os.remove(tmp_path)
+
+    message = "✅ Import finished!\n\n"
+    message += f"🧊 Refrigerator items: {counts['refrigerator_items']}\n"
+    message += f"🍳 Cuisines: {counts['cuisines']}\n"
+    message += f"📝 Ingredients: {counts['ingredients']}"
+    if counts["skipped"]:
+        message += f"\n⏭️ Skipped records: {counts['skipped']}"
+
+    await update.message.reply_text(message)
 
 
 # Message handler for text input
 text_handler = MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message)
+# Message handler for uploaded documents
+document_handler = MessageHandler(filters.Document.ALL, handle_document)
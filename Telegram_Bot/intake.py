@@ -0,0 +1,268 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Deque, Dict, Hashable, List, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+# Lower value = served first
+PRIORITY_COMMAND = 0
+PRIORITY_DOCUMENT = 1
+PRIORITY_TEXT = 2
+
+# Every update enters do_process_update right away; the intake queue does the limiting
+UNLIMITED_UPDATES = 2**31 - 1
+
+
+class IntakeUpdateProcessor(BaseUpdateProcessor):
+    """Bounded priority intake queue in front of the handlers
+
+    Every user has a first-in, first-out queue of waiting updates, and
+    a user's next update is only started once the previous one has been
+    handled, so one user's messages are never reordered or interleaved
+    (the conversation state in the handlers depends on their order).
+    Only the next update of each idle user is in the priority heap
+    (commands before documents before free text, oldest first within a
+    priority). At most ``workers`` updates are handled at once. When the queue is full the least
+    important, oldest update is shed. Updates older than
+    ``stale_seconds`` are never handled: stale commands get a short
+    reply, stale free text is dropped. This keeps the latency of fresh
+    updates flat no matter how large the backlog after an outage is.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        max_depth: int = 1000,
+        stale_seconds: float = 300.0,
+    ):
+        """Initialize the intake queue
+
+        Args:
+            workers: Number of updates handled concurrently
+            max_depth: Maximum number of waiting updates
+            stale_seconds: Age after which an update is shed instead of handled
+        """
+        super().__init__(UNLIMITED_UPDATES)
+        self.workers = workers
+        self.max_depth = max_depth
+        self.stale_seconds = stale_seconds
+        # Heap of the first waiting update of each idle user
+        self._queue: List = []
+        # Updates waiting behind each user's entry in the heap or running update
+        self._user_queues: Dict[Hashable, Deque[List]] = {}
+        self._waiting = 0
+        self._sequence = itertools.count()
+        self._worker_slots = asyncio.Semaphore(workers)
+        self.metrics = {
+            "queue_depth": 0,
+            "max_queue_depth": 0,
+            "processed": 0,
+            "shed_stale": 0,
+            "shed_overflow": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    async def initialize(self) -> None:
+        """Nothing to set up"""
+
+    async def shutdown(self) -> None:
+        """Shed whatever is still waiting"""
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            self._finish(entry)
+        for user_queue in self._user_queues.values():
+            while user_queue:
+                self._finish(user_queue.popleft())
+        self._user_queues.clear()
+        self._waiting = 0
+
+    @staticmethod
+    def get_user_key(update: object, sequence: int) -> Hashable:
+        """Get the key whose updates are kept in order
+
+        Args:
+            update: Incoming update
+            sequence: Sequence number of the update (key of updates without a user)
+
+        Returns:
+            The user ID, or a key of its own for updates without a user
+        """
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            return ("update", sequence)
+        return user.id
+
+    @staticmethod
+    def get_priority(update: object) -> int:
+        """Classify an update
+
+        Args:
+            update: Incoming update
+
+        Returns:
+            One of the PRIORITY_* constants
+        """
+        message = update.effective_message if isinstance(update, Update) else None
+        if message is None:
+            return PRIORITY_TEXT
+        if message.text and message.text.startswith("/"):
+            return PRIORITY_COMMAND
+        if message.document is not None:
+            return PRIORITY_DOCUMENT
+        return PRIORITY_TEXT
+
+    @staticmethod
+    def get_age(update: object) -> float:
+        """Get the age of an update in seconds (0 if it has no message date)
+
+        Args:
+            update: Incoming update
+
+        Returns:
+            Seconds since the message was sent
+        """
+        message = update.effective_message if isinstance(update, Update) else None
+        if message is None or message.date is None:
+            return 0.0
+        return (datetime.now(timezone.utc) - message.date).total_seconds()
+
+    @staticmethod
+    def _finish(entry: List):
+        # Entries are [priority, sequence, enqueued_at, update, coroutine, done_event, user_key]
+        coroutine = entry[4]
+        if hasattr(coroutine, "close"):
+            coroutine.close()
+        entry[5].set()
+
+    async def _reply_shed(self, update: object, stale: bool):
+        if self.get_priority(update) != PRIORITY_COMMAND:
+            return
+        if stale:
+            text = "⏳ This command arrived while the bot was unavailable. Please send it again."
+        else:
+            text = "⏳ The bot is very busy right now. Please try again in a minute."
+        try:
+            await update.effective_message.reply_text(text)
+        except Exception:  # the reply is best effort, the update is shed either way
+            pass
+
+    def _enqueue(self, entry: List):
+        user_queue = self._user_queues.get(entry[6])
+        if user_queue is None:
+            # Nothing of this user is waiting or running: the entry goes straight into the heap
+            self._user_queues[entry[6]] = deque()
+            heapq.heappush(self._queue, entry)
+        else:
+            user_queue.append(entry)
+        self._waiting += 1
+
+    def _promote_next(self, user_key: Hashable):
+        # The user's next update (if any) becomes eligible once the previous one is done
+        user_queue = self._user_queues.get(user_key)
+        if user_queue:
+            heapq.heappush(self._queue, user_queue.popleft())
+        else:
+            self._user_queues.pop(user_key, None)
+
+    def _take_best(self) -> List:
+        # The user stays busy (their later updates keep waiting) until _promote_next
+        best = heapq.heappop(self._queue)
+        self._waiting -= 1
+        return best
+
+    def _shed_worst(self) -> List:
+        # Least important priority, oldest sequence within it, among all waiting updates
+        candidates = self._queue + [entry for queue in self._user_queues.values() for entry in queue]
+        worst = max(candidates, key=lambda entry: (entry[0], -entry[1]))
+        user_queue = self._user_queues.get(worst[6])
+        if user_queue is not None and worst in user_queue:
+            user_queue.remove(worst)
+        else:
+            self._queue.remove(worst)
+            heapq.heapify(self._queue)
+            self._promote_next(worst[6])
+        self._waiting -= 1
+        return worst
+
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        """Queue the update and run the most important waiting update when a worker is free
+
+        Args:
+            update: The update to be processed
+            coroutine: The coroutine that processes it
+        """
+        if self.get_age(update) > self.stale_seconds:
+            self.metrics["shed_stale"] += 1
+            coroutine.close()
+            await self._reply_shed(update, stale=True)
+            return
+
+        sequence = next(self._sequence)
+        entry = [
+            self.get_priority(update),
+            sequence,
+            time.monotonic(),
+            update,
+            coroutine,
+            asyncio.Event(),
+            self.get_user_key(update, sequence),
+        ]
+        self._enqueue(entry)
+        if self._waiting > self.max_depth:
+            shed = self._shed_worst()
+            self.metrics["shed_overflow"] += 1
+            self._finish(shed)
+            await self._reply_shed(shed[3], stale=False)
+        self.metrics["queue_depth"] = self._waiting
+        self.metrics["max_queue_depth"] = max(self.metrics["max_queue_depth"], self._waiting)
+
+        # Every queued update brings one worker turn. A turn serves the best entries, not
+        # necessarily its own, and keeps going while entries are eligible: a user's next
+        # update only becomes eligible when the previous one is done, after other turns
+        # may already have found the heap empty.
+        async with self._worker_slots:
+            while self._queue:
+                best = self._take_best()
+                self.metrics["queue_depth"] = self._waiting
+                if self.get_age(best[3]) > self.stale_seconds:
+                    self.metrics["shed_stale"] += 1
+                    self._finish(best)
+                    self._promote_next(best[6])
+                    await self._reply_shed(best[3], stale=True)
+                    continue
+
+                wait = time.monotonic() - best[2]
+                self.metrics["total_wait_seconds"] += wait
+                self.metrics["max_wait_seconds"] = max(self.metrics["max_wait_seconds"], wait)
+                try:
+                    await best[4]
+                finally:
+                    self.metrics["processed"] += 1
+                    best[5].set()
+                    self._promote_next(best[6])
+
+        await entry[5].wait()
+
+    def format_metrics(self) -> str:
+        """Format the intake metrics as a one-line report
+
+        Returns:
+            Human readable summary
+        """
+        metrics = self.metrics
+        average_wait = (
+            metrics["total_wait_seconds"] / metrics["processed"] if metrics["processed"] else 0.0
+        )
+        return (
+            f"Intake: depth {metrics['queue_depth']} (max {metrics['max_queue_depth']}), "
+            f"processed {metrics['processed']}, shed {metrics['shed_stale']} stale / "
+            f"{metrics['shed_overflow']} overflow, wait avg {average_wait * 1000:.1f} ms "
+            f"max {metrics['max_wait_seconds'] * 1000:.1f} ms"
+        )
@@ -0,0 +1,172 @@
+import string
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# Longest text Telegram accepts in one message
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class MessageTemplate:
+    """Reply template checked once and rendered with ``str.format``
+
+    The placeholders are parsed when the template is created, so a typo
+    fails at import time instead of on the first reply.
+    """
+
+    __slots__ = ("template", "fields", "_format")
+
+    def __init__(self, template: str):
+        """Compile a template
+
+        Args:
+            template: Text with ``{name}`` placeholders
+        """
+        self.template = template
+        self.fields = tuple(
+            field for _, field, _, _ in string.Formatter().parse(template) if field is not None
+        )
+        if any(not field.isidentifier() for field in self.fields):
+            raise ValueError(f"Only named placeholders are supported: {template!r}")
+        self._format = template.format
+
+    def render(self, **values) -> str:
+        """Fill in the placeholders
+
+        Returns:
+            Rendered text
+        """
+        return self._format(**values)
+
+
+def render_listing(header: str, lines: Iterable[str], footer: str = "") -> str:
+    """Join a listing into one text
+
+    Args:
+        header: Text before the lines
+        lines: One entry per line (without line breaks)
+        footer: Text after the lines
+
+    Returns:
+        header, the lines separated by line breaks, then footer
+    """
+    return "".join((header, "\n".join(lines), "\n", footer))
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Split a text into chunks Telegram accepts, at line breaks where possible
+
+    Args:
+        text: Text to send
+        limit: Maximum chunk length
+
+    Returns:
+        List of chunks (a single chunk for short texts)
+    """
+    if len(text) <= limit:
+        return [text]
+
+    chunks = []
+    current: List[str] = []
+    current_length = 0
+    for line in text.split("\n"):
+        # Lines longer than a whole message are cut
+        while len(line) > limit:
+            if current:
+                chunks.append("\n".join(current))
+                current, current_length = [], 0
+            chunks.append(line[:limit])
+            line = line[limit:]
+        added_length = len(line) + (1 if current else 0)
+        if current and current_length + added_length > limit:
+            chunks.append("\n".join(current))
+            current, current_length = [], 0
+            added_length = len(line)
+        current.append(line)
+        current_length += added_length
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+class ReplyCache:
+    """Rendered listing replies cached per user and data version
+
+    Every user has a data version that is increased by the database
+    change listeners. A cached reply is served as long as the version it
+    was rendered at is still current, so repeated listings skip both the
+    query and the rendering. Versions live in the process; with the
+    supervisor each user is always handled by the same worker.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_age: float = 3600.0):
+        """Initialize the cache
+
+        Args:
+            max_entries: Number of cached replies kept (least recently used are dropped)
+            max_age: Seconds after which a reply is rendered again regardless of its version
+        """
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._versions: Dict[int, int] = {}
+        self._entries: "OrderedDict[Tuple, Tuple[int, float, List[str]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_version(self, user_id: int) -> int:
+        """Get the data version of a user
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            Version number (0 until the user's data changes)
+        """
+        return self._versions.get(user_id, 0)
+
+    def invalidate(self, user_id: int, *args):
+        """Mark a user's data as changed
+
+        Registered as a change listener of RefrigeratorDB and CuisineDB.
+
+        Args:
+            user_id: Telegram user ID
+            args: Ignored listener arguments (e.g. the cuisine name)
+        """
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def get_or_render(
+        self,
+        user_id: int,
+        key: str,
+        render: Callable[[], str],
+        variant: Optional[str] = None,
+    ) -> List[str]:
+        """Get a cached reply or render and cache it
+
+        Args:
+            user_id: Telegram user ID
+            key: Name of the reply (e.g. "refrigerator")
+            render: Callable producing the reply text (queries and renders)
+            variant: Extra cache key for inputs outside the database (e.g. the user's name)
+
+        Returns:
+            Reply split into Telegram-sized chunks
+        """
+        cache_key = (user_id, key, variant)
+        version = self.get_version(user_id)
+        now = time.monotonic()
+        entry = self._entries.get(cache_key)
+        if entry is not None and entry[0] == version and now - entry[1] < self.max_age:
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        chunks = split_message(render())
+        self._entries[cache_key] = (version, now, chunks)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return chunks
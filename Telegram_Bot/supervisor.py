@@ -0,0 +1,372 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import ssl
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+# Update fields whose "from" user decides the worker
+USER_FIELDS = (
+    "message",
+    "edited_message",
+    "callback_query",
+    "inline_query",
+    "chosen_inline_result",
+    "shipping_query",
+    "pre_checkout_query",
+    "poll_answer",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+)
+
+# Seconds a stopping worker gets to finish its queued updates
+WORKER_STOP_TIMEOUT = 30.0
+# Seconds Telegram is asked to wait before resending an update refused during a rebalance
+REBALANCE_RETRY_AFTER = 5
+# Seconds a webhook connection may stay idle (also bounds the TLS handshake)
+REQUEST_TIMEOUT = 30
+
+
+def get_update_user_id(update_data: Dict) -> int:
+    """Extract the user ID an update belongs to from its raw JSON
+
+    Args:
+        update_data: Update as sent by Telegram
+
+    Returns:
+        The sender's user ID, the chat ID if there is no sender, or 0
+    """
+    for field in USER_FIELDS:
+        payload = update_data.get(field)
+        if not payload:
+            continue
+        user = payload.get("from") or payload.get("user")
+        if user:
+            return user["id"]
+        chat = payload.get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+def worker_main(slot: int, update_queue: multiprocessing.Queue):
+    """Entry point of a worker process
+
+    Args:
+        slot: Worker number (only used in log lines)
+        update_queue: Queue of raw update JSON routed to this worker (None stops it)
+    """
+    # Ctrl+C is handled by the supervisor, which stops workers through their queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_run_worker(slot, update_queue))
+
+
+async def _run_worker(slot: int, update_queue: multiprocessing.Queue):
+    from telegram import Update
+    from telegram_bot import build_application
+
+    application = build_application(with_updater=False)
+    loop = asyncio.get_running_loop()
+    async with application:
+        # run_polling/run_webhook would call these hooks; workers start the application themselves
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        print(f"Worker {slot} (pid {os.getpid()}) is running")
+        while True:
+            update_data = await loop.run_in_executor(None, update_queue.get)
+            if update_data is None:
+                break
+            await application.update_queue.put(Update.de_json(update_data, application.bot))
+        # Finish everything already handed to the application before exiting
+        await application.update_queue.join()
+        await application.stop()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+    print(f"Worker {slot} stopped")
+
+
+class Supervisor:
+    """Webhook receiver that shards updates over worker processes by user
+
+    Every update is routed by its user ID to one worker with rendezvous
+    hashing, so a user's SQLite files and conversation state are only
+    touched by one process. Crashed workers are restarted on the same
+    queue, SIGHUP restarts workers one by one (or rebalances when
+    SUPERVISOR_WORKERS changed) and SIGINT/SIGTERM stop everything after
+    the queued updates are handled.
+
+    Telegram only posts to HTTPS URLs. With a certificate and key the
+    receiver terminates TLS itself; without them it serves plain HTTP and
+    must sit behind a TLS-terminating reverse proxy.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        webhook_url: str,
+        workers: int,
+        listen_host: str = "0.0.0.0",
+        listen_port: int = 8443,
+        secret_token: Optional[str] = None,
+        cert_file: Optional[str] = None,
+        key_file: Optional[str] = None,
+    ):
+        """Initialize the supervisor
+
+        Args:
+            token: Bot token
+            webhook_url: Public URL Telegram posts updates to
+            workers: Number of worker processes
+            listen_host: Interface the webhook receiver binds to
+            listen_port: Port the webhook receiver binds to
+            secret_token: Value Telegram sends in X-Telegram-Bot-Api-Secret-Token
+            cert_file: PEM certificate chain to serve HTTPS with (optional)
+            key_file: PEM private key of the certificate (defaults to cert_file)
+        """
+        self.token = token
+        self.webhook_url = webhook_url
+        self.worker_count = workers
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.secret_token = secret_token
+        self.cert_file = cert_file
+        self.key_file = key_file
+        # Spawned workers do not inherit the receiver's threads and sockets
+        self._context = multiprocessing.get_context("spawn")
+        self._queues: List[multiprocessing.Queue] = []
+        self._processes: List[multiprocessing.Process] = []
+        self._routing_lock = threading.Lock()
+        # Set while workers are replaced; updates are refused so Telegram resends them later
+        self._rebalancing = threading.Event()
+        # Held while worker processes are started or stopped, so the monitor never races a restart
+        self._workers_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @staticmethod
+    def shard_for(user_id: int, worker_count: int) -> int:
+        """Pick the worker of a user with rendezvous (highest random weight) hashing
+
+        When the worker count changes only about 1/N of the users move.
+
+        Args:
+            user_id: Telegram user ID
+            worker_count: Number of workers
+
+        Returns:
+            Worker slot number
+        """
+        best_slot = 0
+        best_weight = b""
+        for slot in range(worker_count):
+            weight = hashlib.blake2b(f"{slot}:{user_id}".encode(), digest_size=8).digest()
+            if weight > best_weight:
+                best_slot, best_weight = slot, weight
+        return best_slot
+
+    def route(self, update_data: Dict) -> bool:
+        """Hand an update to the worker that owns its user
+
+        Args:
+            update_data: Update as sent by Telegram
+
+        Returns:
+            True if the update was queued, False while workers are rebalanced
+        """
+        user_id = get_update_user_id(update_data)
+        with self._routing_lock:
+            if self._rebalancing.is_set():
+                return False
+            self._queues[self.shard_for(user_id, self.worker_count)].put(update_data)
+        return True
+
+    def _start_worker(self, slot: int):
+        process = self._context.Process(
+            target=worker_main,
+            args=(slot, self._queues[slot]),
+            name=f"bot-worker-{slot}",
+        )
+        process.start()
+        self._processes[slot] = process
+
+    def _stop_worker(self, slot: int):
+        # The sentinel is queued behind pending updates, so those are handled first
+        self._queues[slot].put(None)
+        process = self._processes[slot]
+        process.join(WORKER_STOP_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+    def start_workers(self):
+        """Start all worker processes with one queue each"""
+        self._queues = [self._context.Queue() for _ in range(self.worker_count)]
+        self._processes = [None] * self.worker_count
+        for slot in range(self.worker_count):
+            self._start_worker(slot)
+
+    def stop_workers(self):
+        """Stop all workers after they handled their queued updates"""
+        for slot in range(len(self._processes)):
+            self._stop_worker(slot)
+
+    def restart_workers(self):
+        """Restart workers one at a time; updates keep queueing for the restarting worker"""
+        for slot in range(self.worker_count):
+            with self._workers_lock:
+                self._stop_worker(slot)
+                self._start_worker(slot)
+
+    def rebalance(self, worker_count: int):
+        """Change the number of workers
+
+        Routing is paused, every worker drains its queue and stops, and
+        the new set of workers starts before routing resumes, so a user is
+        never handled by two processes at once. Updates arriving meanwhile
+        are answered with 503 right away (Telegram resends them) instead of
+        waiting for the workers to stop. In-memory conversation state of
+        users that move to another worker is lost.
+
+        Args:
+            worker_count: New number of workers
+        """
+        with self._routing_lock:
+            # Every update routed before this point is already in a worker's queue
+            self._rebalancing.set()
+        try:
+            with self._workers_lock:
+                self.stop_workers()
+                self.worker_count = worker_count
+                self.start_workers()
+        finally:
+            self._rebalancing.clear()
+
+    def monitor_workers(self, interval: float = 1.0):
+        """Restart crashed workers until the supervisor stops
+
+        Args:
+            interval: Seconds between liveness checks
+        """
+        while not self._stopping.wait(interval):
+            with self._workers_lock:
+                for slot, process in enumerate(self._processes):
+                    if process is not None and not process.is_alive():
+                        print(f"Worker {slot} exited with code {process.exitcode}, restarting")
+                        self._start_worker(slot)
+
+    def set_webhook(self):
+        """Register the webhook URL with Telegram"""
+        params = {"url": self.webhook_url, "max_connections": 100}
+        if self.secret_token:
+            params["secret_token"] = self.secret_token
+        request = urllib.request.Request(
+            f"https://api.telegram.org/bot{self.token}/setWebhook",
+            data=json.dumps(params).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=30) as response:
+            result = json.loads(response.read())
+        if not result.get("ok"):
+            raise RuntimeError(f"setWebhook failed: {result}")
+
+    def _make_request_handler(self):
+        supervisor = self
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            timeout = REQUEST_TIMEOUT
+
+            def do_POST(self):
+                if supervisor.secret_token and (
+                    self.headers.get("X-Telegram-Bot-Api-Secret-Token") != supervisor.secret_token
+                ):
+                    self.send_response(403)
+                    self.end_headers()
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    update_data = json.loads(self.rfile.read(length))
+                except ValueError:
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                if not supervisor.route(update_data):
+                    self.send_response(503)
+                    self.send_header("Retry-After", str(REBALANCE_RETRY_AFTER))
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                # Every update is a request; don't log them one by one
+                pass
+
+        return WebhookHandler
+
+    def _make_ssl_context(self) -> Optional[ssl.SSLContext]:
+        if not self.cert_file:
+            print("No WEBHOOK_CERT_FILE set, serving plain HTTP for a TLS-terminating proxy")
+            return None
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.load_cert_chain(self.cert_file, self.key_file or None)
+        return context
+
+    def _handle_reload(self, signum, frame):
+        # Run outside the signal handler so the receiver keeps serving
+        def reload():
+            from dotenv import load_dotenv
+
+            load_dotenv(override=True)
+            worker_count = int(os.environ.get("SUPERVISOR_WORKERS", self.worker_count))
+            if worker_count != self.worker_count:
+                print(f"Rebalancing from {self.worker_count} to {worker_count} workers")
+                self.rebalance(worker_count)
+            else:
+                print("Restarting workers")
+                self.restart_workers()
+
+        threading.Thread(target=reload, name="supervisor-reload", daemon=True).start()
+
+    def _handle_stop(self, signum, frame):
+        self._stopping.set()
+        threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def run(self):
+        """Start the workers, register the webhook and serve until stopped"""
+        self.start_workers()
+        self.set_webhook()
+
+        self._server = ThreadingHTTPServer((self.listen_host, self.listen_port), self._make_request_handler())
+        ssl_context = self._make_ssl_context()
+        if ssl_context is not None:
+            # The handshake runs on the request thread, so a slow client can't stall accepting
+            self._server.socket = ssl_context.wrap_socket(
+                self._server.socket, server_side=True, do_handshake_on_connect=False
+            )
+        monitor = threading.Thread(target=self.monitor_workers, name="supervisor-monitor", daemon=True)
+        monitor.start()
+
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+
+        started = time.monotonic()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._stopping.set()
+            monitor.join()
+            with self._routing_lock, self._workers_lock:
+                self.stop_workers()
+            print(f"Supervisor stopped after {time.monotonic() - started:.0f}s")
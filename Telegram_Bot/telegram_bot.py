@@ -5,19 +5,20 @@ from telegram.ext import (
     CallbackContext,
     ApplicationBuilder,
     ContextTypes,
+    TypeHandler,
 )
+import asyncio
+import os
+import sys
 from os import environ
 from dotenv import load_dotenv
-from handlers import (
-    new_cuisine,
-    add_item,
-    edit_recipe,
-    eco_cuisine,
-    select_food,
-    new_refrigerator,
-    text_handler,
-    add_ingredient,
-)
+
+# Add the DBs folder to the path; the handlers (and their databases) are only imported where the bot runs
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "DBs"))
+from backup_service import BackupService
+from intake import IntakeUpdateProcessor
+from supervisor import Supervisor
+from traffic import TrafficRecorder
 
 # Load environment variables from .env file
 load_dotenv()
@@ -28,22 +29,169 @@ if not bot_token:
     raise ValueError("TELEGRAM_BOT_TOKEN environment variable is not set!")
 
 
-new_app = ApplicationBuilder().token(bot_token).build()
+def build_application(with_updater: bool = True, request=None):
+    """Build the bot application with all handlers registered
+
+    Args:
+        with_updater: False for supervisor workers, which get updates from the supervisor
+        request: Request backend for Bot API calls (the replay tool passes a local stub)
+
+    Returns:
+        The configured application
+    """
+    # Imported here so the supervisor process never opens the user databases
+    from handlers import (
+        new_cuisine,
+        add_item,
+        edit_recipe,
+        eco_cuisine,
+        select_food,
+        new_refrigerator,
+        text_handler,
+        add_ingredient,
+        export_data,
+        import_data,
+        recipes,
+        meal_plan,
+        similar,
+        share_cuisines,
+        document_handler,
+        similar_cuisines,
+    )
+
+    # Number of updates handled at the same time
+    update_workers = int(environ.get("UPDATE_WORKERS", "1"))
+
+    # Bounded intake queue with priorities and load shedding in front of the handlers
+    intake = IntakeUpdateProcessor(
+        workers=update_workers,
+        max_depth=int(environ.get("INTAKE_MAX_DEPTH", "1000")),
+        stale_seconds=float(environ.get("STALE_UPDATE_SECONDS", "300")),
+    )
+    intake_metrics_interval = float(environ.get("INTAKE_METRICS_INTERVAL_SECONDS", "60"))
+    # Signature updates of similar cuisines are written in batches off the request path
+    similar_flush_interval = float(environ.get("SIMILAR_CUISINES_FLUSH_SECONDS", "5"))
+
+    async def report_intake_metrics():
+        while True:
+            await asyncio.sleep(intake_metrics_interval)
+            print(intake.format_metrics())
+
+    metrics_task = None
+
+    async def post_init(application) -> None:
+        nonlocal metrics_task
+        similar_cuisines.start(similar_flush_interval)
+        if intake_metrics_interval > 0:
+            # post_init runs before the application starts, so the task is owned and cancelled here
+            metrics_task = asyncio.create_task(report_intake_metrics())
+
+    # Optional capture of incoming messages for offline replay (see traffic.py)
+    recorder = None
+    traffic_record_file = environ.get("TRAFFIC_RECORD_FILE")
+    if traffic_record_file and request is None:
+        recorder = TrafficRecorder(traffic_record_file, environ.get("TRAFFIC_RECORD_SALT"))
+
+    async def post_shutdown(application) -> None:
+        if metrics_task is not None:
+            metrics_task.cancel()
+            try:
+                await metrics_task
+            except asyncio.CancelledError:
+                pass
+        await asyncio.to_thread(similar_cuisines.stop)
+        if recorder is not None:
+            recorder.close()
+
+    app_builder = (
+        ApplicationBuilder()
+        .token(bot_token)
+        .concurrent_updates(intake)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if not with_updater:
+        app_builder = app_builder.updater(None)
+    if request is not None:
+        app_builder = app_builder.request(request)
+    new_app = app_builder.build()
+
+    if recorder is not None:
+        new_app.add_handler(TypeHandler(Update, recorder.record), group=-1)
+
+    # Define command handlers
+    new_app.add_handler(CommandHandler("newcuisine", new_cuisine))
+    new_app.add_handler(CommandHandler("newrefrigerator", new_refrigerator))
+    new_app.add_handler(CommandHandler("additem", add_item))
+    new_app.add_handler(CommandHandler("addingredient", add_ingredient))
+    new_app.add_handler(CommandHandler("editrecipe", edit_recipe))
+    new_app.add_handler(CommandHandler("ecocuisine", eco_cuisine))
+    new_app.add_handler(CommandHandler("selectfood", select_food))
+    new_app.add_handler(CommandHandler("recipes", recipes))
+    new_app.add_handler(CommandHandler("mealplan", meal_plan))
+    new_app.add_handler(CommandHandler("similar", similar))
+    new_app.add_handler(CommandHandler("sharecuisines", share_cuisines))
+    new_app.add_handler(CommandHandler("export", export_data))
+    new_app.add_handler(CommandHandler("import", import_data))
+
+    # Add text message handler for cuisine creation
+    new_app.add_handler(text_handler)
+    # Add document handler for data import
+    new_app.add_handler(document_handler)
+
+    return new_app
+
+
+def start_backup_service():
+    """Start periodic online backups if configured"""
+    backup_interval = environ.get("BACKUP_INTERVAL_MINUTES")
+    if backup_interval:
+        backup_service = BackupService(backup_folder=environ.get("BACKUP_FOLDER", "backups"))
+        backup_service.start(float(backup_interval) * 60)
+
+
+def start_cold_storage(cold_storage=None):
+    """Start periodic archival of inactive users if configured
+
+    Args:
+        cold_storage: ColdStorage to run the archival on (defaults to the handlers' one)
+    """
+    archive_idle_days = environ.get("ARCHIVE_IDLE_DAYS")
+    if archive_idle_days:
+        if cold_storage is None:
+            from handlers import cold_storage
+        cold_storage.start(
+            float(environ.get("ARCHIVE_INTERVAL_HOURS", "24")) * 3600,
+            float(archive_idle_days) * 86400,
+        )
+
+
+if __name__ == "__main__":
+    start_backup_service()
 
-# Define command handlers
-new_app.add_handler(CommandHandler("newcuisine", new_cuisine))
-new_app.add_handler(CommandHandler("newrefrigerator", new_refrigerator))
-new_app.add_handler(CommandHandler("additem", add_item))
-new_app.add_handler(CommandHandler("addingredient", add_ingredient))
-new_app.add_handler(CommandHandler("editrecipe", edit_recipe))
-new_app.add_handler(CommandHandler("ecocuisine", eco_cuisine))
-new_app.add_handler(CommandHandler("selectfood", select_food))
+    supervisor_workers = environ.get("SUPERVISOR_WORKERS")
+    if supervisor_workers:
+        from cold_storage import ColdStorage
+        from user_registry import UserRegistry
 
-# Add text message handler for cuisine creation
-new_app.add_handler(text_handler)
+        # The workers record activity in the registry; the archiver reads it from there
+        start_cold_storage(ColdStorage(registry=UserRegistry()))
 
-# Start the bot
-new_app.run_polling()
+        # Webhook receiver routing every user to a fixed worker process
+        print(f"Supervisor starting {supervisor_workers} workers... Press Ctrl+C to stop.")
+        Supervisor(
+            token=bot_token,
+            webhook_url=environ["WEBHOOK_URL"],
+            workers=int(supervisor_workers),
+            listen_host=environ.get("WEBHOOK_LISTEN_HOST", "0.0.0.0"),
+            listen_port=int(environ.get("WEBHOOK_LISTEN_PORT", "8443")),
+            secret_token=environ.get("WEBHOOK_SECRET_TOKEN"),
+            cert_file=environ.get("WEBHOOK_CERT_FILE") or None,
+            key_file=environ.get("WEBHOOK_KEY_FILE") or None,
+        ).run()
+    else:
+        start_cold_storage()
 
-# print("Bot is running...")
-print("Bot is running... Press Ctrl+C to stop.")
+        # Start the bot
+        print("Bot is running... Press Ctrl+C to stop.")
+        build_application().run_polling()
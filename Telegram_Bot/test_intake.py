@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+from telegram import Update
+
+from intake import IntakeUpdateProcessor
+
+
+def make_update(update_id: int, user_id: int, text: str, age: float = 0.0) -> Update:
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time() - age),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+                "text": text,
+            },
+        },
+        None,
+    )
+
+
+async def run_updates(processor, updates):
+    """Feed updates while the only worker is busy, return the order they were handled in"""
+    handled = []
+    gate = asyncio.Event()
+
+    async def handle(update):
+        if update.update_id == 0:
+            await gate.wait()
+        handled.append((update.effective_user.id, update.message.text))
+
+    blocking_update = make_update(0, 0, "/block")
+    blocker = asyncio.create_task(processor.process_update(blocking_update, handle(blocking_update)))
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(processor.process_update(update, handle(update))) for update in updates]
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(blocker, *tasks)
+    return handled[1:]
+
+
+def test_commands_first_but_users_keep_their_order():
+    processor = IntakeUpdateProcessor(workers=1)
+    updates = [
+        make_update(1, 1, "text a"),
+        make_update(2, 1, "/cmd b"),
+        make_update(3, 2, "text c"),
+        make_update(4, 3, "/cmd d"),
+    ]
+
+    handled = asyncio.run(run_updates(processor, updates))
+
+    # User 3's command jumps ahead; user 1's command waits for their earlier text,
+    # then goes before user 2's text
+    assert handled == [(3, "/cmd d"), (1, "text a"), (1, "/cmd b"), (2, "text c")]
+    assert processor.metrics["processed"] == 5
+
+
+def test_updates_of_one_user_never_overlap():
+    processor = IntakeUpdateProcessor(workers=4)
+    running = {}
+    overlaps = []
+    handled = []
+
+    async def handle(update):
+        user_id = update.effective_user.id
+        running[user_id] = running.get(user_id, 0) + 1
+        if running[user_id] > 1:
+            overlaps.append(user_id)
+        await asyncio.sleep(0.001)
+        handled.append((user_id, update.message.text))
+        running[user_id] -= 1
+
+    async def main():
+        updates = [
+            make_update(index, user_id, f"/cmd{step}" if step % 2 else f"text{step}")
+            for index, (step, user_id) in enumerate(
+                ((step, user_id) for step in range(5) for user_id in (1, 2, 3)), start=1
+            )
+        ]
+        await asyncio.gather(*[processor.process_update(update, handle(update)) for update in updates])
+
+    asyncio.run(main())
+
+    assert overlaps == []
+    for user_id in (1, 2, 3):
+        texts = [text for handled_user, text in handled if handled_user == user_id]
+        assert texts == ["text0", "/cmd1", "text2", "/cmd3", "text4"]
+
+
+def test_overflow_sheds_the_oldest_free_text():
+    processor = IntakeUpdateProcessor(workers=1, max_depth=2)
+    updates = [
+        make_update(1, 1, "text a"),
+        make_update(2, 2, "text b"),
+        make_update(3, 3, "/cmd c"),
+    ]
+
+    handled = asyncio.run(run_updates(processor, updates))
+
+    assert handled == [(3, "/cmd c"), (2, "text b")]
+    assert processor.metrics["shed_overflow"] == 1
+
+
+def test_stale_updates_are_not_handled():
+    processor = IntakeUpdateProcessor(workers=1, stale_seconds=60)
+    updates = [
+        make_update(1, 1, "/old", age=120),
+        make_update(2, 2, "text fresh"),
+    ]
+
+    handled = asyncio.run(run_updates(processor, updates))
+
+    assert handled == [(2, "text fresh")]
+    assert processor.metrics["shed_stale"] == 1
@@ -0,0 +1,110 @@
+import os
+import sys
+
+import pytest
+
+# The listeners under test live in the DBs folder, like for the handlers
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "DBs"))
+from cuisine_db import CuisineDB
+from refrigerator_db import RefrigeratorDB
+from reply_rendering import MessageTemplate, ReplyCache, render_listing, split_message
+
+
+@pytest.fixture
+def databases(tmp_path):
+    reply_cache = ReplyCache()
+    fridge_db = RefrigeratorDB(str(tmp_path))
+    cuisine_db = CuisineDB(str(tmp_path))
+    fridge_db.add_change_listener(reply_cache.invalidate)
+    cuisine_db.add_change_listener(reply_cache.invalidate)
+    fridge_db.create_user_refrigerator(1)
+    cuisine_db.create_cuisine_index_database(1)
+    return reply_cache, fridge_db, cuisine_db
+
+
+def list_fridge(reply_cache, fridge_db, user_id=1):
+    def render():
+        lines = [f"{item.item_name}: {item.quantity}" for item in fridge_db.get_refrigerator_items(user_id)]
+        return render_listing("Fridge:\n", lines)
+
+    return reply_cache.get_or_render(user_id, "refrigerator", render)
+
+
+def test_repeated_listing_is_served_from_cache(databases):
+    reply_cache, fridge_db, _ = databases
+    fridge_db.add_item_to_refrigerator(1, "egg", 2)
+
+    first = list_fridge(reply_cache, fridge_db)
+    second = list_fridge(reply_cache, fridge_db)
+
+    assert first == second == ["Fridge:\negg: 2\n"]
+    assert (reply_cache.hits, reply_cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda fridge_db, cuisine_db: fridge_db.add_item_to_refrigerator(1, "milk", 1, "l"),
+        lambda fridge_db, cuisine_db: fridge_db.consume_items(1, [("egg", 1, "pieces")]),
+        lambda fridge_db, cuisine_db: fridge_db.remove_item_from_refrigerator(1, 1),
+        lambda fridge_db, cuisine_db: cuisine_db.create_specific_cuisine_database(1, "Omelette"),
+    ],
+    ids=["add", "consume", "remove", "new cuisine"],
+)
+def test_changes_invalidate_the_listing(databases, change):
+    reply_cache, fridge_db, cuisine_db = databases
+    fridge_db.add_item_to_refrigerator(1, "egg", 2)
+    list_fridge(reply_cache, fridge_db)
+    version = reply_cache.get_version(1)
+
+    change(fridge_db, cuisine_db)
+
+    assert reply_cache.get_version(1) > version
+    list_fridge(reply_cache, fridge_db)
+    assert reply_cache.misses == 2
+
+
+def test_other_users_stay_cached(databases):
+    reply_cache, fridge_db, _ = databases
+    fridge_db.create_user_refrigerator(2)
+    list_fridge(reply_cache, fridge_db, user_id=2)
+
+    fridge_db.add_item_to_refrigerator(1, "egg", 2)
+    list_fridge(reply_cache, fridge_db, user_id=2)
+
+    assert (reply_cache.hits, reply_cache.misses) == (1, 1)
+
+
+def test_variants_expiry_and_eviction():
+    reply_cache = ReplyCache(max_entries=2, max_age=0)
+    renders = []
+
+    def render(text):
+        renders.append(text)
+        return text
+
+    reply_cache.get_or_render(1, "listing", lambda: render("a"), variant="Ann")
+    reply_cache.get_or_render(1, "listing", lambda: render("b"), variant="Bob")
+    reply_cache.get_or_render(1, "listing", lambda: render("a"), variant="Ann")
+    assert renders == ["a", "b", "a"]
+
+    reply_cache.max_age = 3600
+    for user_id in (1, 2, 3):
+        reply_cache.get_or_render(user_id, "listing", lambda: render("c"))
+    assert len(reply_cache._entries) == 2
+
+
+def test_split_message_respects_the_limit():
+    text = "\n".join(f"line {index}" for index in range(100)) + "\n" + "x" * 25
+
+    chunks = split_message(text, limit=20)
+
+    assert all(len(chunk) <= 20 for chunk in chunks)
+    assert "".join(chunks).replace("\n", "") == text.replace("\n", "")
+    assert split_message("short") == ["short"]
+
+
+def test_template_rejects_positional_placeholders():
+    assert MessageTemplate("Hi {name}!").render(name="Ann") == "Hi Ann!"
+    with pytest.raises(ValueError):
+        MessageTemplate("Hi {}!")
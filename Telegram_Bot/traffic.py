@@ -0,0 +1,352 @@
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import statistics
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes
+from telegram.request import BaseRequest, RequestData
+
+
+# Records are flushed to disk at least this often (seconds)
+FLUSH_INTERVAL = 1.0
+
+
+class TrafficRecorder:
+    """Opt-in recorder of incoming messages for offline replay
+
+    Registered as a handler that sees every update before the real
+    handlers. Each message is appended as one JSON line to a gzip file
+    with its arrival time, an anonymized user ID, the command and the
+    text. Documents are recorded by file name only.
+    """
+
+    def __init__(self, path: str, salt: Optional[str] = None):
+        """Initialize the recorder
+
+        Args:
+            path: Capture file; ``{pid}`` is replaced by the process ID (one file per supervisor worker)
+            salt: Secret used to anonymize user IDs (random per process when omitted,
+                so captures from different processes only share users if a salt is set)
+        """
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self._salt = (salt or os.urandom(16).hex()).encode("utf-8")
+        self._lock = threading.Lock()
+        self._file = gzip.open(self.path, "at", encoding="utf-8")
+        self._last_flush = time.monotonic()
+        self.recorded = 0
+
+    def anonymize(self, user_id: int) -> int:
+        """Map a user ID to a stable pseudonymous ID
+
+        Args:
+            user_id: Telegram user ID
+
+        Returns:
+            48-bit keyed hash of the ID
+        """
+        digest = hmac.new(self._salt, str(user_id).encode("utf-8"), hashlib.sha256).digest()
+        return int.from_bytes(digest[:6], "big")
+
+    @staticmethod
+    def to_record(update: Update, user_id: int) -> Optional[Dict]:
+        """Build the capture record of an update
+
+        Args:
+            update: Incoming update
+            user_id: Anonymized user ID
+
+        Returns:
+            Record dictionary, or None for updates without a message
+        """
+        message = update.message
+        if message is None:
+            return None
+        record = {"ts": time.time(), "user": user_id, "command": None, "text": message.text}
+        if message.text and message.text.startswith("/"):
+            record["command"] = message.text.split()[0].split("@")[0]
+        if message.document is not None:
+            record["document"] = message.document.file_name
+        return record
+
+    async def record(self, update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handler callback appending an update to the capture file"""
+        if not isinstance(update, Update) or update.effective_user is None:
+            return
+        record = self.to_record(update, self.anonymize(update.effective_user.id))
+        if record is None:
+            return
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.recorded += 1
+            if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+                # Sync flush: everything written so far is readable even after a crash
+                self._file.flush()
+                self._last_flush = time.monotonic()
+
+    def close(self):
+        """Flush and close the capture file"""
+        with self._lock:
+            self._file.close()
+
+
+def load_capture(paths: List[str]) -> List[Dict]:
+    """Read capture files into one list ordered by arrival time
+
+    A capture cut short by a crash is read up to its last complete record.
+
+    Args:
+        paths: Capture files (e.g. one per supervisor worker)
+
+    Returns:
+        List of records
+    """
+    records = []
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as capture_file:
+            try:
+                for line in capture_file:
+                    line = line.strip()
+                    if line:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            # Last line of an interrupted capture
+                            break
+            except (EOFError, zlib.error):
+                pass
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+class StubRequest(BaseRequest):
+    """Request backend that answers every Bot API call locally
+
+    Replies are counted instead of sent, so the handlers run unchanged
+    without network access.
+    """
+
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self._message_id = 0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        """Nothing to set up"""
+
+    async def shutdown(self) -> None:
+        """Nothing to tear down"""
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        """Answer a Bot API call with a minimal successful result"""
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        parameters = request_data.parameters if request_data is not None else {}
+
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Replay", "username": "replay_bot"}
+        elif endpoint.startswith("send"):
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(parameters.get("chat_id", 0)), "type": "private"},
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+def build_update(update_id: int, record: Dict) -> Dict:
+    """Build the raw update JSON of a recorded message, dated now
+
+    Args:
+        update_id: Update sequence number
+        record: Capture record
+
+    Returns:
+        Update dictionary as Telegram would send it
+    """
+    text = record.get("text") or ""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": record["user"], "type": "private"},
+        "from": {"id": record["user"], "is_bot": False, "first_name": "Replay"},
+        "text": text,
+    }
+    if record.get("command"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Get a percentile of a list of values (nearest rank)
+
+    Args:
+        values: Values to summarize
+        fraction: Percentile between 0 and 1
+
+    Returns:
+        The value at that rank, or 0 for an empty list
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+async def replay(records: List[Dict], speed: float = 1.0) -> Dict:
+    """Feed recorded messages through the bot's handlers and time them
+
+    Must run in a fresh working directory: the handlers module creates its
+    databases relative to it on import.
+
+    Args:
+        records: Capture records ordered by arrival time
+        speed: Time acceleration (1 = original pacing, 10 = ten times faster,
+            0 = dispatch everything at once)
+
+    Returns:
+        Dictionary with overall and per-command latency statistics
+    """
+    from telegram_bot import build_application
+
+    stub = StubRequest()
+    application = build_application(with_updater=False, request=stub)
+    errors = []
+
+    async def count_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+        errors.append(repr(context.error))
+
+    application.add_error_handler(count_error)
+
+    latencies: Dict[str, List[float]] = {}
+    skipped = 0
+
+    async def dispatch(update_id: int, record: Dict):
+        update = Update.de_json(build_update(update_id, record), application.bot)
+        started = time.perf_counter()
+        # Same path as updates fetched by the application, including the intake queue
+        await application.update_processor.process_update(update, application.process_update(update))
+        latencies.setdefault(record.get("command") or "text", []).append(time.perf_counter() - started)
+
+    async with application:
+        tasks = []
+        replay_started = time.monotonic()
+        first_ts = records[0]["ts"] if records else 0.0
+        for update_id, record in enumerate(records, start=1):
+            if "document" in record:
+                # Document contents are not captured
+                skipped += 1
+                continue
+            if speed > 0:
+                delay = (record["ts"] - first_ts) / speed - (time.monotonic() - replay_started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(dispatch(update_id, record)))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - replay_started
+
+    all_latencies = [latency for values in latencies.values() for latency in values]
+
+    def summarize(values: List[float]) -> Dict:
+        return {
+            "count": len(values),
+            "mean_ms": statistics.fmean(values) * 1000 if values else 0.0,
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p90_ms": percentile(values, 0.90) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "max_ms": max(values) * 1000 if values else 0.0,
+        }
+
+    return {
+        "updates": len(all_latencies),
+        "skipped": skipped,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "elapsed_seconds": elapsed,
+        "throughput": len(all_latencies) / elapsed if elapsed else 0.0,
+        "api_calls": stub.calls,
+        "overall": summarize(all_latencies),
+        "commands": {command: summarize(values) for command, values in sorted(latencies.items())},
+    }
+
+
+def format_report(result: Dict) -> str:
+    """Format a replay result as a table
+
+    Args:
+        result: Result of ``replay``
+
+    Returns:
+        Multi-line report
+    """
+    lines = [
+        f"Replayed {result['updates']} updates in {result['elapsed_seconds']:.2f}s "
+        f"({result['throughput']:.1f}/s), {result['skipped']} skipped, {result['errors']} errors",
+        f"{'command':<16}{'count':>8}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}",
+    ]
+    rows = list(result["commands"].items()) + [("ALL", result["overall"])]
+    for command, stats in rows:
+        lines.append(
+            f"{command:<16}{stats['count']:>8}{stats['mean_ms']:>9.1f}ms{stats['p50_ms']:>8.1f}ms"
+            f"{stats['p90_ms']:>8.1f}ms{stats['p99_ms']:>8.1f}ms{stats['max_ms']:>8.1f}ms"
+        )
+    for error in result["error_samples"]:
+        lines.append(f"error: {error}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    import shutil
+    import sys
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Replay captured traffic against fresh local databases")
+    parser.add_argument("captures", nargs="+", help="capture files written by TrafficRecorder")
+    parser.add_argument("--speed", type=float, default=1.0, help="time acceleration (0 = no pauses)")
+    parser.add_argument("--workdir", help="directory for the fresh databases (a temporary one by default)")
+    parser.add_argument("--recipes", help="recipes.db to copy into the working directory")
+    parser.add_argument("--json", help="also write the full result to this JSON file")
+    arguments = parser.parse_args()
+
+    capture_records = load_capture([os.path.abspath(path) for path in arguments.captures])
+    json_path = os.path.abspath(arguments.json) if arguments.json else None
+    workdir = arguments.workdir or tempfile.mkdtemp(prefix="replay_")
+    os.makedirs(workdir, exist_ok=True)
+    if arguments.recipes:
+        shutil.copy(arguments.recipes, os.path.join(workdir, "recipes.db"))
+
+    # The handlers create user_databases, recipes.db, ... relative to the working directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:replay"
+    os.environ["INTAKE_METRICS_INTERVAL_SECONDS"] = "0"
+
+    replay_result = asyncio.run(replay(capture_records, arguments.speed))
+    print(f"Databases in {workdir}")
+    print(format_report(replay_result))
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as json_file:
+            json.dump(replay_result, json_file, indent=2)